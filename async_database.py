@@ -0,0 +1,157 @@
+"""
+Async Database Handler for Rental Management System
+asyncio facade over DatabaseHandler for scripts and headless services
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+from database import DatabaseHandler
+
+# DatabaseHandler methods exposed as coroutines with the same name and arguments
+ASYNC_METHODS = (
+    # Products
+    'add_product', 'get_all_products', 'get_product_by_id', 'update_product', 'delete_product',
+    # Renters
+    'add_renter', 'get_all_renters', 'get_renter_by_id', 'update_renter', 'delete_renter',
+    'search_renters', 'search',
+    # Rentals
+    'add_rental', 'add_rentals_bulk', 'get_all_rentals', 'get_rentals_with_financials', 'count_rentals',
+    'get_active_rentals', 'get_rental_by_id', 'update_rental_status',
+    'update_rental_payment_status', 'delete_rental',
+    # Import
+    'import_renters', 'import_products', 'import_rentals',
+    # Payments
+    'get_payments_by_rental', 'get_unpaid_payments', 'get_unpaid_rentals_with_totals',
+    'mark_payment_paid', 'mark_payment_unpaid', 'mark_period_paid', 'update_tenant_payment_status',
+    # Pages
+    'get_rentals_page', 'get_renters_page', 'get_unpaid_payments_page',
+    'get_payments_by_rental_page',
+    # Reports and statistics
+    'get_total_unpaid_amount', 'get_tenant_totals', 'get_rental_financial_summary',
+    'get_total_income', 'get_income_by_rental', 'get_dashboard_stats',
+    'verify_stats_counters', 'rebuild_stats_counters', 'rebuild_search_index', 'save_all',
+    # Archive
+    'archive_closed_rentals', 'get_rental_history', 'get_income_history',
+)
+
+
+def _awaitable(name: str):
+    """Coroutine method running DatabaseHandler.<name> in the executor"""
+    method = getattr(DatabaseHandler, name)
+
+    @functools.wraps(method)
+    async def call(self, *args, **kwargs):
+        return await self.run(getattr(self.db, name), *args, **kwargs)
+    return call
+
+
+class AsyncDatabaseHandler:
+    """Awaitable versions of the DatabaseHandler methods.
+
+    Calls run on a bounded thread pool, so the event loop is never blocked by SQLite;
+    each worker thread reads through its own pooled connection and writes are
+    serialised by the handler. At most max_pending calls are submitted at once:
+    further callers wait on a semaphore in the event loop (backpressure) instead of
+    piling up in the executor queue. Independent reports can be awaited together:
+
+        async with AsyncDatabaseHandler("rental_management.db") as db:
+            stats, totals = await asyncio.gather(db.get_dashboard_stats(),
+                                                 db.get_tenant_totals())
+    """
+
+    def __init__(self, db_name: str = "rental_management.db", profile: str = None,
+                 max_workers: int = 4, max_pending: int = None,
+                 db: Optional[DatabaseHandler] = None):
+        """Open (or wrap) a DatabaseHandler; max_pending defaults to 4 calls per worker"""
+        if max_workers < 1:
+            raise ValueError("max_workers doit être au moins 1")
+        self.db = db or DatabaseHandler(db_name, profile=profile)
+        self._owns_db = db is None
+        self.max_workers = max_workers
+        self.max_pending = max_pending or max_workers * 4
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="rental-db")
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self.pending = 0
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run func(*args, **kwargs) in the executor once a slot is free"""
+        async with self._slots:
+            self.pending += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor,
+                                                  functools.partial(func, *args, **kwargs))
+            finally:
+                self.pending -= 1
+
+    async def get_reports(self) -> Dict:
+        """Dashboard statistics, tenant totals, unpaid total and income, fetched concurrently"""
+        stats, tenant_totals, unpaid, income = await asyncio.gather(
+            self.get_dashboard_stats(), self.get_tenant_totals(),
+            self.get_total_unpaid_amount(), self.get_total_income()
+        )
+        return {'stats': stats, 'tenant_totals': tenant_totals,
+                'total_unpaid': unpaid, 'total_income': income}
+
+    async def _iter_pages(self, get_page: Callable, *args, batch_size: int = 500) -> AsyncIterator[Dict]:
+        """Yield every row of a keyset-paginated listing, one page per executor call"""
+        after = None
+        while True:
+            rows, after = await self.run(get_page, *args, after=after, limit=batch_size)
+            for row in rows:
+                yield row
+            if after is None:
+                return
+
+    async def _iter_batches(self, rows: Iterator[Dict], batch_size: int = 500) -> AsyncIterator[Dict]:
+        """Yield the rows of a synchronous stream, batch_size rows per executor call"""
+        while True:
+            batch = await self.run(lambda: list(islice(rows, batch_size)))
+            if not batch:
+                return
+            for row in batch:
+                yield row
+    
+    def iter_rentals(self, batch_size: int = 500) -> AsyncIterator[Dict]:
+        """Async iteration over every rental, newest first"""
+        return self._iter_pages(self.db.get_rentals_page, batch_size=batch_size)
+
+    def iter_renters(self, batch_size: int = 500) -> AsyncIterator[Dict]:
+        """Async iteration over every renter by name"""
+        return self._iter_pages(self.db.get_renters_page, batch_size=batch_size)
+
+    def iter_unpaid_payments(self, batch_size: int = 500) -> AsyncIterator[Dict]:
+        """Async iteration over every unpaid payment of an active rental (one merged stream)"""
+        return self._iter_batches(self.db.iter_unpaid_payments(batch_size), batch_size)
+
+    def iter_payments_by_rental(self, rental_id: int, batch_size: int = 500) -> AsyncIterator[Dict]:
+        """Async iteration over the payments of a rental by month"""
+        return self._iter_pages(self.db.get_payments_by_rental_page, rental_id,
+                                batch_size=batch_size)
+
+    def iter_payment_schedules(self, batch_size: int = 500) -> AsyncIterator[Dict]:
+        """Async iteration over the payment schedules of every rental, by rental then month"""
+        return self._iter_batches(self.db.iter_payment_schedules(batch_size), batch_size)
+
+    async def close(self):
+        """Wait for running calls, stop the workers and close the database if we opened it"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, functools.partial(self._executor.shutdown, wait=True))
+        if self._owns_db:
+            self.db.close()
+
+    async def __aenter__(self) -> "AsyncDatabaseHandler":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+for _name in ASYNC_METHODS:
+    setattr(AsyncDatabaseHandler, _name, _awaitable(_name))
+del _name
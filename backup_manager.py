@@ -0,0 +1,405 @@
+"""
+Backup Manager for Rental Management System
+Online SQLite backups (full or incremental) with compression and a retention policy
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+BACKUP_PREFIX = "rental_management_backup_"
+BACKUP_PATTERN = re.compile(rf"^{BACKUP_PREFIX}(\d{{8}}_\d{{6}})(?:_\d+)?\.db(?:\.gz)?$")
+SNAPSHOT_PREFIX = "rental_management_snapshot_"
+SNAPSHOT_PATTERN = re.compile(rf"^{SNAPSHOT_PREFIX}(\d{{8}}_\d{{6}})(?:_\d+)?\.json$")
+
+
+def archive_backup_path(backup_path: str) -> str:
+    """Companion file of a full backup holding the archive database (<backup>_archive.db[.gz])"""
+    head, extension, tail = backup_path.rpartition(".db")
+    return f"{head}_archive{extension}{tail}"
+
+
+class BackupManager:
+    """Creates, prunes and restores snapshots of the rental database"""
+
+    def __init__(self, db_name: str, backup_dir: str = "backups", keep_daily: int = 7,
+                 keep_weekly: int = 4, keep_last: int = 10, pages_per_step: int = 256,
+                 compress: bool = True, chunk_size: int = 256 * 1024, archive_name: str = None):
+        """Configure backup location and retention (keep_last snapshots, keep_daily days,
+        keep_weekly weeks). archive_name is the archive database saved and restored
+        with the database, if any"""
+        self.db_name = db_name
+        self.archive_name = archive_name
+        self.backup_dir = backup_dir
+        self.keep_last = keep_last
+        self.keep_daily = keep_daily
+        self.keep_weekly = keep_weekly
+        self.pages_per_step = pages_per_step
+        self.compress = compress
+        self.chunk_size = chunk_size
+        self.snapshot_dir = os.path.join(backup_dir, "snapshots")
+        self.chunk_dir = os.path.join(backup_dir, "chunks")
+
+    def create_backup(self, connection: Optional[sqlite3.Connection] = None,
+                      progress: Optional[Callable[[int, int], None]] = None) -> str:
+        """Copy the live database page by page, compress it and apply retention.
+
+        The archive database, if there is one, is copied next to the snapshot
+        (archive_backup_path). progress(copied_pages, total_pages) is called after each
+        batch of pages. Returns the absolute path of the new snapshot.
+        """
+        os.makedirs(self.backup_dir, exist_ok=True)
+        snapshot_path = self._new_snapshot_path()
+        paths = [snapshot_path]
+        if self._copy_images(snapshot_path, archive_backup_path(snapshot_path), connection, progress):
+            paths.append(archive_backup_path(snapshot_path))
+
+        if self.compress:
+            for path in paths:
+                with open(path, 'rb') as src, gzip.open(path + ".gz", 'wb', compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                os.remove(path)
+            snapshot_path += ".gz"
+
+        self.apply_retention()
+        return os.path.abspath(snapshot_path)
+
+    def has_archive(self) -> bool:
+        """Whether there is an archive database to back up"""
+        return bool(self.archive_name) and os.path.exists(self.archive_name)
+
+    def _copy_images(self, image_path: str, archive_image_path: str,
+                     connection: Optional[sqlite3.Connection] = None,
+                     progress: Optional[Callable[[int, int], None]] = None) -> bool:
+        """Copy the database to image_path, then the archive, if any, to archive_image_path.
+
+        The database is copied first: archiving commits a rental to the archive before
+        deleting it from the database, so a rental archived between the two copies is
+        in both images (and listed once), never in neither. The archive is read through
+        connection when it is attached there as "archive". Returns whether the archive
+        was copied.
+        """
+        copied_total = 0
+
+        def database_progress(copied, total):
+            nonlocal copied_total
+            copied_total = total
+            if progress:
+                progress(copied, total)
+
+        def archive_progress(copied, total):
+            if progress:
+                progress(copied_total + copied, copied_total + total)
+
+        self._copy_database(image_path, connection, database_progress)
+        if not self.has_archive():
+            return False
+        attached = connection is not None and 'archive' in {
+            row[1] for row in connection.execute("PRAGMA database_list")}
+        self._copy_database(archive_image_path, connection if attached else None,
+                            archive_progress, schema='archive')
+        return True
+
+    def _copy_database(self, target_path: str, connection: Optional[sqlite3.Connection] = None,
+                       progress: Optional[Callable[[int, int], None]] = None, schema: str = 'main'):
+        """Copy a consistent image of the database (or of the attached archive with
+        schema='archive') to target_path with the backup API"""
+        def report(status, remaining, total):
+            if progress:
+                progress(total - remaining, total)
+
+        source = connection or sqlite3.connect(self.archive_name if schema == 'archive' else self.db_name)
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target, pages=self.pages_per_step, progress=report,
+                          name=schema if connection else 'main')
+        finally:
+            target.close()
+            if connection is None:
+                source.close()
+
+    def _new_snapshot_path(self) -> str:
+        """Build a unique snapshot file name from the current time"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        base = os.path.join(self.backup_dir, f"{BACKUP_PREFIX}{timestamp}")
+        path = f"{base}.db"
+        suffix = 1
+        while os.path.exists(path) or os.path.exists(path + ".gz"):
+            path = f"{base}_{suffix}.db"
+            suffix += 1
+        return path
+
+    def list_backups(self) -> List[Tuple[datetime, str]]:
+        """List snapshots in the backup folder, newest first"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        backups = []
+        for name in os.listdir(self.backup_dir):
+            match = BACKUP_PATTERN.match(name)
+            if match:
+                taken_at = datetime.strptime(match.group(1), "%Y%m%d_%H%M%S")
+                backups.append((taken_at, os.path.join(self.backup_dir, name)))
+        backups.sort(reverse=True)
+        return backups
+
+    def apply_retention(self) -> List[str]:
+        """Delete snapshots outside the retention policy and return their paths.
+
+        The keep_last newest snapshots are kept, as well as the newest snapshot of
+        each of the last keep_daily days and of each of the last keep_weekly ISO weeks.
+        Only the compressed snapshots this manager writes are pruned: uncompressed .db
+        copies (those of earlier versions, or made with compress=False) are left alone.
+        """
+        backups = [(taken_at, path) for taken_at, path in self.list_backups() if path.endswith(".gz")]
+        keep = self._retained(backups)
+        removed = []
+        for _, path in backups:
+            if path not in keep:
+                os.remove(path)
+                if os.path.exists(archive_backup_path(path)):
+                    os.remove(archive_backup_path(path))
+                removed.append(path)
+        return removed
+
+    def _retained(self, backups: List[Tuple[datetime, str]]) -> set:
+        """Return the paths the retention policy keeps among (taken_at, path), newest first"""
+        keep = set()
+        days, weeks = [], []
+        for taken_at, path in backups:
+            day = taken_at.date()
+            week = taken_at.isocalendar()[:2]
+            if day not in days:
+                days.append(day)
+                if len(days) <= self.keep_daily:
+                    keep.add(path)
+            if week not in weeks:
+                weeks.append(week)
+                if len(weeks) <= self.keep_weekly:
+                    keep.add(path)
+        keep.update(path for _, path in backups[:max(1, self.keep_last)])
+        return keep
+
+    def restore_backup(self, backup_path: str, target_path: Optional[str] = None) -> str:
+        """Restore a snapshot (compressed or not) into target_path (default: the database),
+        and its archive next to it (see _restore_images).
+
+        The database must not be open while it is being restored.
+        """
+        def copier(path):
+            def write(target):
+                opener = gzip.open if path.endswith(".gz") else open
+                with opener(path, 'rb') as src:
+                    shutil.copyfileobj(src, target, 1024 * 1024)
+            return write
+
+        archive_path = archive_backup_path(backup_path)
+        return self._restore_images(target_path, copier(backup_path),
+                                    copier(archive_path) if os.path.exists(archive_path) else None)
+
+    def _restore_images(self, target_path: Optional[str], write: Callable,
+                        write_archive: Optional[Callable]) -> str:
+        """Restore a database image and the archive image of the same snapshot together.
+
+        The archive goes to archive_name, or next to target_path when restoring
+        elsewhere. An archive that did not exist when the snapshot was taken is
+        removed, so the restored database never sits next to newer archived rows.
+        """
+        target_path = target_path or self.db_name
+        images = [(target_path, write)]
+        if self.archive_name:
+            archive_target = self.archive_name
+            if os.path.abspath(target_path) != os.path.abspath(self.db_name):
+                archive_target = os.path.join(os.path.dirname(os.path.abspath(target_path)),
+                                              os.path.basename(self.archive_name))
+            images.append((archive_target, write_archive))
+        elif write_archive:
+            raise ValueError("Sauvegarde avec archive: indiquez archive_name pour la restaurer")
+        return self._replace_databases(images)
+
+    def _replace_databases(self, images: List[Tuple[str, Optional[Callable]]]) -> str:
+        """Write database images with write(file) into temporary files, then swap them in.
+
+        The targets are only replaced once every image is complete, so a failed restore
+        leaves the current files untouched; a target whose write is None is deleted. The
+        WAL and shared-memory files of the old databases are removed afterwards: a stale
+        WAL would be replayed over the image. Returns the path of the first target.
+        """
+        temp_paths = []
+        try:
+            for target_path, write in images:
+                if write is None:
+                    continue
+                temp_paths.append(target_path + ".restore")
+                with open(target_path + ".restore", 'wb') as target:
+                    write(target)
+                    target.flush()
+                    os.fsync(target.fileno())
+        except BaseException:
+            for temp_path in temp_paths:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            raise
+        for target_path, write in images:
+            if write is not None:
+                os.replace(target_path + ".restore", target_path)
+            elif os.path.exists(target_path):
+                os.remove(target_path)
+            for leftover in (target_path + "-wal", target_path + "-shm"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        return os.path.abspath(images[0][0])
+
+    # ==================== INCREMENTAL BACKUPS ====================
+
+    def create_incremental_backup(self, connection: Optional[sqlite3.Connection] = None,
+                                  progress: Optional[Callable[[int, int], None]] = None) -> str:
+        """Snapshot the database storing only the chunks that changed since earlier snapshots.
+
+        The database image is split into chunk_size blocks; each block is stored once,
+        compressed, under its SHA-256 hash in chunks/. The snapshot itself is a JSON
+        manifest listing the block hashes in order, and those of the archive database
+        under 'archive' (None without archive). Returns the manifest path.
+        """
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        os.makedirs(self.chunk_dir, exist_ok=True)
+        image_path = os.path.join(self.backup_dir, ".incremental_image.db")
+        archive_image_path = os.path.join(self.backup_dir, ".incremental_archive.db")
+        for path in (image_path, archive_image_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+        try:
+            has_archive = self._copy_images(image_path, archive_image_path, connection, progress)
+            size, hashes, new_chunks = self._store_image(image_path)
+            archive = None
+            if has_archive:
+                archive_size, archive_hashes, archive_new_chunks = self._store_image(archive_image_path)
+                archive = {'size': archive_size, 'chunks': archive_hashes}
+                new_chunks += archive_new_chunks
+        finally:
+            for path in (image_path, archive_image_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        manifest_path = self._new_manifest_path()
+        manifest = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'size': size,
+            'chunk_size': self.chunk_size,
+            'new_chunks': new_chunks,
+            'chunks': hashes,
+            'archive': archive
+        }
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f)
+
+        self.apply_incremental_retention()
+        return os.path.abspath(manifest_path)
+
+    def _store_image(self, image_path: str) -> Tuple[int, List[str], int]:
+        """Store the chunks of a database image: (size, chunk hashes, chunks written)"""
+        hashes = []
+        new_chunks = 0
+        with open(image_path, 'rb') as image:
+            while True:
+                block = image.read(self.chunk_size)
+                if not block:
+                    break
+                digest = hashlib.sha256(block).hexdigest()
+                if self._store_chunk(digest, block):
+                    new_chunks += 1
+                hashes.append(digest)
+        return os.path.getsize(image_path), hashes, new_chunks
+
+    def _chunk_path(self, digest: str) -> str:
+        """Location of a chunk in the content-addressed store"""
+        return os.path.join(self.chunk_dir, digest[:2], digest)
+
+    def _store_chunk(self, digest: str, block: bytes) -> bool:
+        """Write a chunk unless the store already has it; return True if written"""
+        path = self._chunk_path(digest)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        with gzip.open(temp_path, 'wb', compresslevel=6) as f:
+            f.write(block)
+        os.replace(temp_path, path)
+        return True
+
+    def _new_manifest_path(self) -> str:
+        """Build a unique manifest file name from the current time"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        base = os.path.join(self.snapshot_dir, f"{SNAPSHOT_PREFIX}{timestamp}")
+        path = f"{base}.json"
+        suffix = 1
+        while os.path.exists(path):
+            path = f"{base}_{suffix}.json"
+            suffix += 1
+        return path
+
+    def list_incremental_backups(self) -> List[Tuple[datetime, str]]:
+        """List incremental snapshot manifests, newest first"""
+        if not os.path.isdir(self.snapshot_dir):
+            return []
+        snapshots = []
+        for name in os.listdir(self.snapshot_dir):
+            match = SNAPSHOT_PATTERN.match(name)
+            if match:
+                taken_at = datetime.strptime(match.group(1), "%Y%m%d_%H%M%S")
+                snapshots.append((taken_at, os.path.join(self.snapshot_dir, name)))
+        snapshots.sort(reverse=True)
+        return snapshots
+
+    def apply_incremental_retention(self) -> List[str]:
+        """Drop manifests outside the retention policy, then chunks no manifest uses"""
+        snapshots = self.list_incremental_backups()
+        keep = self._retained(snapshots)
+        removed = []
+        for _, path in snapshots:
+            if path not in keep:
+                os.remove(path)
+                removed.append(path)
+
+        referenced = set()
+        for path in keep:
+            with open(path) as f:
+                manifest = json.load(f)
+            referenced.update(manifest['chunks'])
+            if manifest.get('archive'):
+                referenced.update(manifest['archive']['chunks'])
+        for folder in os.listdir(self.chunk_dir):
+            folder_path = os.path.join(self.chunk_dir, folder)
+            for digest in os.listdir(folder_path):
+                if digest not in referenced:
+                    os.remove(os.path.join(folder_path, digest))
+        return removed
+
+    def restore_incremental_backup(self, manifest_path: str, target_path: Optional[str] = None) -> str:
+        """Rebuild the database image of a snapshot into target_path (default: the database),
+        and its archive next to it (see _restore_images).
+
+        The database must not be open while it is being restored.
+        """
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+        def assembler(chunks):
+            def write(target):
+                for digest in chunks:
+                    with gzip.open(self._chunk_path(digest), 'rb') as chunk:
+                        block = chunk.read()
+                    if hashlib.sha256(block).hexdigest() != digest:
+                        raise ValueError(f"Bloc de sauvegarde corrompu: {digest}")
+                    target.write(block)
+            return write
+
+        archive = manifest.get('archive')
+        return self._restore_images(target_path, assembler(manifest['chunks']),
+                                    assembler(archive['chunks']) if archive else None)
@@ -0,0 +1,712 @@
+"""
+Database Benchmark Script
+Measures DatabaseHandler performance on generated datasets of growing size
+"""
+
+import os
+import random
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from database import DatabaseHandler, Money, STORAGE_PROFILES, parse_date, format_date_display
+from financial_engine import HAS_NUMPY, compute_rental_amounts_from_rows
+
+FIRST_NAMES = ["Ahmed", "Fatima", "Mohamed", "Amira", "Youssef", "Salma", "Karim", "Ines",
+               "Hichem", "Rania", "Sami", "Leila", "Walid", "Nour", "Bilel", "Hana"]
+LAST_NAMES = ["Ben Ali", "Trabelsi", "Jebali", "Gharbi", "Hammami", "Mejri", "Chaabane",
+              "Bouazizi", "Khelifi", "Saidi", "Ayari", "Dridi", "Mansouri", "Zouari"]
+
+
+def generate_database(db_path: str, renters: int, rentals_per_renter: int = 2,
+                      products: int = 50, seed: int = 42, profile: str = None,
+                      payments: bool = False) -> DatabaseHandler:
+    """Create a database filled with deterministic random products, renters and rentals.
+
+    With payments=True the rentals with an end date also get their payment schedules,
+    40% of them paid (open-ended rentals have virtual schedules).
+    """
+    rng = random.Random(seed)
+    db = DatabaseHandler(db_path, profile=profile)
+
+    db.cursor.executemany(
+        "INSERT INTO products (name, type, rental_price) VALUES (?, ?, ?)",
+        [(f"Produit {i}", rng.choice(['bed', 'equipment']), Money.from_tnd(round(rng.uniform(50, 400), 3)))
+         for i in range(products)]
+    )
+    db.cursor.executemany(
+        "INSERT INTO renters (full_name, phone, email, address, id_number) VALUES (?, ?, ?, ?, ?)",
+        [(f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}",
+          f"+216 {rng.randint(20, 99)} {rng.randint(100, 999)} {rng.randint(100, 999)}",
+          f"renter{i}@email.tn", "Tunis, Tunisia", f"{rng.randint(10000000, 99999999)}")
+         for i in range(renters)]
+    )
+
+    rows = []
+    for renter_id in range(1, renters + 1):
+        for _ in range(rentals_per_renter):
+            start_year = rng.randint(2022, 2026)
+            start = f"{start_year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+            end = None
+            status = 'active' if rng.random() < 0.85 else 'returned'
+            # Returned rentals always have an end date (their return date)
+            if rng.random() < 0.8 or status == 'returned':
+                end = f"{start_year + rng.randint(1, 3)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+            rows.append((
+                rng.randint(1, products), renter_id, rng.choice(['monthly', 'yearly']),
+                Money.from_tnd(round(rng.uniform(50, 400), 3)), start, end, status,
+                'paid' if rng.random() < 0.4 else 'unpaid',
+                Money.from_tnd(round(rng.uniform(0, 100), 3)), Money.from_tnd(round(rng.uniform(0, 50), 3))
+            ))
+    db.cursor.executemany(
+        """INSERT INTO rentals (product_id, renter_id, billing_type, rental_price, start_date,
+           end_date, status, payment_status, acompte, escompte)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        rows
+    )
+    if payments:
+        db.cursor.execute("""SELECT id, billing_type, rental_price, start_date, end_date FROM rentals
+                             WHERE end_date IS NOT NULL""")
+        schedules = [payment for rental in db.cursor.fetchall()
+                     for payment in db._payment_schedule_rows(*rental)]
+        db.cursor.executemany(
+            """INSERT INTO payments (rental_id, payment_date, amount, payment_month, status)
+               VALUES (?, ?, ?, ?, ?)""",
+            [payment + ('paid' if rng.random() < 0.4 else 'unpaid',) for payment in schedules]
+        )
+    db.connection.commit()
+    return db
+
+
+def legacy_tenant_totals(db: DatabaseHandler) -> list:
+    """Previous per-tenant (N+1) implementation of get_tenant_totals, kept for comparison."""
+    db.cursor.execute("""
+        SELECT
+            rt.id as renter_id,
+            rt.full_name as renter_name,
+            rt.phone as renter_phone,
+            COUNT(r.id) as total_rentals,
+            SUM(CASE WHEN r.payment_status = 'paid' THEN 1 ELSE 0 END) as paid_rentals,
+            SUM(CASE WHEN r.payment_status = 'unpaid' THEN 1 ELSE 0 END) as unpaid_rentals
+        FROM renters rt
+        LEFT JOIN rentals r ON rt.id = r.renter_id AND r.status = 'active'
+        GROUP BY rt.id, rt.full_name, rt.phone
+        ORDER BY rt.full_name
+    """)
+    totals = []
+    for tenant in db.cursor.fetchall():
+        cursor = db.connection.execute(
+            """SELECT rental_price, billing_type, start_date, end_date,
+                      payment_status, acompte, escompte
+               FROM rentals WHERE renter_id = ? AND status = 'active'""",
+            (tenant['renter_id'],)
+        )
+        received = owed = Money()
+        for rental in cursor.fetchall():
+            amounts = db._calculate_rental_amounts(dict(rental))
+            received += amounts['total_received']
+            owed += amounts['still_owed']
+        paid_count = tenant['paid_rentals'] or 0
+        unpaid_count = tenant['unpaid_rentals'] or 0
+        if paid_count > 0 and unpaid_count > 0:
+            label = 'partiel'
+        elif unpaid_count > 0:
+            label = 'impayé'
+        elif paid_count > 0:
+            label = 'payé'
+        else:
+            label = 'aucune location'
+        totals.append({
+            'renter_id': tenant['renter_id'],
+            'renter_name': tenant['renter_name'],
+            'renter_phone': tenant['renter_phone'],
+            'total_rentals': tenant['total_rentals'] or 0,
+            'paid_rentals': paid_count,
+            'unpaid_rentals': unpaid_count,
+            'payment_status': label,
+            'total_received': received,
+            'total_owed': owed,
+            'total_amount': received + owed
+        })
+    return totals
+
+
+def timed(func, *args, repeat: int = 3) -> float:
+    """Return the best wall-clock time in seconds over several runs."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_tenant_totals(sizes=(100, 1000, 5000)):
+    """Compare get_tenant_totals against the legacy N+1 loop for growing tenant counts."""
+    print("\nget_tenant_totals (best of 3)")
+    print(f"{'tenants':>10} {'legacy (s)':>12} {'current (s)':>12} {'speedup':>9}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = generate_database(os.path.join(tmp, "bench.db"), renters=size)
+            current = db.get_tenant_totals()
+            legacy = legacy_tenant_totals(db)
+            assert current == legacy, "get_tenant_totals differs from the legacy implementation"
+            legacy_time = timed(legacy_tenant_totals, db)
+            current_time = timed(db.get_tenant_totals)
+            db.close()
+        print(f"{size:>10} {legacy_time:>12.4f} {current_time:>12.4f} {legacy_time / current_time:>8.1f}x")
+
+
+def per_row_financials(db: DatabaseHandler) -> list:
+    """Previous Locations tab loading: one financial summary query per rental row."""
+    rentals = db.get_all_rentals()
+    for rental in rentals:
+        rental.update(db.get_rental_financial_summary(rental['id']))
+    return rentals
+
+
+def bench_rentals_with_financials(sizes=(1000, 10000)):
+    """Compare per-row financial summaries against get_rentals_with_financials."""
+    print("\nLocations tab data (best of 3)")
+    print(f"{'rentals':>10} {'per-row (s)':>12} {'bulk (s)':>12} {'speedup':>9}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = generate_database(os.path.join(tmp, "bench.db"), renters=size)
+            rental_count = len(db.get_all_rentals())
+            assert db.get_rentals_with_financials() == per_row_financials(db)
+            per_row_time = timed(per_row_financials, db)
+            bulk_time = timed(db.get_rentals_with_financials)
+            db.close()
+        print(f"{rental_count:>10} {per_row_time:>12.4f} {bulk_time:>12.4f} {per_row_time / bulk_time:>8.1f}x")
+
+
+def generate_rental_rows(count: int, seed: int = 42) -> list:
+    """Build in-memory rental rows shaped like the rentals table."""
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(count):
+        start_year = rng.randint(2020, 2026)
+        end = None
+        if rng.random() < 0.8:
+            end = f"{start_year + rng.randint(0, 4)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        rows.append({
+            'rental_price': round(rng.uniform(50, 400), 3),
+            'billing_type': rng.choice(['monthly', 'yearly']),
+            'start_date': f"{start_year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            'end_date': end,
+            'payment_status': rng.choice(['paid', 'unpaid']),
+            'acompte': round(rng.uniform(0, 500), 3),
+            'escompte': round(rng.uniform(0, 200), 3)
+        })
+    return rows
+
+
+def bench_financial_engine(sizes=(10000, 100000)):
+    """Compare the scalar _calculate_rental_amounts loop with the NumPy engine."""
+    if not HAS_NUMPY:
+        print("\nNumPy not installed: financial engine benchmark skipped")
+        return
+    print("\nRental financial engine (best of 3)")
+    print(f"{'rentals':>10} {'scalar (s)':>12} {'numpy (s)':>12} {'speedup':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseHandler(os.path.join(tmp, "bench.db"))
+        for size in sizes:
+            rows = generate_rental_rows(size)
+            scalar = [db._calculate_rental_amounts(row) for row in rows]
+            vector = compute_rental_amounts_from_rows(rows)
+            for key, values in vector.items():
+                if key != 'periods':
+                    values = [Money(value) for value in values.tolist()]
+                assert list(values) == [amounts[key] for amounts in scalar], key
+            scalar_time = timed(lambda: [db._calculate_rental_amounts(row) for row in rows])
+            vector_time = timed(compute_rental_amounts_from_rows, rows)
+            print(f"{size:>10} {scalar_time:>12.4f} {vector_time:>12.4f} {scalar_time / vector_time:>8.1f}x")
+        db.close()
+
+
+def bench_bulk_rentals(count: int = 1000):
+    """Compare add_rental one by one with add_rentals_bulk for multi-year monthly rentals."""
+    rng = random.Random(7)
+    rentals = [{
+        'product_id': 1, 'renter_id': 1, 'billing_type': 'monthly',
+        'rental_price': round(rng.uniform(50, 400), 3),
+        'start_date': f"{rng.randint(2020, 2023)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        'end_date': f"{rng.randint(2026, 2028)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    } for _ in range(count)]
+
+    print(f"\nRental import ({count} multi-year monthly rentals)")
+    print(f"{'method':>12} {'time (s)':>10} {'rentals/s':>11} {'payments/s':>12}")
+    for label in ('add_rental', 'bulk'):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = generate_database(os.path.join(tmp, "bench.db"), renters=1, rentals_per_renter=0)
+            start = time.perf_counter()
+            if label == 'bulk':
+                db.add_rentals_bulk(rentals)
+            else:
+                for rental in rentals:
+                    db.add_rental(**rental)
+            elapsed = time.perf_counter() - start
+            db.cursor.execute("SELECT COUNT(*) FROM payments")
+            payments = db.cursor.fetchone()[0]
+            db.close()
+        print(f"{label:>12} {elapsed:>10.3f} {count / elapsed:>11.0f} {payments / elapsed:>12.0f}")
+
+
+def bench_storage_profiles(writes: int = 500, renters: int = 5000):
+    """Compare write and read throughput of every storage profile on the same workload."""
+    print(f"\nStorage profiles ({writes} single-row commits, reads on {renters} renters)")
+    print(f"{'profile':>10} {'commits/s':>11} {'bulk rentals/s':>15} {'reads/s':>10}")
+    for profile in STORAGE_PROFILES:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = generate_database(os.path.join(tmp, "bench.db"), renters=renters, profile=profile)
+
+            start = time.perf_counter()
+            for i in range(writes):
+                db.add_renter(f"Locataire {i}", "+216 20 000 000")
+            commit_rate = writes / (time.perf_counter() - start)
+
+            rentals = [{'product_id': 1, 'renter_id': i + 1, 'billing_type': 'monthly',
+                        'rental_price': 100.0, 'start_date': '2024-01-01',
+                        'end_date': '2026-12-31'} for i in range(writes)]
+            start = time.perf_counter()
+            db.add_rentals_bulk(rentals)
+            bulk_rate = writes / (time.perf_counter() - start)
+
+            rng = random.Random(1)
+            start = time.perf_counter()
+            for _ in range(writes * 10):
+                db.get_renter_by_id(rng.randint(1, renters))
+            db.get_all_rentals()
+            read_rate = writes * 10 / (time.perf_counter() - start)
+            db.close()
+        print(f"{profile:>10} {commit_rate:>11.0f} {bulk_rate:>15.0f} {read_rate:>10.0f}")
+
+
+def folder_size(path: str) -> int:
+    """Total size in bytes of the files below path."""
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+
+def bench_backups(renters: int = 20000, snapshots: int = 10):
+    """Compare full and incremental backups when one payment changes between snapshots."""
+    print(f"\nBackups ({snapshots} snapshots of a {renters}-renter database, one change each)")
+    print(f"{'mode':>12} {'per backup (s)':>15} {'disk (MB)':>10}")
+    for incremental in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = generate_database(os.path.join(tmp, "bench.db"), renters=renters)
+            backup_dir = os.path.join(tmp, "backups")
+            elapsed = 0.0
+            for i in range(snapshots):
+                db.update_tenant_payment_status(i + 1, 'paid')
+                start = time.perf_counter()
+                db.save_all(backup_dir, incremental=incremental)
+                elapsed += time.perf_counter() - start
+                time.sleep(1)  # snapshots are named by the second
+            db.close()
+            size = folder_size(backup_dir) / (1024 * 1024)
+        label = 'incremental' if incremental else 'full'
+        print(f"{label:>12} {elapsed / snapshots:>15.3f} {size:>10.2f}")
+
+
+def bench_entity_cache(renters: int = 20000, lookups: int = 20000):
+    """Measure product/renter lookups with a warm entity cache against direct SQL."""
+    print(f"\nEntity cache ({lookups} renter lookups, RentalWindow lists on {renters} renters)")
+    with tempfile.TemporaryDirectory() as tmp:
+        db = generate_database(os.path.join(tmp, "bench.db"), renters=renters)
+        rng = random.Random(3)
+        ids = [rng.randint(1, 2000) for _ in range(lookups)]
+
+        def uncached_lookups():
+            for renter_id in ids:
+                db.cursor.execute("SELECT * FROM renters WHERE id = ?", (renter_id,))
+                dict(db.cursor.fetchone())
+
+        def cached_lookups():
+            for renter_id in ids:
+                db.get_renter_by_id(renter_id)
+
+        def uncached_lists():
+            db.cursor.execute("SELECT * FROM renters ORDER BY full_name")
+            [dict(row) for row in db.cursor.fetchall()]
+            db.cursor.execute("SELECT * FROM products ORDER BY name")
+            [dict(row) for row in db.cursor.fetchall()]
+
+        def cached_lists():
+            db.get_all_renters()
+            db.get_all_products()
+
+        for label, uncached, cached in (("by id", uncached_lookups, cached_lookups),
+                                        ("full lists", uncached_lists, cached_lists)):
+            print(f"{label:>12}: SQL {timed(uncached):.4f}s, cache {timed(cached):.4f}s")
+        print(f"{'counters':>12}: {db.get_cache_stats()}")
+        db.close()
+
+
+def bench_dashboard_stats(sizes=(1000, 20000)):
+    """Compare recomputing the dashboard counters with reading the trigger-maintained row."""
+    print("\nDashboard statistics (best of 3)")
+    print(f"{'rentals':>10} {'COUNT/SUM (s)':>14} {'counters (s)':>13}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = generate_database(os.path.join(tmp, "bench.db"), renters=size)
+            rentals = len(db.get_all_rentals())
+            assert db.verify_stats_counters() == {}
+            recompute_time = timed(db._compute_stats_counters)
+            counters_time = timed(db.get_dashboard_stats)
+            db.close()
+        print(f"{rentals:>10} {recompute_time:>14.5f} {counters_time:>13.5f}")
+
+
+def bench_search(renters: int = 50000, lookups: int = 200):
+    """Compare LIKE scans with the FTS5 index for renter searches."""
+    print(f"\nRenter search ({lookups} lookups on {renters} renters)")
+    with tempfile.TemporaryDirectory() as tmp:
+        db = generate_database(os.path.join(tmp, "bench.db"), renters=renters, rentals_per_renter=1)
+        rng = random.Random(5)
+        terms = [rng.choice(LAST_NAMES).split()[-1][:4] + " " + str(rng.randint(0, renters))
+                 for _ in range(lookups)]
+
+        def like_search():
+            for term in terms:
+                db.cursor.execute("SELECT * FROM renters WHERE LOWER(full_name) LIKE LOWER(?)",
+                                  (f"%{term}%",))
+                db.cursor.fetchall()
+
+        def index_search():
+            for term in terms:
+                db.search(term)
+
+        like_time = timed(like_search, repeat=1) / lookups
+        index_time = timed(index_search, repeat=1) / lookups
+        db.close()
+    print(f"  LIKE: {like_time * 1000:.2f} ms/lookup, FTS5: {index_time * 1000:.2f} ms/lookup")
+
+
+def bench_picker_index(renters: int = 50000):
+    """Time building the renter picker index and filtering it keystroke by keystroke."""
+    print(f"\nRenter picker ({renters} renters)")
+    with tempfile.TemporaryDirectory() as tmp:
+        db = generate_database(os.path.join(tmp, "bench.db"), renters=renters, rentals_per_renter=1)
+        start = time.perf_counter()
+        index = db.get_renter_index()
+        build_time = time.perf_counter() - start
+
+        keystrokes = ["b", "be", "ben", "ben ", "ben a", "ben al", "ben ali", "ben ali 1", "ben ali 12"]
+        index_time = timed(lambda: [index.search(text) for text in keystrokes]) / len(keystrokes)
+        db_time = timed(lambda: [db.search_renters(text) for text in keystrokes], repeat=1) / len(keystrokes)
+
+        start = time.perf_counter()
+        renter_id = db.add_renter("Nouveau Locataire", "+216 99 000 000")
+        db.update_renter(renter_id, "Nouveau Locataire Modifié", "+216 99 000 000")
+        refresh_time = time.perf_counter() - start
+        db.close()
+    print(f"  index build: {build_time:.2f}s, add+update with refresh: {refresh_time * 1000:.1f} ms")
+    print(f"  per keystroke: search_renters {db_time * 1000:.1f} ms, picker index {index_time * 1000:.2f} ms")
+
+
+def bench_streaming(renters: int = 50000, rentals_per_renter: int = 2):
+    """Compare get_all_rentals with iter_rentals: time to first row and peak memory."""
+    import tracemalloc
+    print(f"\nRental listing ({renters * rentals_per_renter} rentals)")
+    with tempfile.TemporaryDirectory() as tmp:
+        db = generate_database(os.path.join(tmp, "bench.db"), renters=renters,
+                               rentals_per_renter=rentals_per_renter)
+        for label, listing in (("get_all_rentals", lambda: iter(db.get_all_rentals())),
+                               ("iter_rentals", lambda: db.iter_rentals())):
+            tracemalloc.start()
+            start = time.perf_counter()
+            rows = listing()
+            next(rows)
+            first_row = time.perf_counter() - start
+            count = 1 + sum(1 for _ in rows)
+            total = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"  {label}: first row {first_row * 1000:.1f} ms, {count} rows in {total:.2f}s, "
+                  f"peak {peak / 1024 / 1024:.1f} MB")
+
+        start = time.perf_counter()
+        db.get_rentals_page(limit=100)
+        print(f"  get_rentals_page(limit=100): {(time.perf_counter() - start) * 1000:.1f} ms")
+        db.close()
+
+
+def legacy_parse_date(date_value):
+    """Previous parse_date (string splitting and up to three strptime calls), kept for comparison."""
+    if not date_value:
+        return None
+    if isinstance(date_value, datetime):
+        return date_value.replace(hour=0, minute=0, second=0, microsecond=0)
+    text = str(date_value).strip()
+    if not text:
+        return None
+    if ' ' in text:
+        text = text.split(' ')[0]
+    if 'T' in text:
+        text = text.split('T')[0]
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y"):
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def bench_parse_date(values: int = 200000):
+    """Microbenchmark parse_date against the previous strptime-based parser."""
+    rng = random.Random(11)
+    base = date(2020, 1, 1)
+    # Report-like input: a few thousand distinct dates, each seen many times
+    iso = [(base + timedelta(days=rng.randint(0, 2000))).isoformat() for _ in range(values)]
+    french = [f"{d[8:10]}/{d[5:7]}/{d[0:4]}" for d in iso[:values // 10]]
+    print(f"\nDate parsing ({values} ISO values, {len(french)} DD/MM/YYYY values)")
+    for label, parse in (("legacy parse_date", legacy_parse_date), ("parse_date", parse_date)):
+        iso_time = timed(lambda: [parse(value) for value in iso])
+        french_time = timed(lambda: [parse(value) for value in french])
+        print(f"  {label}: ISO {iso_time * 1e9 / len(iso):.0f} ns/value, "
+              f"DD/MM/YYYY {french_time * 1e9 / len(french):.0f} ns/value")
+    display_time = timed(lambda: [format_date_display(value) for value in iso])
+    print(f"  format_date_display: {display_time * 1e9 / len(iso):.0f} ns/value")
+
+
+def bench_indexed_queries(renters: int = 20000):
+    """Time the queries the query-plan audit covers with joins, filters and sorts."""
+    print(f"\nIndexed queries ({renters} renters, payment schedules included)")
+    with tempfile.TemporaryDirectory() as tmp:
+        db = generate_database(os.path.join(tmp, "bench.db"), renters=renters, payments=True)
+        renter = db.get_renters_page(limit=1)[0][0]
+        product = db.get_all_products()[0]
+        checks = [
+            ("get_active_rentals", db.get_active_rentals),
+            ("get_unpaid_payments", db.get_unpaid_payments),
+            ("get_unpaid_rentals_with_totals", db.get_unpaid_rentals_with_totals),
+            ("get_unpaid_payments_page", lambda: db.get_unpaid_payments_page(limit=100)),
+            ("update_renter (search triggers)", lambda: db.update_renter(
+                renter['id'], renter['full_name'], renter['phone'])),
+            ("update_product (search triggers)", lambda: db.update_product(
+                product['id'], product['name'], product['type'], product['rental_price'])),
+        ]
+        for label, query in checks:
+            print(f"  {label}: {timed(query) * 1000:.1f} ms")
+        db.close()
+
+
+def bench_startup(renters: int = 20000, opens: int = 20):
+    """Time opening an existing, up-to-date database (DatabaseHandler construction)."""
+    print(f"\nStartup ({renters} renters, {opens} opens)")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        generate_database(path, renters=renters, payments=True).close()
+
+        def open_database():
+            DatabaseHandler(path).close()
+
+        print(f"  DatabaseHandler(): {timed(lambda: [open_database() for _ in range(opens)]) / opens * 1000:.2f} ms")
+
+
+def bench_concurrent_reads(renters: int = 20000, threads: int = 4, reads: int = 50):
+    """Time dashboard reads from several threads while one thread keeps writing."""
+    import threading
+    print(f"\nConcurrent reads ({renters} renters, {threads} reader threads, {reads} reads each)")
+    with tempfile.TemporaryDirectory() as tmp:
+        db = generate_database(os.path.join(tmp, "bench.db"), renters=renters, payments=True,
+                               profile='balanced')
+        product_id = db.get_all_products()[0]['id']
+        stop = threading.Event()
+
+        def writer():
+            while not stop.is_set():
+                db.add_rental(product_id, 1, "monthly", 100.000, "2026-01-01", "2026-12-31")
+
+        def reader():
+            for _ in range(reads):
+                db.get_unpaid_payments_page(limit=50)
+                db.get_renters_page(limit=50)
+                db.get_dashboard_stats()
+
+        def run_readers():
+            workers = [threading.Thread(target=reader) for _ in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+        idle = timed(run_readers)
+        writer_thread = threading.Thread(target=writer)
+        writer_thread.start()
+        busy = timed(run_readers)
+        stop.set()
+        writer_thread.join()
+        print(f"  readers alone:          {idle * 1000:.1f} ms")
+        print(f"  readers with a writer:  {busy * 1000:.1f} ms")
+        db.close()
+
+
+def bench_async_callers(renters: int = 20000, callers=(1, 10, 100), calls: int = 20):
+    """Throughput of AsyncDatabaseHandler with many simultaneous callers, and event loop lag."""
+    import asyncio
+    from async_database import AsyncDatabaseHandler
+    print(f"\nAsync callers ({renters} renters, {calls} calls per caller)")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        generate_database(path, renters=renters, payments=True, profile='balanced').close()
+
+        async def caller(db, seed):
+            rng = random.Random(seed)
+            for _ in range(calls):
+                await db.get_renter_by_id(rng.randint(1, renters))
+                await db.get_rentals_page(limit=50)
+                await db.get_dashboard_stats()
+
+        async def ticker(stop, lags):
+            # How late a 1 ms sleep wakes up tells whether anything blocks the loop
+            loop = asyncio.get_running_loop()
+            while not stop.is_set():
+                start = loop.time()
+                await asyncio.sleep(0.001)
+                lags.append(loop.time() - start - 0.001)
+
+        async def run(count):
+            async with AsyncDatabaseHandler(path, profile='balanced') as db:
+                stop, lags = asyncio.Event(), []
+                tick = asyncio.create_task(ticker(stop, lags))
+                start = time.perf_counter()
+                await asyncio.gather(*(caller(db, seed) for seed in range(count)))
+                elapsed = time.perf_counter() - start
+                stop.set()
+                await tick
+            return count * calls * 3 / elapsed, max(lags or [0.0])
+
+        for count in callers:
+            throughput, lag = asyncio.run(run(count))
+            print(f"  {count:>4} callers: {throughput:8.0f} calls/s, max loop lag {lag * 1000:.1f} ms")
+
+
+def bench_virtual_schedules(count: int = 5000, years: int = 3):
+    """Compare pre-generated and virtual payment schedules for open-ended monthly rentals."""
+    rng = random.Random(11)
+    today = date.today()
+    rentals = [{
+        'product_id': 1, 'renter_id': 1, 'billing_type': 'monthly',
+        'rental_price': round(rng.uniform(50, 400), 3),
+        'start_date': (today - timedelta(days=rng.randint(0, 365 * years))).isoformat()
+    } for _ in range(count)]
+
+    print(f"\nOpen-ended rentals ({count} monthly rentals started up to {years} years ago)")
+    print(f"{'schedule':>10} {'insert (s)':>11} {'payments':>9} {'size (MB)':>10} "
+          f"{'dashboard':>10} {'unpaid page':>12} {'all unpaid':>11}")
+    for label in ('stored', 'virtual'):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            db = generate_database(path, renters=1, rentals_per_renter=0)
+            start = time.perf_counter()
+            rental_ids = db.add_rentals_bulk(rentals)
+            if label == 'stored':
+                # Previous behaviour: every period up to a year from today written up front
+                db.cursor.executemany(db.PAYMENT_INSERT_QUERY, [
+                    period for rental_id, rental in zip(rental_ids, rentals)
+                    for period in db._payment_schedule_rows(rental_id, 'monthly',
+                                                            Money.from_tnd(rental['rental_price']),
+                                                            rental['start_date'])
+                ])
+                db.cursor.execute("UPDATE rentals SET end_date = ? WHERE end_date IS NULL",
+                                  (db._effective_end_date().strftime("%Y-%m-%d"),))
+                db.connection.commit()
+            elapsed = time.perf_counter() - start
+            payments = db.connection.execute("SELECT COUNT(*) FROM payments").fetchone()[0]
+            dashboard = timed(db.get_dashboard_stats, repeat=5)
+            page = timed(lambda: db.get_unpaid_payments_page(limit=50), repeat=5)
+            listing = timed(lambda: sum(1 for _ in db.iter_unpaid_payments()))
+            pages = db.connection.execute("PRAGMA page_count").fetchone()[0]
+            size = pages * db.connection.execute("PRAGMA page_size").fetchone()[0] / 1024 / 1024
+            db.close()
+        print(f"{label:>10} {elapsed:>11.3f} {payments:>9} {size:>10.1f} "
+              f"{dashboard * 1000:>8.2f}ms {page * 1000:>10.2f}ms {listing:>10.2f}s")
+
+
+def bench_unit_of_work(actions: int = 100, profile: str = 'safe'):
+    """Commits and time per "new renter + rental" action of the rental dialog, before and after
+    grouping its three writes in one transaction."""
+    print(f"\nRental dialog save ({actions} actions, {profile} profile)")
+    print(f"{'method':>12} {'commits/action':>15} {'ms/action':>10}")
+    for label in ('separate', 'transaction'):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = DatabaseHandler(os.path.join(tmp, "bench.db"), profile=profile)
+            product_id = db.add_product("Lit", "bed", 100.000)
+            commits = []
+            db.set_trace_callback(lambda sql: commits.append(sql) if sql == "COMMIT" else None)
+
+            def save_rental(index):
+                renter_id = db.add_renter(f"Locataire {index}", f"2000{index:04d}")
+                rental_id = db.add_rental(product_id, renter_id, "monthly", 100.000,
+                                          "2026-01-01", "2026-12-31")
+                db.update_rental_payment_status(rental_id, 'paid')
+
+            start = time.perf_counter()
+            for index in range(actions):
+                if label == 'transaction':
+                    with db.transaction():
+                        save_rental(index)
+                else:
+                    save_rental(index)
+            elapsed = time.perf_counter() - start
+            db.set_trace_callback(None)
+            db.close()
+        print(f"{label:>12} {len(commits) / actions:>15.1f} {elapsed / actions * 1000:>10.2f}")
+
+
+def bench_archive(renters: int = 20000, rentals_per_renter: int = 4):
+    """Time the hot-path queries before and after archiving the closed history."""
+    print(f"\nArchive ({renters} renters, {rentals_per_renter} rentals each, ended rentals returned and paid)")
+    with tempfile.TemporaryDirectory() as tmp:
+        db = generate_database(os.path.join(tmp, "bench.db"), renters=renters,
+                               rentals_per_renter=rentals_per_renter, payments=True)
+        db.cursor.execute("UPDATE rentals SET status = 'returned' WHERE end_date < date('now')")
+        db.cursor.execute("""UPDATE payments SET status = 'paid'
+                             WHERE rental_id IN (SELECT id FROM rentals WHERE status = 'returned')""")
+        db.connection.commit()
+        db.rebuild_stats_counters()
+        checks = [
+            ("get_dashboard_stats", db.get_dashboard_stats),
+            ("get_all_rentals", db.get_all_rentals),
+            ("get_rentals_page", lambda: db.get_rentals_page(limit=100)),
+            ("get_unpaid_payments", db.get_unpaid_payments),
+            ("get_tenant_totals", db.get_tenant_totals),
+        ]
+        before = {label: timed(query) for label, query in checks}
+        start = time.perf_counter()
+        moved = db.archive_closed_rentals(older_than_days=0)
+        elapsed = time.perf_counter() - start
+        db.analyze()
+        print(f"  archived {moved['rentals']} rentals and {moved['payments']} payments in {elapsed:.2f} s")
+        print(f"  {'query':>22} {'before (ms)':>12} {'after (ms)':>11}")
+        for label, query in checks:
+            print(f"  {label:>22} {before[label] * 1000:>12.1f} {timed(query) * 1000:>11.1f}")
+        history = timed(db.get_income_history)
+        print(f"  get_income_history (with archive): {history * 1000:.1f} ms")
+        db.close()
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("RENTAL MANAGEMENT SYSTEM - DATABASE BENCHMARK")
+    print("=" * 60)
+    bench_tenant_totals()
+    bench_rentals_with_financials()
+    bench_financial_engine()
+    bench_bulk_rentals()
+    bench_storage_profiles()
+    bench_backups()
+    bench_entity_cache()
+    bench_dashboard_stats()
+    bench_search()
+    bench_picker_index()
+    bench_streaming()
+    bench_parse_date()
+    bench_indexed_queries()
+    bench_startup()
+    bench_concurrent_reads()
+    bench_async_callers()
+    bench_virtual_schedules()
+    bench_unit_of_work()
+    bench_archive()
@@ -0,0 +1,406 @@
+"""
+Benchmark Suite for Rental Management System
+Times every public DatabaseHandler method on seeded databases at fixed scale factors,
+saves the results as JSON and compares them against a stored baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from itertools import count
+from typing import Callable, Dict, List, Optional
+
+from benchmark_database import generate_database
+from database import DatabaseHandler, Money
+from financial_engine import HAS_NUMPY
+from instrumentation import count_rows, instrumented_methods
+
+# Scale factors: number of generated renters (two rentals each, with their payment schedules)
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000}
+DEFAULT_SEED = 42
+DEFAULT_REPEAT = 5
+
+# A result is a regression when its median is this much slower than the baseline
+# and slower by at least MIN_DELTA_MS (timer noise on sub-millisecond calls)
+DEFAULT_TOLERANCE = 0.25
+MIN_DELTA_MS = 1.0
+
+# name: method timed; run(db, ctx, *setup result); setup(db, ctx) builds untimed arguments;
+# once: the call changes the data for good and is timed a single time
+Case = namedtuple('Case', 'name run setup once', defaults=(None, False))
+
+
+def _bench_rental(db: DatabaseHandler, ctx: Dict, end_date: Optional[str] = "2026-12-31") -> int:
+    """A new monthly rental of the bench renter (a year of schedule with an end date)"""
+    return db.add_rental(ctx['product_id'], ctx['renter_id'], "monthly", Money(100000),
+                         "2026-01-01", end_date)
+
+
+def _bench_renter_with_rental(db: DatabaseHandler, ctx: Dict) -> tuple:
+    renter_id = db.add_renter("Locataire Bench", "+216 20 000 000")
+    db.add_rental(ctx['product_id'], renter_id, "monthly", Money(100000), "2026-01-01", "2026-12-31")
+    return (renter_id,)
+
+
+def _first_payment(db: DatabaseHandler, ctx: Dict) -> tuple:
+    return (db.get_payments_by_rental(_bench_rental(db, ctx))[0]['id'],)
+
+
+def _paid_payment(db: DatabaseHandler, ctx: Dict) -> tuple:
+    payment_id = _first_payment(db, ctx)[0]
+    db.mark_payment_paid(payment_id)
+    return (payment_id,)
+
+
+def _bulk_rows(db: DatabaseHandler, ctx: Dict) -> tuple:
+    return ([{'product_id': ctx['product_id'], 'renter_id': ctx['renter_id'],
+              'billing_type': 'monthly', 'rental_price': Money(100000),
+              'start_date': "2026-01-01", 'end_date': "2026-12-31"} for _ in range(100)],)
+
+
+def _import_renter_rows(db: DatabaseHandler, ctx: Dict) -> tuple:
+    return ([{'full_name': f"Locataire Import {n}", 'phone': f"+216 30 {n:06d}", 'id_number': f"IMP{n:08d}"}
+             for n in (next(ctx['sequence']) for _ in range(100))],)
+
+
+def _import_product_rows(db: DatabaseHandler, ctx: Dict) -> tuple:
+    return ([{'name': f"Produit Import {next(ctx['sequence'])}", 'type': "bed", 'rental_price': "120,500"}
+             for _ in range(10)],)
+
+
+def _import_rental_rows(db: DatabaseHandler, ctx: Dict) -> tuple:
+    renter_id = db.add_renter("Locataire Import")
+    start = datetime(2026, 1, 1)
+    return ([{'product_id': ctx['product_id'], 'renter_id': renter_id, 'billing_type': 'monthly',
+              'rental_price': Money(100000), 'start_date': (start + timedelta(days=day)).strftime("%Y-%m-%d"),
+              'end_date': "2026-12-31"} for day in range(100)],)
+
+
+CASES = [
+    # Reads
+    Case('get_all_products', lambda db, ctx: db.get_all_products()),
+    Case('get_product_by_id', lambda db, ctx: db.get_product_by_id(ctx['product_id'])),
+    Case('get_all_renters', lambda db, ctx: db.get_all_renters()),
+    Case('get_renter_by_id', lambda db, ctx: db.get_renter_by_id(ctx['renter_id'])),
+    Case('search_renters', lambda db, ctx: db.search_renters(ctx['term'])),
+    Case('search', lambda db, ctx: db.search(ctx['term'])),
+    Case('get_renter_index', lambda db, ctx: db.get_renter_index().search(ctx['term'])),
+    Case('get_product_index', lambda db, ctx: db.get_product_index().search("produit")),
+    Case('get_all_rentals', lambda db, ctx: db.get_all_rentals()),
+    Case('get_rentals_with_financials', lambda db, ctx: db.get_rentals_with_financials()),
+    Case('get_active_rentals', lambda db, ctx: db.get_active_rentals()),
+    Case('get_rental_by_id', lambda db, ctx: db.get_rental_by_id(ctx['rental_id'])),
+    Case('get_payments_by_rental', lambda db, ctx: db.get_payments_by_rental(ctx['rental_id'])),
+    Case('get_unpaid_payments', lambda db, ctx: db.get_unpaid_payments()),
+    Case('get_unpaid_rentals_with_totals', lambda db, ctx: db.get_unpaid_rentals_with_totals()),
+    Case('get_rentals_page', lambda db, ctx: db.get_rentals_page(limit=100)),
+    Case('get_renters_page', lambda db, ctx: db.get_renters_page(limit=100)),
+    Case('get_unpaid_payments_page', lambda db, ctx: db.get_unpaid_payments_page(limit=100)),
+    Case('get_payments_by_rental_page',
+         lambda db, ctx: db.get_payments_by_rental_page(ctx['open_rental_id'], limit=100)),
+    Case('iter_rentals', lambda db, ctx: list(db.iter_rentals())),
+    Case('iter_renters', lambda db, ctx: list(db.iter_renters())),
+    Case('iter_unpaid_payments', lambda db, ctx: list(db.iter_unpaid_payments())),
+    Case('iter_payments_by_rental', lambda db, ctx: list(db.iter_payments_by_rental(ctx['open_rental_id']))),
+    Case('iter_rentals_with_financials', lambda db, ctx: list(db.iter_rentals_with_financials())),
+    Case('iter_tenant_totals', lambda db, ctx: list(db.iter_tenant_totals())),
+    Case('iter_payment_schedules', lambda db, ctx: list(db.iter_payment_schedules())),
+    Case('count_rentals', lambda db, ctx: db.count_rentals()),
+    Case('get_total_unpaid_amount', lambda db, ctx: db.get_total_unpaid_amount()),
+    Case('get_tenant_totals', lambda db, ctx: db.get_tenant_totals()),
+    Case('get_rental_financial_summary', lambda db, ctx: db.get_rental_financial_summary(ctx['rental_id'])),
+    Case('get_total_income', lambda db, ctx: db.get_total_income()),
+    Case('get_income_by_rental', lambda db, ctx: db.get_income_by_rental(ctx['rental_id'])),
+    Case('get_dashboard_stats', lambda db, ctx: db.get_dashboard_stats()),
+    Case('get_cache_stats', lambda db, ctx: db.get_cache_stats()),
+    # Writes, on rows created by the untimed setup
+    Case('add_product', lambda db, ctx: db.add_product("Produit Bench", "bed", Money(100000))),
+    Case('update_product', lambda db, ctx: db.update_product(ctx['product_id'], "Produit Bench", "bed",
+                                                             Money(100000))),
+    Case('delete_product', lambda db, ctx, product_id: db.delete_product(product_id),
+         lambda db, ctx: (db.add_product("Produit Bench", "bed", Money(100000)),)),
+    Case('add_renter', lambda db, ctx: db.add_renter("Locataire Bench", "+216 20 000 000")),
+    Case('update_renter', lambda db, ctx: db.update_renter(ctx['renter_id'], "Locataire Bench",
+                                                           "+216 20 000 000")),
+    Case('delete_renter', lambda db, ctx, renter_id: db.delete_renter(renter_id),
+         _bench_renter_with_rental),
+    Case('add_rental', lambda db, ctx: _bench_rental(db, ctx)),
+    Case('add_rentals_bulk', lambda db, ctx, rows: db.add_rentals_bulk(rows), _bulk_rows),
+    Case('update_rental_status', lambda db, ctx, rental_id: db.update_rental_status(rental_id, 'returned'),
+         lambda db, ctx: (_bench_rental(db, ctx, None),)),
+    Case('update_rental_payment_status',
+         lambda db, ctx, rental_id: db.update_rental_payment_status(rental_id, 'paid'),
+         lambda db, ctx: (_bench_rental(db, ctx),)),
+    Case('update_tenant_payment_status',
+         lambda db, ctx, renter_id: db.update_tenant_payment_status(renter_id, 'paid'),
+         _bench_renter_with_rental),
+    Case('mark_payment_paid', lambda db, ctx, payment_id: db.mark_payment_paid(payment_id, "Bench"),
+         _first_payment),
+    Case('mark_payment_unpaid', lambda db, ctx, payment_id: db.mark_payment_unpaid(payment_id),
+         _paid_payment),
+    Case('mark_period_paid', lambda db, ctx, rental_id: db.mark_period_paid(rental_id, "2026-03"),
+         lambda db, ctx: (_bench_rental(db, ctx, None),)),
+    Case('delete_rental', lambda db, ctx, rental_id: db.delete_rental(rental_id),
+         lambda db, ctx: (_bench_rental(db, ctx),)),
+    Case('import_renters', lambda db, ctx, rows: db.import_renters(rows), _import_renter_rows),
+    Case('import_products', lambda db, ctx, rows: db.import_products(rows), _import_product_rows),
+    Case('import_rentals', lambda db, ctx, rows: db.import_rentals(rows), _import_rental_rows),
+    # Maintenance
+    Case('invalidate_cache', lambda db, ctx: db.invalidate_cache()),
+    Case('verify_stats_counters', lambda db, ctx: db.verify_stats_counters()),
+    Case('rebuild_stats_counters', lambda db, ctx: db.rebuild_stats_counters()),
+    Case('rebuild_search_index', lambda db, ctx: db.rebuild_search_index()),
+    Case('analyze', lambda db, ctx: db.analyze()),
+    Case('save_all', lambda db, ctx: db.save_all(ctx['backup_dir'])),
+    Case('archive_closed_rentals', lambda db, ctx: db.archive_closed_rentals(), once=True),
+    # History reads, through the archive filled above
+    Case('get_rental_history', lambda db, ctx: db.get_rental_history()),
+    Case('get_income_history', lambda db, ctx: db.get_income_history()),
+]
+
+
+def scale_renters(scale: str) -> int:
+    """Number of renters of a scale factor name ('10k') or an explicit count ('2500')"""
+    if scale in SCALES:
+        return SCALES[scale]
+    if scale.isdigit() and int(scale) > 0:
+        return int(scale)
+    raise ValueError(f"Unknown scale factor: {scale} (expected {', '.join(SCALES)} or a renter count)")
+
+
+def generate(db_path: str, scale: str, seed: int = DEFAULT_SEED) -> DatabaseHandler:
+    """Seeded database at a scale factor: two rentals per renter, multi-year schedules"""
+    db = generate_database(db_path, renters=scale_renters(scale), seed=seed, payments=True)
+    db.rebuild_stats_counters()
+    db.rebuild_search_index()
+    db.analyze()
+    return db
+
+
+def _context(db: DatabaseHandler, backup_dir: str) -> Dict:
+    """Ids of existing rows the read cases look up"""
+    cursor = db.connection.cursor()
+    rental_id, renter_id, product_id = cursor.execute(
+        """SELECT id, renter_id, product_id FROM rentals
+           WHERE end_date IS NOT NULL ORDER BY id LIMIT 1""").fetchone()
+    open_rental = cursor.execute(
+        "SELECT id FROM rentals WHERE end_date IS NULL AND status = 'active' ORDER BY id LIMIT 1").fetchone()
+    renter_name = cursor.execute("SELECT full_name FROM renters WHERE id = ?", (renter_id,)).fetchone()[0]
+    return {'rental_id': rental_id, 'renter_id': renter_id, 'product_id': product_id,
+            'open_rental_id': open_rental[0] if open_rental else rental_id,
+            'term': renter_name.split()[0], 'backup_dir': backup_dir, 'sequence': count()}
+
+
+def time_case(db: DatabaseHandler, ctx: Dict, case: Case, repeat: int) -> Dict:
+    """Min and median wall-clock time of a case in milliseconds, and the rows it returned"""
+    timings = []
+    rows = 0
+    for _ in range(1 if case.once else repeat):
+        args = case.setup(db, ctx) if case.setup else ()
+        start = time.perf_counter()
+        result = case.run(db, ctx, *args)
+        timings.append((time.perf_counter() - start) * 1000)
+        rows = count_rows(result)
+    return {'min_ms': round(min(timings), 3), 'median_ms': round(statistics.median(timings), 3),
+            'runs': len(timings), 'rows': rows}
+
+
+def run_suite(scale: str = '1k', db_path: str = None, seed: int = DEFAULT_SEED,
+              repeat: int = DEFAULT_REPEAT, progress: Callable[[str], None] = None) -> Dict:
+    """Time every case on a copy of db_path, or on a database generated at scale"""
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_path = os.path.join(tmp, "bench.db")
+        generated_in = None
+        if db_path:
+            source = sqlite3.connect(db_path)
+            target = sqlite3.connect(bench_path)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            db = DatabaseHandler(bench_path)
+        else:
+            start = time.perf_counter()
+            db = generate(bench_path, scale, seed)
+            generated_in = round(time.perf_counter() - start, 3)
+        try:
+            counts = {table: db.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                      for table in ('products', 'renters', 'rentals', 'payments')}
+            ctx = _context(db, os.path.join(tmp, "backups"))
+            results = {}
+            for case in CASES:
+                if progress:
+                    progress(case.name)
+                results[case.name] = time_case(db, ctx, case, repeat)
+        finally:
+            db.close()
+    return {
+        'scale': scale if db_path is None else None,
+        'database': db_path,
+        'seed': seed if db_path is None else None,
+        'repeat': repeat,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'numpy': HAS_NUMPY,
+        'generated_in_s': generated_in,
+        'counts': counts,
+        'results': results,
+    }
+
+
+def uncovered_methods() -> List[str]:
+    """Public DatabaseHandler methods no case times"""
+    timed = {case.name for case in CASES}
+    return [name for name in instrumented_methods(DatabaseHandler) if name not in timed]
+
+
+def compare_results(baseline: Dict, current: Dict, tolerance: float = DEFAULT_TOLERANCE,
+                    min_delta_ms: float = MIN_DELTA_MS) -> List[Dict]:
+    """Median of every method in both runs, flagged 'regression', 'improvement' or 'ok'"""
+    report = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            report.append({'method': name, 'baseline_ms': None, 'current_ms': result['median_ms'],
+                           'ratio': None, 'status': 'new'})
+            continue
+        base, now = before['median_ms'], result['median_ms']
+        ratio = now / base if base else float('inf')
+        status = 'ok'
+        if ratio > 1 + tolerance and now - base >= min_delta_ms:
+            status = 'regression'
+        elif ratio < 1 / (1 + tolerance) and base - now >= min_delta_ms:
+            status = 'improvement'
+        report.append({'method': name, 'baseline_ms': base, 'current_ms': now,
+                       'ratio': round(ratio, 3), 'status': status})
+    return report
+
+
+def format_results(results: Dict) -> str:
+    """Human readable timing table"""
+    source = results['database'] or f"scale {results['scale']} (seed {results['seed']})"
+    counts = ", ".join(f"{count} {table}" for table, count in results['counts'].items())
+    lines = [f"{source}: {counts}",
+             f"{'method':>32} {'median (ms)':>12} {'min (ms)':>10} {'rows':>8}"]
+    for name, result in results['results'].items():
+        lines.append(f"{name:>32} {result['median_ms']:>12.3f} {result['min_ms']:>10.3f} {result['rows']:>8}")
+    return "\n".join(lines)
+
+
+def format_comparison(report: List[Dict]) -> str:
+    """Human readable comparison, regressions marked ✗ and improvements ✓"""
+    marks = {'regression': "✗", 'improvement': "✓", 'ok': " ", 'new': "+"}
+    lines = [f"  {'method':>32} {'baseline (ms)':>14} {'current (ms)':>13} {'ratio':>7}"]
+    for entry in report:
+        baseline = "-" if entry['baseline_ms'] is None else f"{entry['baseline_ms']:.3f}"
+        ratio = "-" if entry['ratio'] is None else f"{entry['ratio']:.2f}x"
+        lines.append(f"{marks[entry['status']]} {entry['method']:>32} {baseline:>14} "
+                     f"{entry['current_ms']:>13.3f} {ratio:>7}")
+    regressions = sum(1 for entry in report if entry['status'] == 'regression')
+    lines.append(f"{len(report)} methods compared, {regressions} regression(s)")
+    return "\n".join(lines)
+
+
+def load_results(path: str) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_results(results: Dict, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+
+def generate_command(args) -> int:
+    """Write a seeded database at --scale to --output"""
+    if os.path.exists(args.output):
+        print(f"✗ {args.output} already exists")
+        return 1
+    db = generate(args.output, args.scale, args.seed)
+    db.close()
+    print(f"✓ Generated {args.output} (scale {args.scale}, seed {args.seed})")
+    return 0
+
+
+def run_command(args) -> int:
+    """Time every case and save the results as JSON"""
+    missing = uncovered_methods()
+    if missing:
+        print(f"! Not benchmarked: {', '.join(missing)}")
+    interactive = sys.stdout.isatty()
+    results = run_suite(args.scale, args.db, args.seed, args.repeat,
+                        progress=lambda name: interactive and print(f"  {name}...".ljust(40), end="\r", flush=True))
+    if interactive:
+        print(" " * 40, end="\r")
+    print(format_results(results))
+    output = args.output or f"benchmark-{args.scale}.json"
+    save_results(results, output)
+    print(f"✓ Results saved to {output}")
+    if args.baseline:
+        return compare_command(argparse.Namespace(baseline=args.baseline, current=output,
+                                                  tolerance=args.tolerance, min_delta=args.min_delta))
+    return 0
+
+
+def compare_command(args) -> int:
+    """Flag methods slower than the baseline; exit status 1 on regressions"""
+    baseline, current = load_results(args.baseline), load_results(args.current)
+    for key in ('scale', 'database', 'seed'):
+        if baseline.get(key) != current.get(key):
+            print(f"✗ Cannot compare: {key} differs ({baseline.get(key)} vs {current.get(key)})")
+            return 2
+    report = compare_results(baseline, current, args.tolerance, args.min_delta)
+    print(format_comparison(report))
+    return 1 if any(entry['status'] == 'regression' for entry in report) else 0
+
+
+def main(argv=None) -> int:
+    """Parse arguments and run the requested command"""
+    parser = argparse.ArgumentParser(description="Rental Management System benchmark suite")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = commands.add_parser("generate", help="write a seeded database")
+    generate_parser.add_argument("--scale", default="1k", help=f"{', '.join(SCALES)} or a renter count")
+    generate_parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    generate_parser.add_argument("--output", required=True, help="database file to create")
+    generate_parser.set_defaults(func=generate_command)
+
+    run_parser = commands.add_parser("run", help="time every DatabaseHandler method")
+    run_parser.add_argument("--scale", default="1k", help=f"{', '.join(SCALES)} or a renter count")
+    run_parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    run_parser.add_argument("--db", help="benchmark a copy of this database instead of generating one")
+    run_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="runs per method")
+    run_parser.add_argument("--output", help="results file (default benchmark-SCALE.json)")
+    run_parser.add_argument("--baseline", help="compare the results with this results file")
+    run_parser.set_defaults(func=run_command)
+
+    compare_parser = commands.add_parser("compare", help="flag regressions against a baseline")
+    compare_parser.add_argument("baseline", help="baseline results file")
+    compare_parser.add_argument("current", help="results file to check")
+    compare_parser.set_defaults(func=compare_command)
+
+    for command_parser in (run_parser, compare_parser):
+        command_parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                                    help="allowed slowdown of the median (0.25 = 25%%)")
+        command_parser.add_argument("--min-delta", type=float, default=MIN_DELTA_MS,
+                                    help="ignore slowdowns smaller than this many milliseconds")
+    args = parser.parse_args(argv)
+    try:
+        scale_renters(getattr(args, 'scale', '1k'))
+    except ValueError as e:
+        parser.error(str(e))
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
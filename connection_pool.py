@@ -0,0 +1,80 @@
+"""
+Connection Pool for Rental Management System
+One read connection per thread plus a single writer connection serialised by a lock
+"""
+
+import sqlite3
+import threading
+from typing import Callable, List, Optional
+
+
+class ConnectionPool:
+    """Hands out SQLite connections so that several threads can use one database.
+
+    Every thread gets its own read-only connection (created on first use); all writes
+    go through the writer connection while holding write_lock. The monitor connection,
+    used under monitor_lock, watches for commits without waiting for writers. An
+    in-memory database cannot be shared between connections, so it uses the writer
+    for everything and has no monitor.
+    """
+
+    def __init__(self, db_name: str, configure: Optional[Callable[[sqlite3.Connection, bool], None]] = None):
+        """Open the writer connection; configure(connection, is_writer) sets up each new connection"""
+        self.db_name = db_name
+        self.configure = configure
+        self.shared = db_name == ":memory:" or db_name.startswith("file::memory:")
+        self.write_lock = threading.RLock()
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._trace_callback = None
+        self.writer = self._open(is_writer=True)
+        self.monitor_lock = threading.Lock()
+        self.monitor = None if self.shared else self._open(is_writer=False)
+
+    def _open(self, is_writer: bool) -> sqlite3.Connection:
+        """Open and configure a connection usable from any thread"""
+        connection = sqlite3.connect(self.db_name, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        if self.configure:
+            self.configure(connection, is_writer)
+        if not is_writer:
+            connection.execute("PRAGMA query_only = 1")
+        if self._trace_callback:
+            connection.set_trace_callback(self._trace_callback)
+        return connection
+
+    def reader(self) -> sqlite3.Connection:
+        """Read connection of the calling thread"""
+        if self.shared:
+            return self.writer
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._open(is_writer=False)
+            with self._readers_lock:
+                self._readers.append(connection)
+        return connection
+
+    def connections(self) -> List[sqlite3.Connection]:
+        """The writer, the monitor and every read connection opened so far"""
+        with self._readers_lock:
+            readers = list(self._readers)
+        return [self.writer] + ([self.monitor] if self.monitor else []) + readers
+
+    def set_trace_callback(self, callback: Optional[Callable[[str], None]]):
+        """Trace the SQL of every connection, including readers opened later"""
+        self._trace_callback = callback
+        for connection in self.connections():
+            connection.set_trace_callback(callback)
+
+    def close(self):
+        """Close every connection of the pool"""
+        with self._readers_lock:
+            readers, self._readers = self._readers, []
+        for connection in readers:
+            connection.close()
+        self._local = threading.local()
+        if self.monitor:
+            with self.monitor_lock:
+                self.monitor.close()
+        self.writer.close()
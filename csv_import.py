@@ -0,0 +1,233 @@
+"""
+CSV Import for Rental Management System
+Streams products, renters or rentals from a CSV file into the database in chunked
+transactions and writes the rejected rows to an error report
+"""
+
+import csv
+import os
+import sqlite3
+from typing import Callable, Dict, List, Optional
+
+from database import DatabaseHandler, Money, parse_date, to_iso_date
+
+IMPORT_KINDS = ('products', 'renters', 'rentals')
+DEFAULT_CHUNK_SIZE = 2000
+
+# Header columns of each kind: (required, optional). A rentals file names its renter
+# (matched by id_number, then phone) and its product (matched by name) on every row
+IMPORT_COLUMNS = {
+    'products': (('name', 'type', 'rental_price'), ()),
+    'renters': (('full_name',), ('phone', 'email', 'address', 'id_number')),
+    'rentals': (('full_name', 'product_name', 'billing_type', 'rental_price', 'start_date'),
+                ('phone', 'email', 'address', 'id_number', 'product_type', 'product_price',
+                 'end_date', 'acompte', 'escompte', 'payment_status', 'status')),
+}
+
+# Accepted spellings of the enumerated values, the French labels of the UI included
+PRODUCT_TYPES = {'bed': 'bed', 'lit': 'bed',
+                 'equipment': 'equipment', 'équipement': 'equipment', 'equipement': 'equipment'}
+BILLING_TYPES = {'monthly': 'monthly', 'mensuel': 'monthly', 'yearly': 'yearly', 'annuel': 'yearly'}
+PAYMENT_STATUSES = {'paid': 'paid', 'payé': 'paid', 'paye': 'paid',
+                    'unpaid': 'unpaid', 'impayé': 'unpaid', 'impaye': 'unpaid'}
+RENTAL_STATUSES = {'active': 'active', 'actif': 'active',
+                   'returned': 'returned', 'retourné': 'returned', 'retourne': 'returned'}
+
+
+def _text(row: Dict, column: str) -> str:
+    return (row.get(column) or "").strip()
+
+
+def _choice(row: Dict, column: str, choices: Dict, default: str = None) -> Optional[str]:
+    value = _text(row, column)
+    if not value:
+        if default is None:
+            raise ValueError(f"{column} manquant")
+        return default
+    try:
+        return choices[value.lower()]
+    except KeyError:
+        raise ValueError(f"{column} invalide: {value}")
+
+
+def _amount(row: Dict, column: str, required: bool = True, positive: bool = False) -> Optional[Money]:
+    value = _text(row, column)
+    if not value:
+        if required:
+            raise ValueError(f"{column} manquant")
+        return None
+    amount = Money.from_tnd(value)
+    if amount < 0 or (positive and not amount):
+        raise ValueError(f"{column} doit être {'supérieur à' if positive else 'au moins'} 0: {value}")
+    return amount
+
+
+def _date(row: Dict, column: str, required: bool = True) -> Optional[str]:
+    value = _text(row, column)
+    if not value:
+        if required:
+            raise ValueError(f"{column} manquant")
+        return None
+    iso = to_iso_date(value)
+    if not iso:
+        raise ValueError(f"{column} invalide: {value}")
+    return iso
+
+
+def _renter(row: Dict) -> Dict:
+    full_name = _text(row, 'full_name')
+    if not full_name:
+        raise ValueError("full_name manquant")
+    return {'full_name': full_name, 'phone': _text(row, 'phone'), 'email': _text(row, 'email'),
+            'address': _text(row, 'address'), 'id_number': _text(row, 'id_number')}
+
+
+def parse_row(kind: str, row: Dict) -> Dict:
+    """Validated record of a CSV row (ValueError with the reason otherwise)"""
+    if kind == 'products':
+        name = _text(row, 'name')
+        if not name:
+            raise ValueError("name manquant")
+        return {'name': name, 'type': _choice(row, 'type', PRODUCT_TYPES),
+                'rental_price': _amount(row, 'rental_price', positive=True)}
+    if kind == 'renters':
+        return _renter(row)
+
+    product_name = _text(row, 'product_name')
+    if not product_name:
+        raise ValueError("product_name manquant")
+    rental = {
+        'billing_type': _choice(row, 'billing_type', BILLING_TYPES),
+        'rental_price': _amount(row, 'rental_price', positive=True),
+        'start_date': _date(row, 'start_date'),
+        'end_date': _date(row, 'end_date', required=False),
+        'acompte': _amount(row, 'acompte', required=False) or Money(),
+        'escompte': _amount(row, 'escompte', required=False) or Money(),
+        'payment_status': _choice(row, 'payment_status', PAYMENT_STATUSES, 'unpaid'),
+        'status': _choice(row, 'status', RENTAL_STATUSES, 'active'),
+    }
+    if rental['end_date'] and parse_date(rental['end_date']) < parse_date(rental['start_date']):
+        raise ValueError("La date de fin doit être après la date de début")
+    if rental['status'] == 'returned' and not rental['end_date']:
+        raise ValueError("end_date requis pour une location retournée")
+    product_type = _text(row, 'product_type')
+    return {
+        'renter': _renter(row),
+        'product': {'name': product_name,
+                    'type': _choice(row, 'product_type', PRODUCT_TYPES) if product_type else None,
+                    'rental_price': _amount(row, 'product_price', required=False)},
+        'rental': rental,
+    }
+
+
+def _rental_product(record: Dict, known: set) -> Dict:
+    """Product of a rental row; an unknown one is created as a bed at the rental price by default"""
+    product = dict(record['product'])
+    if product['name'] not in known:
+        product['type'] = product['type'] or 'bed'
+        product['rental_price'] = product['rental_price'] or record['rental']['rental_price']
+    return product
+
+
+def _import_records(db: DatabaseHandler, kind: str, records: List[Dict]) -> List[str]:
+    """Write a batch of records in one transaction and return their statuses
+    ('created', 'updated', 'unchanged')"""
+    if kind == 'products':
+        return [status for _, status in db.import_products(records)]
+    if kind == 'renters':
+        return [status for _, status in db.import_renters(records)]
+
+    known = {product['name'] for product in db.get_all_products()}
+    rentals = db.import_rentals([dict(record['rental'], renter=record['renter'],
+                                      product=_rental_product(record, known))
+                                 for record in records])
+    return [status for _, status in rentals]
+
+
+def _sniff_delimiter(header: str) -> str:
+    """';' for files saved by a French Excel, ',' otherwise"""
+    return ';' if header.count(';') > header.count(',') else ','
+
+
+def import_csv(db: DatabaseHandler, path: str, kind: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+               error_path: str = None, progress: Callable[[int, int], Optional[bool]] = None,
+               encoding: str = "utf-8-sig") -> Dict:
+    """Stream a CSV file of products, renters or rentals into the database.
+
+    Rows are validated and written chunk_size at a time, each chunk in one transaction
+    (a failing chunk is retried row by row). Invalid rows are written with their line
+    number and reason to error_path (<file>_errors.csv by default) instead of stopping
+    the import. Existing renters, products and rentals are matched rather than added
+    again, so a file can be imported twice. progress(bytes read, file size) is called
+    after each chunk; returning False stops the import after that chunk.
+
+    Returns the counts of rows, created, updated, unchanged and errors, plus
+    error_report (None without errors) and cancelled.
+    """
+    if kind not in IMPORT_KINDS:
+        raise ValueError(f"Type d'import inconnu: {kind}")
+    if chunk_size < 1:
+        raise ValueError("chunk_size doit être au moins 1")
+    error_path = error_path or os.path.splitext(path)[0] + "_errors.csv"
+    summary = {'kind': kind, 'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'errors': 0,
+               'error_report': None, 'cancelled': False}
+    total_size = os.path.getsize(path)
+    report_file = report = None
+
+    def reject(line: int, row: Dict, error: str):
+        nonlocal report_file, report
+        if report is None:
+            report_file = open(error_path, "w", newline="", encoding="utf-8-sig")
+            report = csv.writer(report_file)
+            report.writerow(['line', 'error'] + list(reader.fieldnames))
+            summary['error_report'] = error_path
+        report.writerow([line, error] + [row.get(column, "") for column in reader.fieldnames])
+        summary['errors'] += 1
+
+    def write(chunk: List[tuple]):
+        try:
+            statuses = _import_records(db, kind, [record for _, _, record in chunk])
+        except (ValueError, sqlite3.Error):
+            # Find the failing rows: one transaction per row
+            statuses = []
+            for line, row, record in chunk:
+                try:
+                    statuses.extend(_import_records(db, kind, [record]))
+                except (ValueError, sqlite3.Error) as e:
+                    reject(line, row, str(e))
+        for status in statuses:
+            summary[status] += 1
+
+    with open(path, newline="", encoding=encoding) as handle:
+        delimiter = _sniff_delimiter(handle.readline())
+        handle.seek(0)
+        reader = csv.DictReader(handle, delimiter=delimiter)
+        header = [column.strip().lower() for column in reader.fieldnames or []]
+        required, optional = IMPORT_COLUMNS[kind]
+        missing = [column for column in required if column not in header]
+        if missing:
+            raise ValueError(f"Colonnes manquantes: {', '.join(missing)}")
+        reader.fieldnames = header
+        try:
+            chunk = []
+            for row in reader:
+                summary['rows'] += 1
+                try:
+                    chunk.append((reader.line_num, row, parse_row(kind, row)))
+                except ValueError as e:
+                    reject(reader.line_num, row, str(e))
+                if len(chunk) >= chunk_size:
+                    write(chunk)
+                    chunk = []
+                    if progress and progress(handle.buffer.tell(), total_size) is False:
+                        summary['cancelled'] = True
+                        break
+            else:
+                if chunk:
+                    write(chunk)
+                if progress:
+                    progress(total_size, total_size)
+        finally:
+            if report_file:
+                report_file.close()
+    return summary
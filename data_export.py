@@ -0,0 +1,190 @@
+"""
+Data Export for Rental Management System
+Streams rentals, tenant totals or payment schedules to a CSV or XLSX file with the
+amounts computed like the Locations and Locataires tables
+"""
+
+import csv
+import os
+from typing import Callable, Dict, Iterator, List, Optional
+
+from database import DatabaseHandler, Money, format_date_display, parse_date
+
+try:
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    HAS_OPENPYXL = True
+except ImportError:  # openpyxl is optional, only the CSV export is available without it
+    Workbook = WriteOnlyCell = None
+    HAS_OPENPYXL = False
+
+EXPORT_KINDS = ('rentals', 'tenants', 'payments')
+EXPORT_FORMATS = ('csv', 'xlsx') if HAS_OPENPYXL else ('csv',)
+DEFAULT_BATCH_SIZE = 500
+
+BILLING_LABELS = {'monthly': 'mensuel', 'yearly': 'annuel'}
+RENTAL_STATUS_LABELS = {'active': 'actif', 'returned': 'retourné'}
+
+# (header, row key, labels of the stored values) of each export, in the order and with
+# the French labels of the tables of MainWindow
+EXPORT_COLUMNS = {
+    'rentals': [
+        ("ID", 'id', None), ("Produit", 'product_name', None), ("Locataire", 'renter_name', None),
+        ("Téléphone", 'renter_phone', None), ("Facturation", 'billing_type', BILLING_LABELS),
+        ("Prix", 'rental_price', None), ("Date Début", 'start_date', None),
+        ("Date Fin", 'end_date', None), ("Statut", 'status', RENTAL_STATUS_LABELS),
+        ("Payé", 'payment_status', {'paid': 'payée', 'unpaid': 'impayée'}),
+        ("Périodes", 'periods', None), ("Total Brut", 'total_brut', None),
+        ("Acompte", 'acompte', None), ("Escompte", 'escompte', None), ("Reste", 'reste', None),
+        ("Total Net", 'total_to_pay', None), ("Montant Reçu", 'total_received', None),
+        ("Montant Dû", 'still_owed', None),
+    ],
+    'tenants': [
+        ("Locataire", 'renter_name', None), ("Téléphone", 'renter_phone', None),
+        ("Statut Paiement", 'payment_status', None), ("Total Locations", 'total_rentals', None),
+        ("Locations Payées", 'paid_rentals', None), ("Locations Impayées", 'unpaid_rentals', None),
+        ("Montant Reçu", 'total_received', None), ("Montant Dû", 'total_owed', None),
+        ("Montant Total", 'total_amount', None),
+    ],
+    'payments': [
+        ("Location", 'rental_id', None), ("Produit", 'product_name', None),
+        ("Locataire", 'renter_name', None), ("Téléphone", 'renter_phone', None),
+        ("Mois", 'payment_month', None), ("Échéance", 'payment_date', None),
+        ("Montant", 'amount', None), ("Statut", 'status', {'paid': 'payé', 'unpaid': 'impayé'}),
+        ("Notes", 'notes', None),
+    ],
+}
+
+SHEET_TITLES = {'rentals': "Locations", 'tenants': "Locataires", 'payments': "Échéancier"}
+DATE_COLUMNS = frozenset({'start_date', 'end_date', 'payment_date'})
+
+
+class CsvExportWriter:
+    """Rows written as they come to a ';' separated UTF-8 file with decimal commas,
+    as a French Excel opens it (and as csv_import reads it back)"""
+
+    def __init__(self, path: str, headers: List[str], keys: List[str], title: str = None):
+        self.keys = keys
+        self.file = open(path, "w", newline="", encoding="utf-8-sig")
+        self.writer = csv.writer(self.file, delimiter=';')
+        self.writer.writerow(headers)
+
+    def write(self, values: List):
+        row = []
+        for key, value in zip(self.keys, values):
+            if value is None:
+                value = ""
+            elif isinstance(value, Money):
+                value = f"{value:.3f}".replace(".", ",")
+            elif key in DATE_COLUMNS:
+                value = format_date_display(value)
+            row.append(value)
+        self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+    def discard(self):
+        """Stop writing and delete the partial file"""
+        self.file.close()
+        os.remove(self.file.name)
+
+
+class XlsxExportWriter:
+    """Rows streamed to a write-only openpyxl workbook: amounts as numbers, dates as dates"""
+
+    def __init__(self, path: str, headers: List[str], keys: List[str], title: str = None):
+        if not HAS_OPENPYXL:
+            raise RuntimeError("Export XLSX indisponible: installez openpyxl")
+        self.keys = keys
+        self.path = path
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet(title)
+        self.sheet.append(headers)
+
+    def write(self, values: List):
+        row = []
+        for key, value in zip(self.keys, values):
+            if isinstance(value, Money):
+                value = WriteOnlyCell(self.sheet, value=float(value))
+                value.number_format = '0.000'
+            elif key in DATE_COLUMNS and value:
+                value = WriteOnlyCell(self.sheet, value=parse_date(value))
+                value.number_format = 'DD/MM/YYYY'
+            row.append(value)
+        self.sheet.append(row)
+
+    def close(self):
+        self.workbook.save(self.path)
+
+    def discard(self):
+        """Stop writing: nothing is written to path before close()"""
+        self.workbook = None
+
+
+EXPORT_WRITERS = {'csv': CsvExportWriter, 'xlsx': XlsxExportWriter}
+
+
+def export_format(path: str) -> str:
+    """Format of an export file from its extension ('xlsx' or 'csv')"""
+    return 'xlsx' if path.lower().endswith('.xlsx') else 'csv'
+
+
+def _export_rows(db: DatabaseHandler, kind: str, batch_size: int) -> Iterator[Dict]:
+    if kind == 'rentals':
+        return db.iter_rentals_with_financials(batch_size)
+    if kind == 'tenants':
+        return db.iter_tenant_totals(batch_size)
+    return db.iter_payment_schedules(batch_size)
+
+
+def export_data(db: DatabaseHandler, path: str, kind: str, file_format: str = None,
+                batch_size: int = DEFAULT_BATCH_SIZE,
+                progress: Callable[[int, int], Optional[bool]] = None) -> Dict:
+    """Write rentals, tenant totals or payment schedules to a CSV or XLSX file.
+
+    Rows are streamed from the database batch_size at a time and written as they come,
+    rentals with the amounts of _calculate_rental_amounts and tenants with those of
+    get_tenant_totals, so the file matches the screen. file_format defaults to the
+    extension of path. progress(done, total) is called after each batch, counting
+    rentals (tenants for the tenants export); returning False stops the export and
+    deletes the partial file.
+
+    Returns the kind, path, number of rows written and whether it was cancelled.
+    """
+    if kind not in EXPORT_KINDS:
+        raise ValueError(f"Type d'export inconnu: {kind}")
+    file_format = file_format or export_format(path)
+    if file_format not in EXPORT_WRITERS:
+        raise ValueError(f"Format d'export inconnu: {file_format}")
+    columns = EXPORT_COLUMNS[kind]
+    total = db.get_dashboard_stats()['total_renters'] if kind == 'tenants' else db.count_rentals()
+    summary = {'kind': kind, 'path': path, 'rows': 0, 'cancelled': False}
+
+    writer = EXPORT_WRITERS[file_format](path, [header for header, _, _ in columns],
+                                         [key for _, key, _ in columns], SHEET_TITLES[kind])
+    try:
+        done = 0
+        last_rental = None
+        for row in _export_rows(db, kind, batch_size):
+            writer.write([labels.get(row[key], row[key]) if labels else row[key]
+                          for _, key, labels in columns])
+            summary['rows'] += 1
+            # Payment rows advance the progress once per rental
+            if kind != 'payments':
+                done += 1
+            elif row['rental_id'] != last_rental:
+                done, last_rental = done + 1, row['rental_id']
+            if progress and summary['rows'] % batch_size == 0 and progress(done, total) is False:
+                summary['cancelled'] = True
+                break
+    except BaseException:
+        writer.discard()
+        raise
+    if summary['cancelled']:
+        writer.discard()
+        return summary
+    writer.close()
+    if progress:
+        progress(total, total)
+    return summary
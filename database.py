@@ -4,11 +4,28 @@ Manages all database operations using SQLite
 """
 
 import sqlite3
+import base64
+import json
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Iterable, Iterator, Callable
 import os
+import re
 import calendar
-import shutil
+import heapq
+import numbers
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import lru_cache, partial
+from itertools import islice
+
+from backup_manager import BackupManager
+from connection_pool import ConnectionPool
+from financial_engine import HAS_NUMPY, compute_rental_amounts_from_rows
+from instrumentation import (DEFAULT_SLOW_QUERY_MS, SLOW_QUERY_LOG_NAME, Instrumentation,
+                             instrumented_methods)
+from picker_index import PickerIndex
 
 
 def parse_date(date_value) -> Optional[datetime]:
@@ -17,9 +34,20 @@ def parse_date(date_value) -> Optional[datetime]:
         return None
     if isinstance(date_value, datetime):
         return date_value.replace(hour=0, minute=0, second=0, microsecond=0)
-    text = str(date_value).strip()
+    return _parse_date_text(str(date_value))
+
+
+@lru_cache(maxsize=4096)
+def _parse_date_text(text: str) -> Optional[datetime]:
+    """Memoised parse_date for strings: ISO dates take the fromisoformat fast path."""
+    text = text.strip()
     if not text:
         return None
+    if len(text) >= 10 and text[4] == '-' and text[7] == '-':
+        try:
+            return datetime.fromisoformat(text[:10])
+        except ValueError:
+            pass
     # Strip time portion if present (SQLite TIMESTAMP)
     if ' ' in text:
         text = text.split(' ')[0]
@@ -33,10 +61,20 @@ def parse_date(date_value) -> Optional[datetime]:
     return None
 
 
+def to_iso_date(date_value) -> Optional[str]:
+    """Canonical YYYY-MM-DD form of a date as stored in the database (None when empty)."""
+    if date_value is None or (isinstance(date_value, str) and not date_value.strip()):
+        return None
+    parsed = parse_date(date_value)
+    if not parsed:
+        raise ValueError(f"Date invalide: {date_value}")
+    return parsed.strftime("%Y-%m-%d")
+
+
 def format_date_display(date_value) -> str:
     """Format date for French UI display (DD/MM/YYYY)."""
     parsed = parse_date(date_value)
-    return parsed.strftime("%d/%m/%Y") if parsed else ""
+    return f"{parsed.day:02d}/{parsed.month:02d}/{parsed.year:04d}" if parsed else ""
 
 
 def format_datetime_display(date_value) -> str:
@@ -78,44 +116,1326 @@ def count_billing_periods(start_date: datetime, end_date: datetime, billing_type
     return max(1, years)
 
 
+BILLING_STEPS = {'monthly': 1, 'yearly': 12}
+
+
+def schedule_dates(start_date: datetime, end_date: datetime, billing_type: str,
+                   first_period: int = 0) -> Iterator[datetime]:
+    """Due dates of the billing periods from start_date up to end_date (inclusive).
+    
+    Period n falls n months (or years) after start_date, clamped to the end of shorter
+    months; first_period skips the earlier periods.
+    """
+    step = BILLING_STEPS.get(billing_type)
+    if step is None:
+        return
+    period = max(0, first_period)
+    current_date = add_months(start_date, period * step)
+    while current_date <= end_date:
+        yield current_date
+        period += 1
+        current_date = add_months(start_date, period * step)
+
+
+class Money:
+    """Exact amount of money, held as an integer number of millimes (1 TND = 1000).
+    
+    The amount columns store millimes (see MONEY_COLUMNS) and are read back as Money.
+    Plain numbers are amounts in TND: Money.from_tnd(12.5) == Money(12500) == 12.5.
+    Money formats like a float (f"{amount:.3f} TND") and adds up without rounding drift.
+    """
+    
+    __slots__ = ('millimes',)
+    
+    def __init__(self, millimes: int = 0):
+        self.millimes = int(millimes)
+    
+    @classmethod
+    def from_tnd(cls, value) -> "Money":
+        """Money from an amount in TND (number or text such as "12,500"), to the nearest millime"""
+        if isinstance(value, Money):
+            return value
+        if isinstance(value, str):
+            value = value.strip().replace(' ', '').replace(',', '.')
+        try:
+            amount = Decimal(str(value) if isinstance(value, float) else value)
+        except (InvalidOperation, TypeError, ValueError):
+            raise ValueError(f"Montant invalide: {value}")
+        if not amount.is_finite():
+            raise ValueError(f"Montant invalide: {value}")
+        return cls(int((amount * 1000).to_integral_value(ROUND_HALF_UP)))
+    
+    @property
+    def tnd(self) -> Decimal:
+        """Exact amount in TND"""
+        return Decimal(self.millimes).scaleb(-3)
+    
+    def _scaled(self, factor: Decimal) -> "Money":
+        """self * factor, rounded to the nearest millime"""
+        return Money(int((self.millimes * factor).to_integral_value(ROUND_HALF_UP)))
+    
+    def __add__(self, other):
+        other = _as_money(other)
+        return NotImplemented if other is None else Money(self.millimes + other.millimes)
+    
+    __radd__ = __add__
+    
+    def __sub__(self, other):
+        other = _as_money(other)
+        return NotImplemented if other is None else Money(self.millimes - other.millimes)
+    
+    def __rsub__(self, other):
+        other = _as_money(other)
+        return NotImplemented if other is None else Money(other.millimes - self.millimes)
+    
+    def __mul__(self, factor):
+        if isinstance(factor, numbers.Integral) and not isinstance(factor, bool):
+            return Money(self.millimes * int(factor))
+        factor = _as_decimal(factor)
+        return NotImplemented if factor is None else self._scaled(factor)
+    
+    __rmul__ = __mul__
+    
+    def __truediv__(self, divisor):
+        divisor = _as_decimal(divisor)
+        return NotImplemented if divisor is None else self._scaled(1 / divisor)
+    
+    def __neg__(self):
+        return Money(-self.millimes)
+    
+    def __abs__(self):
+        return Money(abs(self.millimes))
+    
+    def __bool__(self):
+        return self.millimes != 0
+    
+    def __float__(self):
+        return self.millimes / 1000
+    
+    def __eq__(self, other):
+        other = _as_money(other)
+        return NotImplemented if other is None else self.millimes == other.millimes
+    
+    def __lt__(self, other):
+        other = _as_money(other)
+        return NotImplemented if other is None else self.millimes < other.millimes
+    
+    def __le__(self, other):
+        other = _as_money(other)
+        return NotImplemented if other is None else self.millimes <= other.millimes
+    
+    def __gt__(self, other):
+        other = _as_money(other)
+        return NotImplemented if other is None else self.millimes > other.millimes
+    
+    def __ge__(self, other):
+        other = _as_money(other)
+        return NotImplemented if other is None else self.millimes >= other.millimes
+    
+    def __hash__(self):
+        return hash(self.tnd)
+    
+    def __format__(self, spec: str) -> str:
+        return format(self.tnd, spec) if spec else str(self)
+    
+    def __str__(self):
+        return f"{self.tnd:.3f}"
+    
+    def __repr__(self):
+        return f"Money('{self}')"
+
+
+def _as_decimal(value) -> Optional[Decimal]:
+    """Exact Decimal of a real number (floats by their shortest str), None for other types"""
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, numbers.Real) and not isinstance(value, bool):
+        return Decimal(str(value)) if isinstance(value, float) else Decimal(int(value))
+    return None
+
+
+def _as_money(value) -> Optional[Money]:
+    """Money of an operand (a number is an amount in TND), None for other types"""
+    if isinstance(value, Money):
+        return value
+    value = _as_decimal(value)
+    return None if value is None else Money.from_tnd(value)
+
+
+sqlite3.register_adapter(Money, lambda money: money.millimes)
+
+# Columns (and report aliases) holding amounts in millimes, read back as Money
+MONEY_COLUMNS = frozenset({
+    'rental_price', 'acompte', 'escompte', 'amount', 'total_income',
+    'total_paid', 'total_expected', 'total_received', 'total_owed', 'total_amount', 'still_owed',
+})
+
+
+def money_row_factory() -> Callable[[sqlite3.Cursor, tuple], sqlite3.Row]:
+    """Row factory of a connection: sqlite3.Row with the MONEY_COLUMNS integers as Money"""
+    last = [None, ()]
+    
+    def factory(cursor: sqlite3.Cursor, row: tuple) -> sqlite3.Row:
+        description = cursor.description
+        if description is not last[0]:
+            last[0] = description
+            last[1] = tuple(index for index, column in enumerate(description)
+                            if column[0] in MONEY_COLUMNS)
+        if last[1]:
+            values = list(row)
+            for index in last[1]:
+                value = values[index]
+                if value.__class__ is int:
+                    values[index] = Money(value)
+            row = tuple(values)
+        return sqlite3.Row(cursor, row)
+    return factory
+
+
+# Schema of version 1 of the database (tables, first indexes and report views);
+# later versions are reached through DatabaseHandler.MIGRATIONS
+SCHEMA_SQL = """
+-- Table: products
+-- Stores information about beds and equipment available for rent
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL CHECK(type IN ('bed', 'equipment')),
+    rental_price REAL NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Table: renters
+-- Stores information about people renting products
+CREATE TABLE IF NOT EXISTS renters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    full_name TEXT NOT NULL,
+    phone TEXT,
+    email TEXT,
+    address TEXT,
+    id_number TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Table: rentals
+-- Stores rental agreements
+CREATE TABLE IF NOT EXISTS rentals (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id INTEGER NOT NULL,
+    renter_id INTEGER NOT NULL,
+    billing_type TEXT NOT NULL CHECK(billing_type IN ('monthly', 'yearly')),
+    rental_price REAL NOT NULL,
+    start_date DATE NOT NULL,
+    end_date DATE,
+    status TEXT NOT NULL DEFAULT 'active' CHECK(status IN ('active', 'returned')),
+    payment_status TEXT NOT NULL DEFAULT 'unpaid' CHECK(payment_status IN ('paid', 'unpaid')),
+    acompte REAL NOT NULL DEFAULT 0,
+    escompte REAL NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE,
+    FOREIGN KEY (renter_id) REFERENCES renters(id) ON DELETE CASCADE
+);
+
+-- Table: payments
+-- Tracks monthly/yearly payments for each rental
+CREATE TABLE IF NOT EXISTS payments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    rental_id INTEGER NOT NULL,
+    payment_date DATE NOT NULL,
+    amount REAL NOT NULL,
+    payment_month TEXT NOT NULL, -- Format: YYYY-MM
+    status TEXT NOT NULL DEFAULT 'unpaid' CHECK(status IN ('paid', 'unpaid')),
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (rental_id) REFERENCES rentals(id) ON DELETE CASCADE
+);
+
+-- Indexes for better performance
+CREATE INDEX IF NOT EXISTS idx_rentals_status ON rentals(status);
+CREATE INDEX IF NOT EXISTS idx_rentals_dates ON rentals(start_date, end_date);
+CREATE INDEX IF NOT EXISTS idx_payments_status ON payments(status);
+CREATE INDEX IF NOT EXISTS idx_payments_rental ON payments(rental_id);
+CREATE INDEX IF NOT EXISTS idx_payments_month ON payments(payment_month);
+
+-- Views for reporting
+CREATE VIEW IF NOT EXISTS active_rentals AS
+SELECT 
+    r.id as rental_id,
+    p.name as product_name,
+    p.type as product_type,
+    rn.full_name as renter_name,
+    rn.phone as renter_phone,
+    r.billing_type,
+    r.rental_price,
+    r.start_date,
+    r.end_date,
+    r.status
+FROM rentals r
+JOIN products p ON r.product_id = p.id
+JOIN renters rn ON r.renter_id = rn.id
+WHERE r.status = 'active';
+
+CREATE VIEW IF NOT EXISTS unpaid_payments AS
+SELECT 
+    py.id as payment_id,
+    py.rental_id,
+    p.name as product_name,
+    rn.full_name as renter_name,
+    rn.phone as renter_phone,
+    py.payment_month,
+    py.amount,
+    py.payment_date
+FROM payments py
+JOIN rentals r ON py.rental_id = r.id
+JOIN products p ON r.product_id = p.id
+JOIN renters rn ON r.renter_id = rn.id
+WHERE py.status = 'unpaid'
+ORDER BY py.payment_month;
+"""
+
+# SQLite pragmas applied at connect time, selected by name
+# (cache_size is in KiB when negative, mmap_size in bytes, busy_timeout in ms)
+STORAGE_PROFILES = {
+    'safe': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'cache_size': -8000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 5000,
+    },
+    'balanced': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -32000,
+        'mmap_size': 64 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+    'fast-bulk': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -128000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 10000,
+    },
+}
+# The default keeps every commit on disk through a power failure. 'balanced' trades the
+# last commits before a crash (WAL, synchronous=NORMAL) for faster writes and readers
+# that never wait for the writer, and has to be chosen explicitly
+DEFAULT_STORAGE_PROFILE = 'safe'
+STORAGE_PROFILE_ENV = 'RENTAL_DB_PROFILE'
+
+# Setting this environment variable to a threshold in milliseconds turns instrumentation on
+SLOW_QUERY_ENV = 'RENTAL_DB_SLOW_QUERY_MS'
+
+# Dashboard counters kept up to date by triggers (single row, id = 1)
+STATS_COUNTERS_SQL = """
+CREATE TABLE IF NOT EXISTS stats_counters (
+    id INTEGER PRIMARY KEY CHECK(id = 1),
+    total_products INTEGER NOT NULL DEFAULT 0,
+    total_renters INTEGER NOT NULL DEFAULT 0,
+    active_rentals INTEGER NOT NULL DEFAULT 0,
+    paid_rentals INTEGER NOT NULL DEFAULT 0,
+    unpaid_rentals INTEGER NOT NULL DEFAULT 0,
+    unpaid_count INTEGER NOT NULL DEFAULT 0,
+    total_income REAL NOT NULL DEFAULT 0
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_stats_products_insert AFTER INSERT ON products BEGIN
+    UPDATE stats_counters SET total_products = total_products + 1 WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_stats_products_delete AFTER DELETE ON products BEGIN
+    UPDATE stats_counters SET total_products = total_products - 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stats_renters_insert AFTER INSERT ON renters BEGIN
+    UPDATE stats_counters SET total_renters = total_renters + 1 WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_stats_renters_delete AFTER DELETE ON renters BEGIN
+    UPDATE stats_counters SET total_renters = total_renters - 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stats_rentals_insert AFTER INSERT ON rentals BEGIN
+    UPDATE stats_counters SET
+        active_rentals = active_rentals + (NEW.status = 'active'),
+        paid_rentals = paid_rentals + (NEW.status = 'active' AND NEW.payment_status = 'paid'),
+        unpaid_rentals = unpaid_rentals + (NEW.status = 'active' AND NEW.payment_status = 'unpaid')
+    WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_stats_rentals_delete AFTER DELETE ON rentals BEGIN
+    UPDATE stats_counters SET
+        active_rentals = active_rentals - (OLD.status = 'active'),
+        paid_rentals = paid_rentals - (OLD.status = 'active' AND OLD.payment_status = 'paid'),
+        unpaid_rentals = unpaid_rentals - (OLD.status = 'active' AND OLD.payment_status = 'unpaid')
+    WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_stats_rentals_update
+AFTER UPDATE OF status, payment_status ON rentals BEGIN
+    UPDATE stats_counters SET
+        active_rentals = active_rentals - (OLD.status = 'active') + (NEW.status = 'active'),
+        paid_rentals = paid_rentals
+            - (OLD.status = 'active' AND OLD.payment_status = 'paid')
+            + (NEW.status = 'active' AND NEW.payment_status = 'paid'),
+        unpaid_rentals = unpaid_rentals
+            - (OLD.status = 'active' AND OLD.payment_status = 'unpaid')
+            + (NEW.status = 'active' AND NEW.payment_status = 'unpaid')
+    WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stats_payments_insert AFTER INSERT ON payments BEGIN
+    UPDATE stats_counters SET
+        unpaid_count = unpaid_count + (NEW.status = 'unpaid'),
+        total_income = total_income + (CASE WHEN NEW.status = 'paid' THEN NEW.amount ELSE 0 END)
+    WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_stats_payments_delete AFTER DELETE ON payments BEGIN
+    UPDATE stats_counters SET
+        unpaid_count = unpaid_count - (OLD.status = 'unpaid'),
+        total_income = total_income - (CASE WHEN OLD.status = 'paid' THEN OLD.amount ELSE 0 END)
+    WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_stats_payments_update
+AFTER UPDATE OF status, amount ON payments BEGIN
+    UPDATE stats_counters SET
+        unpaid_count = unpaid_count - (OLD.status = 'unpaid') + (NEW.status = 'unpaid'),
+        total_income = total_income
+            - (CASE WHEN OLD.status = 'paid' THEN OLD.amount ELSE 0 END)
+            + (CASE WHEN NEW.status = 'paid' THEN NEW.amount ELSE 0 END)
+    WHERE id = 1;
+END;
+"""
+
+# Full-text search documents; rowid = entity id * 8 + entity code
+# (renter 1, product 2, rental 3, payment 4) so a document is deleted by rowid
+SEARCH_DOCUMENTS = {
+    # Phones are also indexed as digits only and as the 8-digit national number
+    'renter': """INSERT INTO search_index (rowid, entity_type, entity_id, title, body)
+        SELECT id * 8 + 1, 'renter', id, full_name,
+               COALESCE(phone, '') || ' ' || digits || ' ' || SUBSTR(digits, -8) || ' ' ||
+               COALESCE(email, '') || ' ' || COALESCE(id_number, '') || ' ' || COALESCE(address, '')
+        FROM (SELECT *, REPLACE(REPLACE(REPLACE(COALESCE(phone, ''), ' ', ''), '+', ''), '-', '') AS digits
+              FROM renters)
+        WHERE {where};""",
+    'product': """INSERT INTO search_index (rowid, entity_type, entity_id, title, body)
+        SELECT id * 8 + 2, 'product', id, name, type
+        FROM products WHERE {where};""",
+    'rental': """INSERT INTO search_index (rowid, entity_type, entity_id, title, body)
+        SELECT r.id * 8 + 3, 'rental', r.id, 'Location #' || r.id,
+               p.name || ' - ' || rn.full_name || ' - ' || r.billing_type || ' ' || r.start_date
+        FROM rentals r
+        JOIN products p ON r.product_id = p.id
+        JOIN renters rn ON r.renter_id = rn.id
+        WHERE {where};""",
+    'payment': """INSERT INTO search_index (rowid, entity_type, entity_id, title, body)
+        SELECT py.id * 8 + 4, 'payment', py.id, 'Paiement ' || py.payment_month,
+               py.notes || ' - ' || rn.full_name
+        FROM payments py
+        JOIN rentals r ON py.rental_id = r.id
+        JOIN renters rn ON r.renter_id = rn.id
+        WHERE py.notes IS NOT NULL AND py.notes != '' AND {where};""",
+}
+
+# Bulk inserts set search_sync.deferred and index their rows with one INSERT ... SELECT:
+# FTS5 flushes its pending terms at every statement, so indexing row by row from the
+# insert triggers costs a segment write per row
+SEARCH_INDEX_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    entity_type UNINDEXED, entity_id UNINDEXED, title, body,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+
+CREATE TABLE IF NOT EXISTS search_sync (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    deferred INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO search_sync (id) VALUES (1);
+
+CREATE TRIGGER IF NOT EXISTS trg_search_renters_insert AFTER INSERT ON renters
+WHEN (SELECT deferred FROM search_sync WHERE id = 1) = 0 BEGIN
+    {renter_new}
+END;
+CREATE TRIGGER IF NOT EXISTS trg_search_renters_update AFTER UPDATE ON renters BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 1;
+    {renter_new}
+    DELETE FROM search_index WHERE rowid IN (SELECT id * 8 + 3 FROM rentals WHERE renter_id = NEW.id);
+    {rental_of_renter}
+    DELETE FROM search_index WHERE rowid IN (
+        SELECT py.id * 8 + 4 FROM payments py JOIN rentals r ON py.rental_id = r.id
+        WHERE r.renter_id = NEW.id AND py.notes IS NOT NULL AND py.notes != ''
+    );
+    {payment_of_renter}
+END;
+CREATE TRIGGER IF NOT EXISTS trg_search_renters_delete AFTER DELETE ON renters BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_products_insert AFTER INSERT ON products BEGIN
+    {product_new}
+END;
+CREATE TRIGGER IF NOT EXISTS trg_search_products_update AFTER UPDATE ON products BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 2;
+    {product_new}
+    DELETE FROM search_index WHERE rowid IN (SELECT id * 8 + 3 FROM rentals WHERE product_id = NEW.id);
+    {rental_of_product}
+END;
+CREATE TRIGGER IF NOT EXISTS trg_search_products_delete AFTER DELETE ON products BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 2;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_rentals_insert AFTER INSERT ON rentals
+WHEN (SELECT deferred FROM search_sync WHERE id = 1) = 0 BEGIN
+    {rental_new}
+END;
+CREATE TRIGGER IF NOT EXISTS trg_search_rentals_update
+AFTER UPDATE OF product_id, renter_id, billing_type, start_date ON rentals BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 3;
+    {rental_new}
+END;
+CREATE TRIGGER IF NOT EXISTS trg_search_rentals_delete AFTER DELETE ON rentals BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 3;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_payments_insert AFTER INSERT ON payments
+WHEN NEW.notes IS NOT NULL AND NEW.notes != '' BEGIN
+    {payment_new}
+END;
+CREATE TRIGGER IF NOT EXISTS trg_search_payments_update AFTER UPDATE OF notes ON payments BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 4;
+    {payment_new}
+END;
+CREATE TRIGGER IF NOT EXISTS trg_search_payments_delete AFTER DELETE ON payments BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 4;
+END;
+""".format(
+    renter_new=SEARCH_DOCUMENTS['renter'].format(where="id = NEW.id"),
+    product_new=SEARCH_DOCUMENTS['product'].format(where="id = NEW.id"),
+    rental_new=SEARCH_DOCUMENTS['rental'].format(where="r.id = NEW.id"),
+    rental_of_renter=SEARCH_DOCUMENTS['rental'].format(where="r.renter_id = NEW.id"),
+    rental_of_product=SEARCH_DOCUMENTS['rental'].format(where="r.product_id = NEW.id"),
+    payment_new=SEARCH_DOCUMENTS['payment'].format(where="py.id = NEW.id"),
+    payment_of_renter=SEARCH_DOCUMENTS['payment'].format(where="r.renter_id = NEW.id"),
+)
+
+# Queries recomputing each dashboard counter from the base tables
+# Stored dates are canonical YYYY-MM-DD so that indexes and SQL comparisons order them correctly
+ISO_DATE_GLOB = "[0-9][0-9][0-9][0-9]-[0-1][0-9]-[0-3][0-9]"
+
+ISO_DATE_TRIGGERS_SQL = f"""
+CREATE TRIGGER IF NOT EXISTS trg_rentals_iso_dates_insert BEFORE INSERT ON rentals
+WHEN NEW.start_date NOT GLOB '{ISO_DATE_GLOB}'
+  OR (NEW.end_date IS NOT NULL AND NEW.end_date NOT GLOB '{ISO_DATE_GLOB}')
+BEGIN
+    SELECT RAISE(ABORT, 'Les dates de location doivent être au format AAAA-MM-JJ');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_rentals_iso_dates_update BEFORE UPDATE OF start_date, end_date ON rentals
+WHEN NEW.start_date NOT GLOB '{ISO_DATE_GLOB}'
+  OR (NEW.end_date IS NOT NULL AND NEW.end_date NOT GLOB '{ISO_DATE_GLOB}')
+BEGIN
+    SELECT RAISE(ABORT, 'Les dates de location doivent être au format AAAA-MM-JJ');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_payments_iso_date_insert BEFORE INSERT ON payments
+WHEN NEW.payment_date NOT GLOB '{ISO_DATE_GLOB}'
+BEGIN
+    SELECT RAISE(ABORT, 'Les dates de paiement doivent être au format AAAA-MM-JJ');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_payments_iso_date_update BEFORE UPDATE OF payment_date ON payments
+WHEN NEW.payment_date NOT GLOB '{ISO_DATE_GLOB}'
+BEGIN
+    SELECT RAISE(ABORT, 'Les dates de paiement doivent être au format AAAA-MM-JJ');
+END;
+"""
+
+# Indexes for joins, filters and ORDER BY clauses of the DatabaseHandler queries,
+# keyset pagination included; `python db_tools.py audit-queries` checks the plans stay clean
+INDEXES_SQL = """
+CREATE INDEX IF NOT EXISTS idx_products_name ON products(name);
+CREATE INDEX IF NOT EXISTS idx_renters_name ON renters(full_name);
+CREATE INDEX IF NOT EXISTS idx_rentals_renter ON rentals(renter_id);
+CREATE INDEX IF NOT EXISTS idx_rentals_product ON rentals(product_id);
+CREATE INDEX IF NOT EXISTS idx_rentals_payment_status ON rentals(payment_status, status);
+CREATE INDEX IF NOT EXISTS idx_rentals_created ON rentals(created_at);
+CREATE INDEX IF NOT EXISTS idx_rentals_active_start ON rentals(start_date) WHERE status = 'active';
+CREATE INDEX IF NOT EXISTS idx_rentals_unpaid_active ON rentals(renter_id)
+    WHERE payment_status = 'unpaid' AND status = 'active';
+CREATE INDEX IF NOT EXISTS idx_payments_month ON payments(payment_month);
+CREATE INDEX IF NOT EXISTS idx_payments_rental_month ON payments(rental_id, payment_month);
+CREATE INDEX IF NOT EXISTS idx_payments_unpaid_month ON payments(payment_month) WHERE status = 'unpaid';
+"""
+
+# Indexes of the virtual schedules (version 8): the unpaid listing is keyed on
+# (payment_month, rental_id) and open-ended rentals are found without a table scan
+VIRTUAL_SCHEDULE_INDEXES_SQL = """
+CREATE INDEX IF NOT EXISTS idx_payments_unpaid_month_rental ON payments(payment_month, rental_id)
+    WHERE status = 'unpaid';
+CREATE INDEX IF NOT EXISTS idx_rentals_open_ended ON rentals(start_date)
+    WHERE end_date IS NULL AND status = 'active';
+DROP INDEX IF EXISTS idx_payments_unpaid_month;
+"""
+
+# Billing periods of a rental up to its end date, or :today when it is open-ended, as
+# count_billing_periods counts them; {rental} prefixes the rental columns
+RENTAL_PERIODS_SQL = """CASE
+        WHEN COALESCE({rental}end_date, :today) < {rental}start_date THEN 0
+        WHEN {rental}billing_type = 'monthly' THEN MAX(1,
+            (CAST(substr(COALESCE({rental}end_date, :today), 1, 4) AS INTEGER)
+             - CAST(substr({rental}start_date, 1, 4) AS INTEGER)) * 12
+            + CAST(substr(COALESCE({rental}end_date, :today), 6, 2) AS INTEGER)
+            - CAST(substr({rental}start_date, 6, 2) AS INTEGER)
+            + (substr(COALESCE({rental}end_date, :today), 9, 2) >= substr({rental}start_date, 9, 2)))
+        ELSE MAX(1,
+            CAST(substr(COALESCE({rental}end_date, :today), 1, 4) AS INTEGER)
+            - CAST(substr({rental}start_date, 1, 4) AS INTEGER)
+            + (substr(COALESCE({rental}end_date, :today), 6, 5) >= substr({rental}start_date, 6, 5)))
+    END"""
+
+# Amounts of _calculate_rental_amounts in millimes, for SQL aggregates
+RENTAL_NET_SQL = "MAX(0, {rental}rental_price * (%s) - {rental}escompte)" % RENTAL_PERIODS_SQL
+RENTAL_RECEIVED_SQL = ("CASE WHEN {rental}payment_status = 'paid' THEN %s ELSE {rental}acompte END"
+                       % RENTAL_NET_SQL)
+RENTAL_OWED_SQL = ("CASE WHEN {rental}payment_status = 'paid' THEN 0 ELSE MAX(0, %s - {rental}acompte) END"
+                   % RENTAL_NET_SQL)
+
+# Listings of the Locations and Locataires tables, also streamed by the exporters
+ALL_RENTALS_SQL = """
+SELECT 
+    r.id, r.product_id, r.renter_id, r.billing_type, r.rental_price,
+    r.start_date, r.end_date, r.status, r.payment_status,
+    r.acompte, r.escompte, r.created_at,
+    p.name as product_name, p.type as product_type,
+    rn.full_name as renter_name, rn.phone as renter_phone
+FROM rentals r
+JOIN products p ON r.product_id = p.id
+JOIN renters rn ON r.renter_id = rn.id
+ORDER BY r.created_at DESC
+"""
+
+# Exact integer sums of every active rental, grouped per tenant by SQLite
+TENANT_TOTALS_SQL = f"""
+SELECT rn.id AS renter_id, rn.full_name AS renter_name, rn.phone AS renter_phone,
+       COALESCE(t.total_rentals, 0) AS total_rentals,
+       COALESCE(t.paid_rentals, 0) AS paid_rentals,
+       COALESCE(t.unpaid_rentals, 0) AS unpaid_rentals,
+       COALESCE(t.total_received, 0) AS total_received,
+       COALESCE(t.total_owed, 0) AS total_owed
+FROM renters rn
+LEFT JOIN (
+    SELECT renter_id, COUNT(*) AS total_rentals,
+           SUM(payment_status = 'paid') AS paid_rentals,
+           SUM(payment_status = 'unpaid') AS unpaid_rentals,
+           SUM({RENTAL_RECEIVED_SQL.format(rental="")}) AS total_received,
+           SUM({RENTAL_OWED_SQL.format(rental="")}) AS total_owed
+    FROM rentals
+    WHERE status = 'active'
+    GROUP BY renter_id
+) t ON t.renter_id = rn.id
+ORDER BY rn.full_name, rn.id
+"""
+
+# Rentals by id after a given id, with what their payment schedule rows are exported with
+SCHEDULE_RENTALS_SQL = """
+SELECT r.id, r.billing_type, r.rental_price, r.start_date, r.end_date,
+       p.name as product_name, rn.full_name as renter_name, rn.phone as renter_phone
+FROM rentals r
+JOIN products p ON r.product_id = p.id
+JOIN renters rn ON r.renter_id = rn.id
+WHERE r.id > ?
+ORDER BY r.id
+LIMIT ?
+"""
+
+# Number of periods of a virtual schedule up to a horizon, with the closed form of
+# schedule_dates; {rental} prefixes the rental columns and {year}, {month}, {day},
+# {last_day} (last day of that month) and {horizon_date} describe the horizon
+VIRTUAL_PERIODS_SQL = """CASE
+        WHEN {rental}billing_type = 'monthly' THEN MAX(0,
+            ({year} - CAST(substr({rental}start_date, 1, 4) AS INTEGER)) * 12
+            + {month} - CAST(substr({rental}start_date, 6, 2) AS INTEGER)
+            + (MIN(CAST(substr({rental}start_date, 9, 2) AS INTEGER), {last_day}) <= {day}))
+        WHEN {rental}billing_type = 'yearly' THEN MAX(0,
+            {year} - CAST(substr({rental}start_date, 1, 4) AS INTEGER)
+            + (CAST(substr({rental}start_date, 6, 2) AS INTEGER) < {month}
+               OR (CAST(substr({rental}start_date, 6, 2) AS INTEGER) = {month}
+                   AND MIN(CAST(substr({rental}start_date, 9, 2) AS INTEGER), {last_day}) <= {day})))
+        ELSE 0 END"""
+
+# Unpaid periods a rental adds to the virtual schedules: its periods up to the horizon
+# minus its stored (paid or annotated) ones, for active open-ended rentals only
+VIRTUAL_UNPAID_SQL = """CASE WHEN {rental}end_date IS NULL AND {rental}status = 'active' THEN
+        """ + VIRTUAL_PERIODS_SQL + """
+        - (SELECT COUNT(*) FROM payments
+           WHERE rental_id = {rental}id AND payment_date <= {horizon_date})
+    ELSE 0 END"""
+
+_HORIZON_PARAMETERS = {name: f":{name}" for name in ('year', 'month', 'day', 'last_day', 'horizon_date')}
+_HORIZON_COLUMNS = {name: f"virtual_schedule_state.{name}"
+                    for name in ('year', 'month', 'day', 'last_day', 'horizon_date')}
+
+# Unpaid periods of all virtual schedules up to a horizon given as parameters
+VIRTUAL_UNPAID_COUNT_SQL = """
+SELECT COALESCE(SUM({unpaid}), 0) FROM rentals
+WHERE end_date IS NULL AND status = 'active'
+""".format(unpaid=VIRTUAL_UNPAID_SQL.format(rental="rentals.", **_HORIZON_PARAMETERS))
+
+# Whether a stored payment replaces a period of the virtual schedule of an active rental
+VIRTUAL_STORED_PERIOD_SQL = """({payment}.payment_date <= virtual_schedule_state.horizon_date AND EXISTS (
+        SELECT 1 FROM rentals
+        WHERE id = {payment}.rental_id AND end_date IS NULL AND status = 'active'))"""
+
+# Trigger-maintained count of the unpaid periods of virtual schedules (version 10).
+# The row holds the horizon the count was computed for; the first write transaction
+# after the horizon moves (every day) recounts it and the triggers keep it exact in between.
+VIRTUAL_SCHEDULE_STATE_SQL = """
+CREATE TABLE IF NOT EXISTS virtual_schedule_state (
+    id INTEGER PRIMARY KEY CHECK(id = 1),
+    horizon_date TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    last_day INTEGER NOT NULL,
+    unpaid_count INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_virtual_rentals_insert AFTER INSERT ON rentals
+WHEN NEW.end_date IS NULL AND NEW.status = 'active' BEGIN
+    UPDATE virtual_schedule_state SET unpaid_count = unpaid_count + {new_unpaid} WHERE id = 1;
+END;
+-- Before the delete, while the rental's payments are still there
+CREATE TRIGGER IF NOT EXISTS trg_virtual_rentals_delete BEFORE DELETE ON rentals
+WHEN OLD.end_date IS NULL AND OLD.status = 'active' BEGIN
+    UPDATE virtual_schedule_state SET unpaid_count = unpaid_count - {old_unpaid} WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_virtual_rentals_update
+AFTER UPDATE OF billing_type, start_date, end_date, status ON rentals
+WHEN OLD.end_date IS NULL OR NEW.end_date IS NULL BEGIN
+    UPDATE virtual_schedule_state SET unpaid_count = unpaid_count - {old_unpaid} + {new_unpaid}
+    WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_virtual_payments_insert AFTER INSERT ON payments BEGIN
+    UPDATE virtual_schedule_state SET unpaid_count = unpaid_count - {new_stored} WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_virtual_payments_delete AFTER DELETE ON payments BEGIN
+    UPDATE virtual_schedule_state SET unpaid_count = unpaid_count + {old_stored} WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_virtual_payments_update
+AFTER UPDATE OF rental_id, payment_date ON payments BEGIN
+    UPDATE virtual_schedule_state SET unpaid_count = unpaid_count + {old_stored} - {new_stored}
+    WHERE id = 1;
+END;
+""".format(
+    new_unpaid=VIRTUAL_UNPAID_SQL.format(rental="NEW.", **_HORIZON_COLUMNS),
+    old_unpaid=VIRTUAL_UNPAID_SQL.format(rental="OLD.", **_HORIZON_COLUMNS),
+    new_stored=VIRTUAL_STORED_PERIOD_SQL.format(payment="NEW"),
+    old_stored=VIRTUAL_STORED_PERIOD_SQL.format(payment="OLD"),
+)
+
+STATS_COUNTER_QUERIES = {
+    'total_products': "SELECT COUNT(*) FROM products",
+    'total_renters': "SELECT COUNT(*) FROM renters",
+    'active_rentals': "SELECT COUNT(*) FROM rentals WHERE status = 'active'",
+    'paid_rentals': "SELECT COUNT(*) FROM rentals WHERE payment_status = 'paid' AND status = 'active'",
+    'unpaid_rentals': "SELECT COUNT(*) FROM rentals WHERE payment_status = 'unpaid' AND status = 'active'",
+    'unpaid_count': "SELECT COUNT(*) FROM payments WHERE status = 'unpaid'",
+    'total_income': "SELECT COALESCE(SUM(amount), 0) AS total_income FROM payments WHERE status = 'paid'",
+}
+
+
+# Tables of version 12, holding their amounts as integer millimes (see Money) instead of
+# REAL TND; every other column is as before. {table} is the name the table is created under
+MILLIMES_TABLES_SQL = {
+    'products': """CREATE TABLE {table} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL CHECK(type IN ('bed', 'equipment')),
+    rental_price INTEGER NOT NULL CHECK(typeof(rental_price) = 'integer'),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)""",
+    'rentals': """CREATE TABLE {table} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id INTEGER NOT NULL,
+    renter_id INTEGER NOT NULL,
+    billing_type TEXT NOT NULL CHECK(billing_type IN ('monthly', 'yearly')),
+    rental_price INTEGER NOT NULL CHECK(typeof(rental_price) = 'integer'),
+    start_date DATE NOT NULL,
+    end_date DATE,
+    status TEXT NOT NULL DEFAULT 'active' CHECK(status IN ('active', 'returned')),
+    payment_status TEXT NOT NULL DEFAULT 'unpaid' CHECK(payment_status IN ('paid', 'unpaid')),
+    acompte INTEGER NOT NULL DEFAULT 0 CHECK(typeof(acompte) = 'integer'),
+    escompte INTEGER NOT NULL DEFAULT 0 CHECK(typeof(escompte) = 'integer'),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE,
+    FOREIGN KEY (renter_id) REFERENCES renters(id) ON DELETE CASCADE
+)""",
+    'payments': """CREATE TABLE {table} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    rental_id INTEGER NOT NULL,
+    payment_date DATE NOT NULL,
+    amount INTEGER NOT NULL CHECK(typeof(amount) = 'integer'),
+    payment_month TEXT NOT NULL, -- Format: YYYY-MM
+    status TEXT NOT NULL DEFAULT 'unpaid' CHECK(status IN ('paid', 'unpaid')),
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (rental_id) REFERENCES rentals(id) ON DELETE CASCADE
+)""",
+    'stats_counters': """CREATE TABLE {table} (
+    id INTEGER PRIMARY KEY CHECK(id = 1),
+    total_products INTEGER NOT NULL DEFAULT 0,
+    total_renters INTEGER NOT NULL DEFAULT 0,
+    active_rentals INTEGER NOT NULL DEFAULT 0,
+    paid_rentals INTEGER NOT NULL DEFAULT 0,
+    unpaid_rentals INTEGER NOT NULL DEFAULT 0,
+    unpaid_count INTEGER NOT NULL DEFAULT 0,
+    total_income INTEGER NOT NULL DEFAULT 0 CHECK(typeof(total_income) = 'integer')
+)""",
+}
+
+
+# Archive database holding the closed history moved out of rentals and payments by
+# DatabaseHandler.archive_closed_rentals; ATTACHed as "archive" while it is used
+ARCHIVE_DB_NAME = "rental_archive.db"
+ARCHIVE_COLUMNS = {
+    'rentals': ('id', 'product_id', 'renter_id', 'billing_type', 'rental_price', 'start_date',
+                'end_date', 'status', 'payment_status', 'acompte', 'escompte', 'created_at'),
+    'payments': ('id', 'rental_id', 'payment_date', 'amount', 'payment_month', 'status',
+                 'notes', 'created_at'),
+}
+ARCHIVE_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS archive.rentals (
+    id INTEGER PRIMARY KEY,
+    product_id INTEGER NOT NULL,
+    renter_id INTEGER NOT NULL,
+    billing_type TEXT NOT NULL,
+    rental_price INTEGER NOT NULL,
+    start_date DATE NOT NULL,
+    end_date DATE,
+    status TEXT NOT NULL,
+    payment_status TEXT NOT NULL,
+    acompte INTEGER NOT NULL,
+    escompte INTEGER NOT NULL,
+    created_at TIMESTAMP,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS archive.idx_archive_rentals_renter ON rentals(renter_id);
+
+CREATE TABLE IF NOT EXISTS archive.payments (
+    id INTEGER PRIMARY KEY,
+    rental_id INTEGER NOT NULL,
+    payment_date DATE NOT NULL,
+    amount INTEGER NOT NULL,
+    payment_month TEXT NOT NULL,
+    status TEXT NOT NULL,
+    notes TEXT,
+    created_at TIMESTAMP,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS archive.idx_archive_payments_rental ON payments(rental_id, payment_month);
+"""
+
+# What has been archived so far (single row, id = 1); archived_income keeps the paid
+# amounts of the archived payments in the dashboard income
+ARCHIVE_STATE_SQL = """
+CREATE TABLE IF NOT EXISTS archive_state (
+    id INTEGER PRIMARY KEY CHECK(id = 1),
+    archived_rentals INTEGER NOT NULL DEFAULT 0,
+    archived_payments INTEGER NOT NULL DEFAULT 0,
+    archived_income INTEGER NOT NULL DEFAULT 0 CHECK(typeof(archived_income) = 'integer'),
+    last_archived_at TIMESTAMP
+);
+INSERT OR IGNORE INTO archive_state (id) VALUES (1);
+"""
+
+# Closed history: returned rentals ended before the cutoff with no unpaid payment left
+ARCHIVE_CANDIDATES_SQL = """
+SELECT r.id FROM rentals r
+WHERE r.status = 'returned' AND r.end_date < ?
+  AND NOT EXISTS (SELECT 1 FROM payments py WHERE py.rental_id = r.id AND py.status = 'unpaid')
+ORDER BY r.id
+LIMIT ?
+"""
+
+# Renters are matched on their ID number, then on the last 8 digits of their phone (the
+# national number, so "+216 22 333 444" and "22-333-444" match) ignoring spaces, dashes,
+# dots and '+' (import_renters and the expression index below use the same key)
+RENTER_PHONE_KEY_SQL = "SUBSTR(REPLACE(REPLACE(REPLACE(REPLACE(phone, ' ', ''), '-', ''), '.', ''), '+', ''), -8)"
+IMPORT_INDEXES_SQL = f"""
+CREATE INDEX IF NOT EXISTS idx_renters_id_number ON renters(id_number) WHERE id_number <> '';
+CREATE INDEX IF NOT EXISTS idx_renters_phone_key ON renters({RENTER_PHONE_KEY_SQL}) WHERE phone <> '';
+"""
+RENTAL_INSERT_SQL = """INSERT INTO rentals (product_id, renter_id, billing_type, rental_price,
+                       start_date, end_date, status, payment_status, acompte, escompte)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+
+def phone_key(phone: str) -> str:
+    """Phone as compared by import_renters (RENTER_PHONE_KEY_SQL)"""
+    for character in " -.+":
+        phone = phone.replace(character, "")
+    return phone[-8:]
+
+
+class EntityCache:
+    """Bounded LRU cache of product and renter rows with hit/miss counters"""
+    
+    def __init__(self, max_size: int = 2048):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+    
+    def get(self, key):
+        """Return a cached value (or None) and record the hit or miss"""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+    
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entry when full"""
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+    
+    def invalidate(self, kind: str, entity_id: int = None):
+        """Drop one entity (if given) and the cached full list of its kind"""
+        self.entries.pop((kind, entity_id), None)
+        self.entries.pop((kind, 'all'), None)
+        self.invalidations += 1
+    
+    def clear(self):
+        """Drop every entry"""
+        self.entries.clear()
+        self.invalidations += 1
+    
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'size': len(self.entries),
+            'max_size': self.max_size
+        }
+
+
 class DatabaseHandler:
     """Handles all database operations for the rental management system"""
     
-    def __init__(self, db_name: str = "rental_management.db"):
-        """Initialize database connection"""
+    def __init__(self, db_name: str = "rental_management.db", profile: str = None,
+                 archive_path: str = None):
+        """Initialize database connection
+        
+        profile selects one of STORAGE_PROFILES; it defaults to the RENTAL_DB_PROFILE
+        environment variable, then to 'safe'. archive_path is the archive database,
+        rental_archive.db next to the database by default (none for in-memory databases).
+        """
         self.db_name = db_name
+        self.archive_path = archive_path
+        if archive_path is None and db_name != ":memory:" and not db_name.startswith("file::memory:"):
+            self.archive_path = os.path.join(os.path.dirname(os.path.abspath(db_name)), ARCHIVE_DB_NAME)
+        self.profile = profile or os.environ.get(STORAGE_PROFILE_ENV) or DEFAULT_STORAGE_PROFILE
+        if self.profile not in STORAGE_PROFILES:
+            raise ValueError(f"Profil de stockage inconnu: {self.profile}")
+        self.pool = None
         self.connection = None
         self.cursor = None
+        self.cache = EntityCache()
+        self.picker_indexes = {}
+        self._cache_lock = threading.RLock()
+        self._write_depth = 0
+        self._writer_thread = None
+        self._pending_invalidations = []
+        self._data_version = None
+        self._commits = 0
+        self._seen_commits = 0
+        self._has_search_index = None
+        self._trace_callback = None
+        self.instrumentation = None
+        self._virtual_state_ready = False
         self.connect()
         self.create_tables()
+        self._virtual_state_ready = True
+        if self._stale_virtual_horizon(self.cursor):
+            with self._write():
+                pass  # the write block moves virtual_schedule_state to today's horizon
+        if os.environ.get(SLOW_QUERY_ENV):
+            self.enable_instrumentation(float(os.environ[SLOW_QUERY_ENV]))
     
     def connect(self):
-        """Establish database connection"""
+        """Establish database connections.
+        
+        Reads use a connection per thread (see _read_cursor); writes go through the
+        single writer connection, self.connection, one thread at a time (see _write).
+        self.cursor is a writer cursor kept for migrations and maintenance scripts.
+        """
         try:
-            self.connection = sqlite3.connect(self.db_name)
-            self.connection.row_factory = sqlite3.Row
+            self.pool = ConnectionPool(self.db_name, self._configure_connection)
+            self.connection = self.pool.writer
             self.cursor = self.connection.cursor()
         except sqlite3.Error as e:
             print(f"Database connection error: {e}")
             raise
     
+    def _configure_connection(self, connection: sqlite3.Connection, is_writer: bool = True):
+        """Set up a new pooled connection: Money amounts in rows, storage profile pragmas"""
+        connection.row_factory = money_row_factory()
+        self._apply_storage_profile(connection, is_writer)
+    
+    def _apply_storage_profile(self, connection: sqlite3.Connection, is_writer: bool = True):
+        """Apply the pragmas of the selected storage profile to a new connection"""
+        for pragma, value in STORAGE_PROFILES[self.profile].items():
+            # The journal mode is stored in the database file: the writer sets it
+            if pragma == 'journal_mode' and not is_writer:
+                continue
+            connection.execute(f"PRAGMA {pragma} = {value}")
+    
+    def _in_own_transaction(self) -> bool:
+        """Whether the calling thread is inside a write block"""
+        return self._writer_thread == threading.get_ident()
+    
+    def _read_cursor(self) -> sqlite3.Cursor:
+        """New cursor on the calling thread's read connection.
+        
+        Inside a transaction the writing thread reads through the writer instead,
+        so it sees its own uncommitted changes.
+        """
+        if self._in_own_transaction():
+            return self.connection.cursor()
+        return self.pool.reader().cursor()
+    
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Cursor]:
+        """Run a block of writes on the writer connection, one thread at a time.
+        
+        The outermost block opens the transaction, commits it on success and rolls
+        it back on error. Nested blocks (a write method called inside a transaction)
+        run in a savepoint: they are undone on their own when they fail and committed
+        with the outermost block when they succeed.
+        """
+        with self.pool.write_lock:
+            cursor = self.connection.cursor()
+            self._write_depth += 1
+            depth = self._write_depth
+            if depth == 1:
+                self._writer_thread = threading.get_ident()
+                if not self.connection.in_transaction:
+                    cursor.execute("BEGIN IMMEDIATE")
+                # No other connection can commit from now until our own commit
+                self._check_data_version()
+                horizon = self._stale_virtual_horizon(cursor)
+                if horizon:
+                    self._refresh_virtual_schedule_state(cursor, horizon)
+            else:
+                cursor.execute(f"SAVEPOINT write_{depth}")
+            committed = False
+            try:
+                yield cursor
+                if depth == 1:
+                    self.connection.commit()
+                    self._absorb_own_commit()
+                    committed = True
+                else:
+                    cursor.execute(f"RELEASE write_{depth}")
+            except BaseException:
+                if depth == 1:
+                    self.connection.rollback()
+                else:
+                    cursor.execute(f"ROLLBACK TO write_{depth}")
+                    cursor.execute(f"RELEASE write_{depth}")
+                raise
+            finally:
+                self._write_depth -= 1
+                if depth == 1:
+                    self._writer_thread = None
+                    self._end_transaction(committed)
+    
+    @contextmanager
+    def transaction(self):
+        """Group writes into one unit of work, committed once when the outermost block exits.
+        
+        with db.transaction():
+            renter_id = db.add_renter(...)
+            db.add_rental(product_id, renter_id, ...)
+        
+        Nothing is saved if the block raises. Blocks can be nested: an inner block
+        runs in a savepoint, so catching its error only undoes the inner block.
+        Other threads keep reading the last committed state meanwhile and wait for
+        the end of the transaction to write.
+        """
+        with self._write():
+            yield
+    
+    def set_trace_callback(self, callback: Optional[Callable[[str], None]]):
+        """Call callback with the SQL text of every statement, on every connection"""
+        self._trace_callback = callback
+        self._install_trace_callback()
+    
+    def _install_trace_callback(self):
+        """Trace statements to the instrumentation and the set_trace_callback callback"""
+        callbacks = [callback for callback in (self.instrumentation and self.instrumentation.trace,
+                                               self._trace_callback) if callback]
+        if len(callbacks) < 2:
+            self.pool.set_trace_callback(callbacks[0] if callbacks else None)
+            return
+        
+        def trace(statement: str):
+            for callback in callbacks:
+                callback(statement)
+        self.pool.set_trace_callback(trace)
+    
+    def enable_instrumentation(self, slow_query_ms: float = DEFAULT_SLOW_QUERY_MS,
+                               slow_log_path: str = None) -> Instrumentation:
+        """Time every public method and log statements slower than slow_query_ms.
+        
+        Slow statements go to slow_log_path, slow_queries.log next to the database by
+        default (no file for in-memory databases). Replaces any running instrumentation.
+        """
+        self.disable_instrumentation()
+        if slow_log_path is None and not self.pool.shared:
+            slow_log_path = os.path.join(os.path.dirname(os.path.abspath(self.db_name)), SLOW_QUERY_LOG_NAME)
+        self.instrumentation = Instrumentation(slow_query_ms, slow_log_path)
+        self.instrumentation.install(self, instrumented_methods(DatabaseHandler))
+        self._install_trace_callback()
+        return self.instrumentation
+    
+    def disable_instrumentation(self):
+        """Stop timing and restore the plain methods; the counters are discarded"""
+        if self.instrumentation:
+            self.instrumentation.uninstall()
+            self.instrumentation = None
+            self._install_trace_callback()
+    
+    def get_diagnostics(self) -> Optional[Dict]:
+        """Instrumentation counters (see Instrumentation.snapshot), None when it is off"""
+        return self.instrumentation.snapshot() if self.instrumentation else None
+    
+    def dump_diagnostics(self, path: str):
+        """Write the instrumentation counters to a JSON file"""
+        if not self.instrumentation:
+            raise RuntimeError("L'instrumentation n'est pas activée")
+        self.instrumentation.dump_json(path)
+    
+    # Ordered schema migrations: (user_version reached, method applying it).
+    # Append new steps at the end; released steps must never change.
+    MIGRATIONS = [
+        (1, '_create_base_schema'),
+        (2, '_migrate_payment_status'),
+        (3, '_migrate_financial_columns'),
+        (4, '_migrate_iso_dates'),
+        (5, '_create_indexes'),
+        (6, '_create_stats_counters'),
+        (7, '_create_search_index'),
+        (8, '_migrate_virtual_schedules'),
+        (9, '_freeze_returned_schedules'),
+        (10, '_create_virtual_schedule_state'),
+        (11, 'analyze'),
+        (12, '_migrate_amounts_to_millimes'),
+        (13, '_create_archive_state'),
+        (14, '_create_import_indexes'),
+        (15, '_replace_planner_statistics'),
+    ]
+    
+    @property
+    def schema_version(self) -> int:
+        """Schema version of the open database (PRAGMA user_version)"""
+        self.cursor.execute("PRAGMA user_version")
+        return self.cursor.fetchone()[0]
+    
     def create_tables(self):
-        """Create all necessary tables"""
-        schema_file = "database_schema.sql"
+        """Bring the schema up to date, applying the migrations the database has not seen.
         
-        if os.path.exists(schema_file):
-            with open(schema_file, 'r') as f:
-                schema = f.read()
-                self.cursor.executescript(schema)
-        else:
-            # Fallback: Create tables directly
-            self._create_tables_directly()
+        A current database costs a single PRAGMA read. Each step is committed with its
+        version, so an interrupted upgrade resumes where it stopped. Databases created
+        before versioning (user_version 0) replay every step, all of which are idempotent.
+        """
+        version = self.schema_version
+        for target_version, step in self.MIGRATIONS:
+            if target_version <= version:
+                continue
+            getattr(self, step)()
+            self.cursor.execute(f"PRAGMA user_version = {int(target_version)}")
+            self.connection.commit()
+    
+    def _create_base_schema(self):
+        """Create the tables, first indexes and report views (version 1)"""
+        self.cursor.executescript(SCHEMA_SQL)
+    
+    def _create_indexes(self):
+        """Create the indexes used by joins, filters, sorts and keyset pagination"""
+        self.cursor.executescript(INDEXES_SQL)
+    
+    def _migrate_virtual_schedules(self):
+        """Drop the pre-generated unpaid payments of open-ended rentals (now virtual)"""
+        self.cursor.executescript(VIRTUAL_SCHEDULE_INDEXES_SQL)
+        self.cursor.execute("""DELETE FROM payments
+                               WHERE status = 'unpaid' AND COALESCE(notes, '') = ''
+                               AND rental_id IN (SELECT id FROM rentals WHERE end_date IS NULL)""")
+    
+    def _freeze_returned_schedules(self):
+        """Give returned open-ended rentals an end date and store their schedule.
+        
+        Their return date was not recorded, so the schedule stops at the migration date.
+        """
+        self.cursor.execute("SELECT id FROM rentals WHERE end_date IS NULL AND status != 'active'")
+        for (rental_id,) in self.cursor.fetchall():
+            self._freeze_schedule(self.cursor, rental_id)
+    
+    def _create_virtual_schedule_state(self):
+        """Create the trigger-maintained unpaid count of the virtual schedules"""
+        self.cursor.executescript(VIRTUAL_SCHEDULE_STATE_SQL)
+        self._refresh_virtual_schedule_state(self.cursor, self._effective_end_date())
+    
+    def analyze(self):
+        """Refresh the query planner statistics (ANALYZE). Worth running after a large import."""
+        with self._write() as cursor:
+            cursor.execute("ANALYZE")
+    
+    def _replace_planner_statistics(self):
+        """Measure the planner statistics again: earlier versions replaced those of small
+        tables with the figures of a reference database"""
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+        if self.cursor.fetchone():
+            self.cursor.execute("DELETE FROM sqlite_stat1")
+        self.analyze()
+    
+    def _migrate_amounts_to_millimes(self):
+        """Store the amounts as integer millimes instead of REAL TND (see Money).
+        
+        SQLite cannot change the type of a column: each table of MILLIMES_TABLES_SQL is
+        copied into a new table renamed over the old one, in a single transaction. The
+        triggers and views are dropped meanwhile and recreated with the indexes; the
+        AUTOINCREMENT counters and the planner statistics are kept.
+        """
+        self.cursor.execute("PRAGMA table_info(payments)")
+        if any(column['name'] == 'amount' and column['type'] == 'INTEGER'
+               for column in self.cursor.fetchall()):
+            return
+        tables = tuple(MILLIMES_TABLES_SQL)
+        marks = ", ".join("?" for _ in tables)
+        self.cursor.execute("""SELECT type, name, tbl_name, sql FROM sqlite_master
+                               WHERE type IN ('index', 'trigger', 'view') AND sql IS NOT NULL""")
+        objects = [row for row in self.cursor.fetchall()
+                   if row['type'] != 'index' or row['tbl_name'] in tables]
+        self.cursor.execute(f"SELECT name, seq FROM sqlite_sequence WHERE name IN ({marks})", tables)
+        sequences = self.cursor.fetchall()
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+        statistics = []
+        if self.cursor.fetchone():
+            self.cursor.execute(f"SELECT tbl, idx, stat FROM sqlite_stat1 WHERE tbl IN ({marks})", tables)
+            statistics = [tuple(row) for row in self.cursor.fetchall()]
+        
+        if not self.connection.in_transaction:
+            self.cursor.execute("BEGIN")
+        for kind, name, _, _ in objects:
+            if kind != 'index':
+                self.cursor.execute(f'DROP {kind.upper()} IF EXISTS "{name}"')
+        for table, create_sql in MILLIMES_TABLES_SQL.items():
+            self.cursor.execute(create_sql.format(table=f"{table}_millimes"))
+            self.cursor.execute(f"PRAGMA table_info({table}_millimes)")
+            columns = [column['name'] for column in self.cursor.fetchall()]
+            values = [f"CAST(ROUND({column} * 1000) AS INTEGER)" if column in MONEY_COLUMNS else column
+                      for column in columns]
+            self.cursor.execute(f"INSERT INTO {table}_millimes ({', '.join(columns)}) "
+                                f"SELECT {', '.join(values)} FROM {table}")
+            self.cursor.execute(f"DROP TABLE {table}")
+            self.cursor.execute(f"ALTER TABLE {table}_millimes RENAME TO {table}")
+        for _, _, _, sql in objects:
+            self.cursor.execute(sql)
+        self.cursor.executemany("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?",
+                                [(seq, name) for name, seq in sequences])
+        if statistics:
+            self.cursor.executemany("INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES (?, ?, ?)", statistics)
+            self.cursor.execute("ANALYZE sqlite_schema")
+    
+    def _create_archive_state(self):
+        """Create the archive_state row tracking what archive_closed_rentals moved"""
+        self.cursor.executescript(ARCHIVE_STATE_SQL)
+    
+    def _create_import_indexes(self):
+        """Index renters on the keys the importer matches them by and let bulk inserts
+        defer their search documents (the insert triggers are recreated with the switch)"""
+        self.cursor.executescript(IMPORT_INDEXES_SQL)
+        if self.has_search_index:
+            self.cursor.executescript("""
+                DROP TRIGGER IF EXISTS trg_search_renters_insert;
+                DROP TRIGGER IF EXISTS trg_search_rentals_insert;
+            """ + SEARCH_INDEX_SQL)
+        self.analyze()
+    
+    def _create_stats_counters(self):
+        """Create the trigger-maintained dashboard counters, filling them on first use"""
+        self.cursor.executescript(STATS_COUNTERS_SQL)
+        self.cursor.execute("SELECT 1 FROM stats_counters WHERE id = 1")
+        if not self.cursor.fetchone():
+            self.rebuild_stats_counters()
+    
+    def _create_search_index(self):
+        """Create the FTS5 search index and its sync triggers, filling it on first use"""
+        self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+        )
+        exists = self.cursor.fetchone() is not None
+        try:
+            self.cursor.executescript(SEARCH_INDEX_SQL)
+        except sqlite3.OperationalError as e:
+            # SQLite built without FTS5: search() falls back to LIKE queries
+            print(f"Search index unavailable: {e}")
+            self._has_search_index = False
+            return
+        self._has_search_index = True
+        if not exists:
+            self.rebuild_search_index()
+    
+    @property
+    def has_search_index(self) -> bool:
+        """Whether the FTS5 search index exists (SQLite may be built without FTS5)"""
+        if self._has_search_index is None:
+            row = self._read_cursor().execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+            ).fetchone()
+            self._has_search_index = row is not None
+        return self._has_search_index
+    
+    def _migrate_iso_dates(self):
+        """Rewrite rental and payment dates to YYYY-MM-DD once, then guard them with triggers.
+        
+        The triggers mark the migration as done: databases that have them only
+        ever received ISO dates, so the table scans are skipped.
+        """
+        self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_rentals_iso_dates_insert'"
+        )
+        if self.cursor.fetchone():
+            return
+        
+        def canonical(value):
+            try:
+                return to_iso_date(value)
+            except ValueError:
+                return value  # Unreadable dates are left as they are
+        
+        self.cursor.execute(f"""SELECT id, start_date, end_date FROM rentals
+                                WHERE start_date NOT GLOB '{ISO_DATE_GLOB}'
+                                   OR end_date NOT GLOB '{ISO_DATE_GLOB}'""")
+        rentals = [(canonical(start), canonical(end), rental_id)
+                   for rental_id, start, end in self.cursor.fetchall()]
+        self.cursor.executemany("UPDATE rentals SET start_date = ?, end_date = ? WHERE id = ?", rentals)
         
-        # Add payment_status column if it doesn't exist (migration)
-        self._migrate_payment_status()
-        self._migrate_financial_columns()
+        self.cursor.execute(f"""SELECT id, payment_date FROM payments
+                                WHERE payment_date NOT GLOB '{ISO_DATE_GLOB}'""")
+        payments = [(canonical(payment_date), payment_id)
+                    for payment_id, payment_date in self.cursor.fetchall()]
+        self.cursor.executemany("UPDATE payments SET payment_date = ? WHERE id = ?", payments)
         
-        self.connection.commit()
+        self.cursor.executescript(ISO_DATE_TRIGGERS_SQL)
     
     def _migrate_financial_columns(self):
         """Add acompte and escompte columns if missing."""
@@ -151,90 +1471,187 @@ class DatabaseHandler:
         except sqlite3.Error as e:
             print(f"Migration note: {e}")
     
-    def _create_tables_directly(self):
-        """Create tables directly if schema file not found"""
-        tables = [
-            """CREATE TABLE IF NOT EXISTS products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                type TEXT NOT NULL CHECK(type IN ('bed', 'equipment')),
-                rental_price REAL NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )""",
-            """CREATE TABLE IF NOT EXISTS renters (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                full_name TEXT NOT NULL,
-                phone TEXT,
-                email TEXT,
-                address TEXT,
-                id_number TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )""",
-            """CREATE TABLE IF NOT EXISTS rentals (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                product_id INTEGER NOT NULL,
-                renter_id INTEGER NOT NULL,
-                billing_type TEXT NOT NULL CHECK(billing_type IN ('monthly', 'yearly')),
-                rental_price REAL NOT NULL,
-                start_date DATE NOT NULL,
-                end_date DATE,
-                status TEXT NOT NULL DEFAULT 'active' CHECK(status IN ('active', 'returned')),
-                payment_status TEXT NOT NULL DEFAULT 'unpaid' CHECK(payment_status IN ('paid', 'unpaid')),
-                acompte REAL NOT NULL DEFAULT 0,
-                escompte REAL NOT NULL DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE,
-                FOREIGN KEY (renter_id) REFERENCES renters(id) ON DELETE CASCADE
-            )""",
-            """CREATE TABLE IF NOT EXISTS payments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                rental_id INTEGER NOT NULL,
-                payment_date DATE NOT NULL,
-                amount REAL NOT NULL,
-                payment_month TEXT NOT NULL,
-                status TEXT NOT NULL DEFAULT 'unpaid' CHECK(status IN ('paid', 'unpaid')),
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (rental_id) REFERENCES rentals(id) ON DELETE CASCADE
-            )"""
-        ]
-        
-        for table in tables:
-            self.cursor.execute(table)
+    # ==================== ENTITY CACHE ====================
+    
+    def _cached(self, key, loader):
+        """Return a cached product/renter lookup, loading it on a miss.
+        
+        Writes made through another connection bump PRAGMA data_version, which
+        empties the cache. Copies are returned so callers cannot alter cached rows.
+        A row loaded while a write invalidated the cache is returned but not cached,
+        as it may predate that write. Inside its own transaction a thread bypasses
+        the cache, which only holds committed rows.
+        """
+        if self._in_own_transaction():
+            value = loader()
+            if value is None:
+                return None
+            return [dict(item) for item in value] if isinstance(value, list) else dict(value)
+        self._check_data_version()
+        with self._cache_lock:
+            value = self.cache.get(key)
+            generation = self.cache.invalidations
+        if value is None:
+            value = loader()
+            if value is None:
+                return None
+            with self._cache_lock:
+                if self.cache.invalidations == generation:
+                    self.cache.put(key, value)
+        if isinstance(value, list):
+            return [dict(item) for item in value]
+        return dict(value)
+    
+    def _check_data_version(self):
+        """Drop cached rows and picker indexes if another process wrote to the database.
+        
+        PRAGMA data_version, read on the monitor connection, changes with every
+        commit of another connection, this handler's writer included. A change
+        with no commit of the writer since the last check is an outside write;
+        _write checks before its own commit and absorbs the change it causes.
+        Never waits for the writer.
+        """
+        if self.pool.monitor is None:
+            return
+        with self.pool.monitor_lock:
+            data_version = self.pool.monitor.execute("PRAGMA data_version").fetchone()[0]
+            commits = self._commits
+            outside_write = (self._data_version is not None and data_version != self._data_version
+                             and commits == self._seen_commits)
+            self._data_version = data_version
+            self._seen_commits = commits
+        if outside_write:
+            self.invalidate_cache()
+    
+    def _absorb_own_commit(self):
+        """Record the writer's commit so the data_version change it causes is not taken
+        for an outside write (called by _write right after committing)"""
+        if self.pool.monitor is None:
+            return
+        with self.pool.monitor_lock:
+            self._commits += 1
+            self._data_version = self.pool.monitor.execute("PRAGMA data_version").fetchone()[0]
+            self._seen_commits = self._commits
+    
+    def invalidate_cache(self):
+        """Empty the product/renter cache (after writing through self.cursor directly)"""
+        with self._cache_lock:
+            self.cache.clear()
+            self.picker_indexes.clear()
+    
+    def _invalidate(self, kind: str, entity_id: int = None):
+        """Drop a written product/renter from the cache and re-index it in its picker.
+        
+        Inside a transaction this is done again once it commits, as other threads
+        may have cached the previous committed row in the meantime.
+        """
+        with self._cache_lock:
+            self.cache.invalidate(kind, entity_id)
+        if self._in_own_transaction():
+            self._pending_invalidations.append((kind, entity_id))
+            return
+        if entity_id is not None:
+            self._refresh_picker_index(kind, entity_id)
+    
+    def _end_transaction(self, committed: bool):
+        """Apply the cache invalidations of a committed transaction, or reset after a rollback"""
+        pending, self._pending_invalidations = self._pending_invalidations, []
+        if not committed:
+            if pending:
+                self.invalidate_cache()
+            return
+        for kind, entity_id in dict.fromkeys(pending):
+            self._invalidate(kind, entity_id)
+    
+    def get_cache_stats(self) -> Dict:
+        """Get hit/miss counters of the product/renter cache"""
+        return self.cache.stats()
+    
+    # ==================== PICKER INDEXES ====================
+    
+    def get_renter_index(self) -> PickerIndex:
+        """In-memory prefix index over renter names and phones, built on first use.
+        
+        add/update/delete_renter keep it up to date; writes from another
+        connection make the next call rebuild it.
+        """
+        return self._picker_index('renter')
+    
+    def get_product_index(self) -> PickerIndex:
+        """In-memory prefix index over product names and types, built on first use"""
+        return self._picker_index('product')
+    
+    def _picker_index(self, kind: str) -> PickerIndex:
+        """Return the picker index of kind ('renter' or 'product'), building it if needed"""
+        self._check_data_version()
+        with self._cache_lock:
+            index = self.picker_indexes.get(kind)
+            if index is None:
+                if kind == 'renter':
+                    index = PickerIndex('full_name', phone_fields=('phone',))
+                    index.build(self.get_all_renters())
+                else:
+                    index = PickerIndex('name', search_fields=('type',))
+                    index.build(self.get_all_products())
+                # Built from uncommitted rows inside a transaction: not shared
+                if not self._in_own_transaction():
+                    self.picker_indexes[kind] = index
+            return index
+    
+    def _refresh_picker_index(self, kind: str, entity_id: int):
+        """Re-index one written renter/product in an already built picker index"""
+        with self._cache_lock:
+            index = self.picker_indexes.get(kind)
+            if index is None:
+                return
+            if kind == 'renter':
+                row = self.get_renter_by_id(entity_id)
+            else:
+                row = self.get_product_by_id(entity_id)
+            if row:
+                index.upsert(row)
+            else:
+                index.remove(entity_id)
     
     # ==================== PRODUCT OPERATIONS ====================
     
-    def add_product(self, name: str, product_type: str, rental_price: float) -> int:
-        """Add a new product"""
+    def add_product(self, name: str, product_type: str, rental_price: Money) -> int:
+        """Add a new product (rental_price is Money or a number of TND)"""
         query = "INSERT INTO products (name, type, rental_price) VALUES (?, ?, ?)"
-        self.cursor.execute(query, (name, product_type, rental_price))
-        self.connection.commit()
-        return self.cursor.lastrowid
+        with self._write() as cursor:
+            cursor.execute(query, (name, product_type, Money.from_tnd(rental_price)))
+            product_id = cursor.lastrowid
+        self._invalidate('product', product_id)
+        return product_id
     
     def get_all_products(self) -> List[Dict]:
         """Get all products"""
-        query = "SELECT * FROM products ORDER BY name"
-        self.cursor.execute(query)
-        return [dict(row) for row in self.cursor.fetchall()]
+        def load():
+            query = "SELECT * FROM products ORDER BY name"
+            return [dict(row) for row in self._read_cursor().execute(query).fetchall()]
+        return self._cached(('product', 'all'), load)
     
     def get_product_by_id(self, product_id: int) -> Optional[Dict]:
         """Get product by ID"""
-        query = "SELECT * FROM products WHERE id = ?"
-        self.cursor.execute(query, (product_id,))
-        row = self.cursor.fetchone()
-        return dict(row) if row else None
+        def load():
+            query = "SELECT * FROM products WHERE id = ?"
+            row = self._read_cursor().execute(query, (product_id,)).fetchone()
+            return dict(row) if row else None
+        return self._cached(('product', product_id), load)
     
-    def update_product(self, product_id: int, name: str, product_type: str, rental_price: float):
+    def update_product(self, product_id: int, name: str, product_type: str, rental_price: Money):
         """Update product information"""
         query = "UPDATE products SET name = ?, type = ?, rental_price = ? WHERE id = ?"
-        self.cursor.execute(query, (name, product_type, rental_price, product_id))
-        self.connection.commit()
+        with self._write() as cursor:
+            cursor.execute(query, (name, product_type, Money.from_tnd(rental_price), product_id))
+        self._invalidate('product', product_id)
     
     def delete_product(self, product_id: int):
         """Delete a product"""
         query = "DELETE FROM products WHERE id = ?"
-        self.cursor.execute(query, (product_id,))
-        self.connection.commit()
+        with self._write() as cursor:
+            cursor.execute(query, (product_id,))
+        self._invalidate('product', product_id)
     
     # ==================== RENTER OPERATIONS ====================
     
@@ -243,65 +1660,387 @@ class DatabaseHandler:
         """Add a new renter"""
         query = """INSERT INTO renters (full_name, phone, email, address, id_number) 
                    VALUES (?, ?, ?, ?, ?)"""
-        self.cursor.execute(query, (full_name, phone, email, address, id_number))
-        self.connection.commit()
-        return self.cursor.lastrowid
+        with self._write() as cursor:
+            cursor.execute(query, (full_name, phone, email, address, id_number))
+            renter_id = cursor.lastrowid
+        self._invalidate('renter', renter_id)
+        return renter_id
     
     def get_all_renters(self) -> List[Dict]:
         """Get all renters"""
-        query = "SELECT * FROM renters ORDER BY full_name"
-        self.cursor.execute(query)
-        return [dict(row) for row in self.cursor.fetchall()]
+        def load():
+            query = "SELECT * FROM renters ORDER BY full_name"
+            return [dict(row) for row in self._read_cursor().execute(query).fetchall()]
+        return self._cached(('renter', 'all'), load)
     
     def search_renters(self, name: str) -> List[Dict]:
-        """Search renters by name (case-insensitive partial match)."""
+        """Search renters by name, phone, email or CIN (accent/case-insensitive word prefixes)."""
         if not name.strip():
             return self.get_all_renters()
-        query = """SELECT * FROM renters 
-                   WHERE LOWER(full_name) LIKE LOWER(?) 
+        match = self._search_match_query(name)
+        cursor = self._read_cursor()
+        if not self.has_search_index or not match:
+            query = """SELECT * FROM renters 
+                       WHERE LOWER(full_name) LIKE LOWER(?) 
+                       ORDER BY full_name"""
+            cursor.execute(query, (f"%{name.strip()}%",))
+            return [dict(row) for row in cursor.fetchall()]
+        query = """SELECT * FROM renters
+                   WHERE id IN (SELECT entity_id FROM search_index
+                                WHERE search_index MATCH ? AND entity_type = 'renter')
                    ORDER BY full_name"""
-        self.cursor.execute(query, (f"%{name.strip()}%",))
-        return [dict(row) for row in self.cursor.fetchall()]
+        cursor.execute(query, (match,))
+        return [dict(row) for row in cursor.fetchall()]
     
     def get_renter_by_id(self, renter_id: int) -> Optional[Dict]:
         """Get renter by ID"""
-        query = "SELECT * FROM renters WHERE id = ?"
-        self.cursor.execute(query, (renter_id,))
-        row = self.cursor.fetchone()
-        return dict(row) if row else None
+        def load():
+            query = "SELECT * FROM renters WHERE id = ?"
+            row = self._read_cursor().execute(query, (renter_id,)).fetchone()
+            return dict(row) if row else None
+        return self._cached(('renter', renter_id), load)
     
     def update_renter(self, renter_id: int, full_name: str, phone: str = "", 
                       email: str = "", address: str = "", id_number: str = ""):
         """Update renter information"""
         query = """UPDATE renters SET full_name = ?, phone = ?, email = ?, 
                    address = ?, id_number = ? WHERE id = ?"""
-        self.cursor.execute(query, (full_name, phone, email, address, id_number, renter_id))
-        self.connection.commit()
+        with self._write() as cursor:
+            cursor.execute(query, (full_name, phone, email, address, id_number, renter_id))
+        self._invalidate('renter', renter_id)
     
     def delete_renter(self, renter_id: int):
         """Delete a renter"""
         query = "DELETE FROM renters WHERE id = ?"
-        self.cursor.execute(query, (renter_id,))
-        self.connection.commit()
+        with self._write() as cursor:
+            cursor.execute(query, (renter_id,))
+        self._invalidate('renter', renter_id)
+    
+    # ==================== GLOBAL SEARCH ====================
+    
+    @staticmethod
+    def _search_match_query(term: str) -> str:
+        """Turn user input into an FTS5 query matching every word as a prefix"""
+        words = re.findall(r"\w+", term)
+        return " ".join(f'"{word}"*' for word in words)
+    
+    def search(self, term: str, limit: int = 20) -> List[Dict]:
+        """Search renters, products, rentals and payment notes, best matches first.
+        
+        Each hit has entity_type ('renter', 'product', 'rental' or 'payment'),
+        entity_id, title and body.
+        """
+        match = self._search_match_query(term)
+        if not match:
+            return []
+        if not self.has_search_index:
+            return self._search_without_index(term, limit)
+        query = """
+        SELECT entity_type, entity_id, title, body
+        FROM search_index
+        WHERE search_index MATCH ?
+        ORDER BY bm25(search_index, 0.0, 0.0, 10.0, 1.0)
+        LIMIT ?
+        """
+        cursor = self._read_cursor()
+        cursor.execute(query, (match, limit))
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def _search_without_index(self, term: str, limit: int) -> List[Dict]:
+        """LIKE-based search of renters and products when FTS5 is unavailable"""
+        pattern = f"%{term.strip()}%"
+        query = """
+        SELECT 'renter' as entity_type, id as entity_id, full_name as title,
+               COALESCE(phone, '') as body
+        FROM renters
+        WHERE full_name LIKE ? OR phone LIKE ? OR email LIKE ? OR id_number LIKE ?
+        UNION ALL
+        SELECT 'product', id, name, type FROM products WHERE name LIKE ?
+        LIMIT ?
+        """
+        cursor = self._read_cursor()
+        cursor.execute(query, (pattern, pattern, pattern, pattern, pattern, limit))
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def rebuild_search_index(self):
+        """Rebuild the full-text search index from the base tables"""
+        if not self.has_search_index:
+            return
+        with self._write() as cursor:
+            cursor.execute("DELETE FROM search_index")
+            for document in SEARCH_DOCUMENTS.values():
+                cursor.execute(document.format(where="1"))
+    
+    # ==================== PAGINATION ====================
+    
+    PAGE_QUERIES = {
+        'rentals': ("""
+        SELECT 
+            r.id, r.product_id, r.renter_id, r.billing_type, r.rental_price,
+            r.start_date, r.end_date, r.status, r.payment_status,
+            r.acompte, r.escompte, r.created_at,
+            p.name as product_name, p.type as product_type,
+            rn.full_name as renter_name, rn.phone as renter_phone
+        FROM rentals r
+        JOIN products p ON r.product_id = p.id
+        JOIN renters rn ON r.renter_id = rn.id
+        WHERE {after}
+        ORDER BY r.created_at DESC, r.id DESC
+        LIMIT ?
+        """, "(r.created_at, r.id) < (?, ?)", ('created_at', 'id')),
+        'renters': ("""
+        SELECT * FROM renters
+        WHERE {after}
+        ORDER BY full_name, id
+        LIMIT ?
+        """, "(full_name, id) > (?, ?)", ('full_name', 'id')),
+        'unpaid_payments': ("""
+        SELECT 
+            py.id, py.rental_id, py.payment_month, py.amount, py.payment_date,
+            p.name as product_name,
+            rn.full_name as renter_name, rn.phone as renter_phone
+        FROM payments py
+        JOIN rentals r ON py.rental_id = r.id
+        JOIN products p ON r.product_id = p.id
+        JOIN renters rn ON r.renter_id = rn.id
+        WHERE py.status = 'unpaid' AND r.status = 'active' AND {after}
+        ORDER BY py.payment_month, py.rental_id
+        LIMIT ?
+        """, "(py.payment_month, py.rental_id) > (?, ?)", ('payment_month', 'rental_id')),
+        'rental_payments': ("""
+        SELECT * FROM payments
+        WHERE rental_id = ? AND {after}
+        ORDER BY payment_month, id
+        LIMIT ?
+        """, "(payment_month, id) > (?, ?)", ('payment_month', 'id')),
+    }
+    
+    @staticmethod
+    def _encode_page_token(values) -> str:
+        """Opaque continuation token holding the sort key of the last row of a page"""
+        return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode()
+    
+    @staticmethod
+    def _decode_page_token(token: str) -> list:
+        """Sort key stored in a continuation token"""
+        try:
+            values = json.loads(base64.urlsafe_b64decode(token.encode()))
+        except (ValueError, AttributeError):
+            raise ValueError("Jeton de pagination invalide")
+        if not isinstance(values, list) or len(values) != 2:
+            raise ValueError("Jeton de pagination invalide")
+        return values
+    
+    def _fetch_page(self, name: str, params: tuple = (), after: str = None,
+                    limit: int = 100) -> Tuple[List[Dict], Optional[str]]:
+        """Run the keyset query name of PAGE_QUERIES after the given continuation token.
+        
+        Returns the rows and the token of the next page (None on the last page).
+        """
+        query, after_condition, key_fields = self.PAGE_QUERIES[name]
+        if after is None:
+            query = query.format(after="1")
+        else:
+            query = query.format(after=after_condition)
+            params = params + tuple(self._decode_page_token(after))
+        cursor = self._read_cursor()
+        cursor.execute(query, params + (limit + 1,))
+        rows = [dict(row) for row in cursor.fetchall()]
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, self._encode_page_token(rows[-1][field] for field in key_fields)
+    
+    def _iter_pages(self, get_page: Callable, *args, batch_size: int = 500) -> Iterator[Dict]:
+        """Stream every row of a paginated listing, batch_size rows per page"""
+        token = None
+        while True:
+            rows, token = get_page(*args, after=token, limit=batch_size)
+            yield from rows
+            if token is None:
+                return
+    
+    def _iter_batches(self, query: str, params=(), batch_size: int = 500) -> Iterator[List[Dict]]:
+        """Rows of one query in lists of batch_size, fetched as SQLite steps the statement"""
+        cursor = self._read_cursor()
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield [dict(row) for row in rows]
+    
+    def get_rentals_page(self, after: str = None, limit: int = 100) -> Tuple[List[Dict], Optional[str]]:
+        """One page of rentals, newest first (keyset on created_at, id).
+        
+        Pass the returned token as after to get the next page; it is None on the last page.
+        """
+        return self._fetch_page('rentals', (), after, limit)
+    
+    def iter_rentals(self, batch_size: int = 500) -> Iterator[Dict]:
+        """Stream all rentals, newest first, without loading them all in memory"""
+        return self._iter_pages(self.get_rentals_page, batch_size=batch_size)
+    
+    def get_renters_page(self, after: str = None, limit: int = 100) -> Tuple[List[Dict], Optional[str]]:
+        """One page of renters by name (keyset on full_name, id) and the next page token"""
+        return self._fetch_page('renters', (), after, limit)
+    
+    def iter_renters(self, batch_size: int = 500) -> Iterator[Dict]:
+        """Stream all renters by name"""
+        return self._iter_pages(self.get_renters_page, batch_size=batch_size)
+    
+    def get_unpaid_payments_page(self, after: str = None,
+                                 limit: int = 100) -> Tuple[List[Dict], Optional[str]]:
+        """One page of unpaid payments of active rentals by month (keyset on payment_month, rental_id).
+        
+        Stored payments are merged with the unpaid periods of virtual schedules.
+        """
+        stored, stored_token = self._fetch_page('unpaid_payments', (), after, limit)
+        after_key = tuple(self._decode_page_token(after)) if after else None
+        virtual = list(islice(self._virtual_unpaid_payments(after_key), limit + 1))
+        rows = list(heapq.merge(stored, virtual, key=self._unpaid_payment_key))
+        if len(rows) <= limit and stored_token is None:
+            return rows, None
+        rows = rows[:limit]
+        return rows, self._encode_page_token(self._unpaid_payment_key(rows[-1]))
+    
+    def iter_unpaid_payments(self, batch_size: int = 500) -> Iterator[Dict]:
+        """Stream the unpaid payments of active rentals by month.
+        
+        Stored payments are read page by page and merged with a single pass over the
+        virtual schedules, instead of recomputing them for every page.
+        """
+        stored = self._iter_pages(partial(self._fetch_page, 'unpaid_payments', ()),
+                                  batch_size=batch_size)
+        return heapq.merge(stored, self._virtual_unpaid_payments(), key=self._unpaid_payment_key)
+    
+    def get_payments_by_rental_page(self, rental_id: int, after: str = None,
+                                    limit: int = 100) -> Tuple[List[Dict], Optional[str]]:
+        """One page of a rental's payments by month (keyset on payment_month, id)"""
+        rental = self._schedule_rental(rental_id)
+        if not rental or rental['end_date']:
+            return self._fetch_page('rental_payments', (rental_id,), after, limit)
+        # A virtual schedule has one period per month: the month alone is the key
+        payments = self.get_payments_by_rental(rental_id)
+        if after is not None:
+            after_month = self._decode_page_token(after)[0]
+            payments = [payment for payment in payments if payment['payment_month'] > after_month]
+        if len(payments) <= limit:
+            return payments, None
+        rows = payments[:limit]
+        return rows, self._encode_page_token((rows[-1]['payment_month'], rows[-1]['id']))
+    
+    def iter_payments_by_rental(self, rental_id: int, batch_size: int = 500) -> Iterator[Dict]:
+        """Stream a rental's payments by month"""
+        return self._iter_pages(self.get_payments_by_rental_page, rental_id, batch_size=batch_size)
     
     # ==================== RENTAL OPERATIONS ====================
     
     def add_rental(self, product_id: int, renter_id: int, billing_type: str, 
-                   rental_price: float, start_date: str, end_date: str = None,
-                   acompte: float = 0.0, escompte: float = 0.0) -> int:
-        """Add a new rental and create payment schedule"""
-        query = """INSERT INTO rentals (product_id, renter_id, billing_type, rental_price, 
-                   start_date, end_date, status, acompte, escompte) 
-                   VALUES (?, ?, ?, ?, ?, ?, 'active', ?, ?)"""
-        self.cursor.execute(query, (product_id, renter_id, billing_type, rental_price, 
-                                   start_date, end_date, acompte, escompte))
-        rental_id = self.cursor.lastrowid
+                   rental_price: Money, start_date: str, end_date: str = None,
+                   acompte: Money = 0, escompte: Money = 0) -> int:
+        """Add a new rental and create payment schedule (amounts are Money or numbers of TND)"""
+        rental_price = Money.from_tnd(rental_price)
+        with self._write() as cursor:
+            rental_id = self._insert_rental(cursor, product_id, renter_id, billing_type,
+                                            rental_price, start_date, end_date, acompte, escompte)
+            
+            # Create payment schedule (open-ended rentals get a virtual one)
+            if to_iso_date(end_date):
+                self._create_payment_schedule(cursor, rental_id, billing_type, rental_price,
+                                              start_date, end_date)
+        return rental_id
+    
+    def add_rentals_bulk(self, rentals: Iterable[Dict], batch_size: int = 5000) -> List[int]:
+        """Add many rentals and their payment schedules in a single transaction.
         
-        # Create payment schedule
-        self._create_payment_schedule(rental_id, billing_type, rental_price, start_date, end_date)
+        Open-ended rentals (no end_date) get a virtual schedule. Each item holds the add_rental
+        arguments as keys (end_date, acompte, escompte, payment_status and status are optional).
+        Rentals are inserted batch_size at a time with executemany. Nothing is saved if any
+        rental is invalid.
+        """
+        rental_ids = []
+        with self._write() as cursor:
+            batch = []
+            for rental in rentals:
+                batch.append(rental)
+                if len(batch) >= batch_size:
+                    rental_ids.extend(self._insert_rentals(cursor, batch))
+                    batch = []
+            if batch:
+                rental_ids.extend(self._insert_rentals(cursor, batch))
+        return rental_ids
+    
+    @staticmethod
+    def _insert_many(cursor: sqlite3.Cursor, query: str, rows: List[Tuple]) -> List[int]:
+        """executemany an INSERT and return the ids of the new rows, in order.
         
-        self.connection.commit()
-        return rental_id
+        The writer holds the database, so the rows of one executemany get consecutive
+        ids and last_insert_rowid() is the last of them (triggers do not change it).
+        """
+        if not rows:
+            return []
+        cursor.executemany(query, rows)
+        last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+        return list(range(last_id - len(rows) + 1, last_id + 1))
+    
+    def _insert_indexed(self, cursor: sqlite3.Cursor, kind: str, query: str, rows: List[Tuple]) -> List[int]:
+        """_insert_many for renters or rentals, adding their search documents in one statement"""
+        if not self.has_search_index:
+            return self._insert_many(cursor, query, rows)
+        cursor.execute("UPDATE search_sync SET deferred = 1 WHERE id = 1")
+        try:
+            ids = self._insert_many(cursor, query, rows)
+        finally:
+            cursor.execute("UPDATE search_sync SET deferred = 0 WHERE id = 1")
+        if ids:
+            where = "r.id BETWEEN ? AND ?" if kind == 'rental' else "id BETWEEN ? AND ?"
+            cursor.execute(SEARCH_DOCUMENTS[kind].format(where=where), (ids[0], ids[-1]))
+        return ids
+    
+    def _insert_rentals(self, cursor: sqlite3.Cursor, rentals: List[Dict]) -> List[int]:
+        """Insert a batch of rentals with one executemany, then their payment schedules"""
+        rows = []
+        for rental in rentals:
+            start_date = to_iso_date(rental['start_date'])
+            if not start_date:
+                raise ValueError("Date de début invalide: vide")
+            rows.append((rental['product_id'], rental['renter_id'], rental['billing_type'],
+                         Money.from_tnd(rental['rental_price']), start_date,
+                         to_iso_date(rental.get('end_date')), rental.get('status', 'active'),
+                         rental.get('payment_status', 'unpaid'),
+                         Money.from_tnd(rental.get('acompte') or 0), Money.from_tnd(rental.get('escompte') or 0)))
+        rental_ids = self._insert_indexed(cursor, 'rental', RENTAL_INSERT_SQL, rows)
+        payments = []
+        for rental_id, (_, _, billing_type, rental_price, start_date, end_date, status, *_) in zip(rental_ids, rows):
+            if end_date:
+                payments.extend(self._payment_schedule_rows(rental_id, billing_type, rental_price,
+                                                            start_date, end_date))
+            elif status != 'active':
+                self._freeze_schedule(cursor, rental_id)
+        if payments:
+            cursor.executemany(self.PAYMENT_INSERT_QUERY, payments)
+        return rental_ids
+    
+    def _insert_rental(self, cursor: sqlite3.Cursor, product_id: int, renter_id: int, billing_type: str,
+                       rental_price: Money, start_date: str, end_date: str = None,
+                       acompte: Money = 0, escompte: Money = 0,
+                       payment_status: str = 'unpaid') -> int:
+        """Insert a rental row through a writer cursor without committing and return its ID
+        
+        rental_price is Money; acompte and escompte may also be numbers of TND.
+        """
+        start_date = to_iso_date(start_date)
+        if not start_date:
+            raise ValueError("Date de début invalide: vide")
+        end_date = to_iso_date(end_date)
+        query = """INSERT INTO rentals (product_id, renter_id, billing_type, rental_price, 
+                   start_date, end_date, status, payment_status, acompte, escompte) 
+                   VALUES (?, ?, ?, ?, ?, ?, 'active', ?, ?, ?)"""
+        cursor.execute(query, (product_id, renter_id, billing_type, rental_price,
+                               start_date, end_date, payment_status,
+                               Money.from_tnd(acompte or 0), Money.from_tnd(escompte or 0)))
+        return cursor.lastrowid
     
     def _effective_end_date(self, end_date: str = None) -> datetime:
         """Resolve rental end date (defaults to 1 year from today if not set)."""
@@ -311,9 +2050,12 @@ class DatabaseHandler:
                 return parsed
         return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=365)
     
-    def _create_payment_schedule(self, rental_id: int, billing_type: str, 
-                                 rental_price: float, start_date: str, end_date: str = None):
-        """Create payment schedule based on billing type"""
+    PAYMENT_INSERT_QUERY = """INSERT INTO payments (rental_id, payment_date, amount, payment_month, status)
+                              VALUES (?, ?, ?, ?, 'unpaid')"""
+    
+    def _payment_schedule_rows(self, rental_id: int, billing_type: str, rental_price: Money,
+                               start_date: str, end_date: str = None) -> Iterator[Tuple]:
+        """Generate (rental_id, payment_date, amount, payment_month) rows for a rental"""
         start = parse_date(start_date)
         if not start:
             raise ValueError(f"Date de début invalide: {start_date}")
@@ -322,46 +2064,48 @@ class DatabaseHandler:
         if end < start:
             raise ValueError("La date de fin doit être après la date de début")
         
-        current_date = start
-        
-        if billing_type == 'monthly':
-            while current_date <= end:
-                payment_month = current_date.strftime("%Y-%m")
-                payment_date = current_date.strftime("%Y-%m-%d")
-                
-                query = """INSERT INTO payments (rental_id, payment_date, amount, payment_month, status)
-                          VALUES (?, ?, ?, ?, 'unpaid')"""
-                self.cursor.execute(query, (rental_id, payment_date, rental_price, payment_month))
-                
-                current_date = add_months(current_date, 1)
-        
-        elif billing_type == 'yearly':
-            while current_date <= end:
-                payment_month = current_date.strftime("%Y-%m")
-                payment_date = current_date.strftime("%Y-%m-%d")
-                
-                query = """INSERT INTO payments (rental_id, payment_date, amount, payment_month, status)
-                          VALUES (?, ?, ?, ?, 'unpaid')"""
-                self.cursor.execute(query, (rental_id, payment_date, rental_price, payment_month))
-                
-                current_date = current_date.replace(year=current_date.year + 1)
+        for current_date in schedule_dates(start, end, billing_type):
+            yield (rental_id, current_date.strftime("%Y-%m-%d"), rental_price,
+                   current_date.strftime("%Y-%m"))
+    
+    def _create_payment_schedule(self, cursor: sqlite3.Cursor, rental_id: int, billing_type: str, 
+                                 rental_price: Money, start_date: str, end_date: str = None):
+        """Create payment schedule based on billing type"""
+        rows = list(self._payment_schedule_rows(rental_id, billing_type, rental_price,
+                                                start_date, end_date))
+        cursor.executemany(self.PAYMENT_INSERT_QUERY, rows)
     
     def get_all_rentals(self) -> List[Dict]:
         """Get all rentals with related information"""
-        query = """
-        SELECT 
-            r.id, r.product_id, r.renter_id, r.billing_type, r.rental_price,
-            r.start_date, r.end_date, r.status, r.payment_status,
-            r.acompte, r.escompte, r.created_at,
-            p.name as product_name, p.type as product_type,
-            rn.full_name as renter_name, rn.phone as renter_phone
-        FROM rentals r
-        JOIN products p ON r.product_id = p.id
-        JOIN renters rn ON r.renter_id = rn.id
-        ORDER BY r.created_at DESC
+        cursor = self._read_cursor()
+        cursor.execute(ALL_RENTALS_SQL)
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def get_rentals_with_financials(self) -> List[Dict]:
+        """Get all rentals with their financial summary attached (one query, one compute pass)"""
+        rentals = self.get_all_rentals()
+        self._attach_financials(rentals)
+        return rentals
+    
+    def iter_rentals_with_financials(self, batch_size: int = 500) -> Iterator[Dict]:
+        """Stream get_rentals_with_financials, computing the amounts batch_size rentals at a time.
+        
+        The rows are read through one cursor, so the whole listing comes from the same
+        snapshot; consume it on the thread that started it.
         """
-        self.cursor.execute(query)
-        return [dict(row) for row in self.cursor.fetchall()]
+        for rentals in self._iter_batches(ALL_RENTALS_SQL, batch_size=batch_size):
+            self._attach_financials(rentals)
+            yield from rentals
+    
+    def _attach_financials(self, rentals: List[Dict]):
+        """Add the _calculate_rental_amounts keys to each rental"""
+        amounts = self._calculate_rental_amounts_many(rentals)
+        for index, rental in enumerate(rentals):
+            rental.update({key: values[index] for key, values in amounts.items()})
+    
+    def count_rentals(self) -> int:
+        """Number of rentals in the database (archived ones excluded)"""
+        return self._read_cursor().execute("SELECT COUNT(*) FROM rentals").fetchone()[0]
     
     def get_active_rentals(self) -> List[Dict]:
         """Get all active rentals"""
@@ -378,8 +2122,9 @@ class DatabaseHandler:
         WHERE r.status = 'active'
         ORDER BY r.start_date DESC
         """
-        self.cursor.execute(query)
-        return [dict(row) for row in self.cursor.fetchall()]
+        cursor = self._read_cursor()
+        cursor.execute(query)
+        return [dict(row) for row in cursor.fetchall()]
     
     def get_rental_by_id(self, rental_id: int) -> Optional[Dict]:
         """Get rental by ID"""
@@ -393,43 +2138,82 @@ class DatabaseHandler:
         JOIN renters rn ON r.renter_id = rn.id
         WHERE r.id = ?
         """
-        self.cursor.execute(query, (rental_id,))
-        row = self.cursor.fetchone()
+        row = self._read_cursor().execute(query, (rental_id,)).fetchone()
         return dict(row) if row else None
     
     def update_rental_status(self, rental_id: int, status: str):
-        """Update rental status"""
+        """Update rental status (a returned open-ended rental ends on its return date)"""
         query = "UPDATE rentals SET status = ? WHERE id = ?"
-        self.cursor.execute(query, (status, rental_id))
-        self.connection.commit()
+        with self._write() as cursor:
+            cursor.execute(query, (status, rental_id))
+            if status != 'active':
+                self._freeze_schedule(cursor, rental_id)
     
     def update_rental_payment_status(self, rental_id: int, payment_status: str):
         """Update rental payment status"""
         try:
             query = "UPDATE rentals SET payment_status = ? WHERE id = ?"
-            self.cursor.execute(query, (payment_status, rental_id))
-            self.connection.commit()
-            print(f"Updated rental {rental_id} payment status to {payment_status}")
+            with self._write() as cursor:
+                cursor.execute(query, (payment_status, rental_id))
         except sqlite3.Error as e:
             print(f"Database error updating payment status: {e}")
-            self.connection.rollback()
             raise
     
     def delete_rental(self, rental_id: int):
         """Delete a rental and associated payments"""
         query = "DELETE FROM rentals WHERE id = ?"
-        self.cursor.execute(query, (rental_id,))
-        self.connection.commit()
+        with self._write() as cursor:
+            cursor.execute(query, (rental_id,))
     
     # ==================== PAYMENT OPERATIONS ====================
     
     def get_payments_by_rental(self, rental_id: int) -> List[Dict]:
-        """Get all payments for a rental"""
+        """Get all payments for a rental (periods of a virtual schedule included, with id None)"""
         query = """SELECT * FROM payments 
                    WHERE rental_id = ? 
                    ORDER BY payment_month"""
-        self.cursor.execute(query, (rental_id,))
-        return [dict(row) for row in self.cursor.fetchall()]
+        cursor = self._read_cursor()
+        cursor.execute(query, (rental_id,))
+        payments = [dict(row) for row in cursor.fetchall()]
+        rental = self._schedule_rental(rental_id)
+        if not rental or rental['end_date']:
+            return payments
+        stored = {payment['payment_month'] for payment in payments}
+        virtual = [self._virtual_payment(period) for period in self._virtual_schedule_rows(rental)
+                   if period[3] not in stored]
+        return list(heapq.merge(payments, virtual, key=lambda payment: payment['payment_month']))
+    
+    def iter_payment_schedules(self, batch_size: int = 500) -> Iterator[Dict]:
+        """Stream the payments of every rental by rental, then month, with the product and
+        renter names (periods of virtual schedules included, with id None).
+        
+        Reads batch_size rentals at a time with their stored payments.
+        """
+        last_id = 0
+        while True:
+            cursor = self._read_cursor()
+            rentals = [dict(row) for row in cursor.execute(SCHEDULE_RENTALS_SQL, (last_id, batch_size))]
+            if not rentals:
+                return
+            last_id = rentals[-1]['id']
+            stored = {}
+            cursor.execute("""SELECT * FROM payments WHERE rental_id BETWEEN ? AND ?
+                              ORDER BY rental_id, payment_month""", (rentals[0]['id'], last_id))
+            for row in cursor:
+                stored.setdefault(row['rental_id'], []).append(dict(row))
+            for rental in rentals:
+                payments = stored.get(rental['id'], [])
+                if not rental['end_date']:
+                    months = {payment['payment_month'] for payment in payments}
+                    virtual = [self._virtual_payment(period) for period in self._virtual_schedule_rows(rental)
+                               if period[3] not in months]
+                    payments = heapq.merge(payments, virtual, key=lambda payment: payment['payment_month'])
+                for payment in payments:
+                    payment.update(product_name=rental['product_name'], renter_name=rental['renter_name'],
+                                   renter_phone=rental['renter_phone'])
+                    yield payment
+            if len(rentals) < batch_size:
+                return
     
     def get_unpaid_payments(self) -> List[Dict]:
         """Get all unpaid payments"""
@@ -443,10 +2227,201 @@ class DatabaseHandler:
         JOIN products p ON r.product_id = p.id
         JOIN renters rn ON r.renter_id = rn.id
         WHERE py.status = 'unpaid' AND r.status = 'active'
-        ORDER BY py.payment_month
+        ORDER BY py.payment_month, py.rental_id
         """
-        self.cursor.execute(query)
-        return [dict(row) for row in self.cursor.fetchall()]
+        cursor = self._read_cursor()
+        cursor.execute(query)
+        stored = [dict(row) for row in cursor.fetchall()]
+        return list(heapq.merge(stored, self._virtual_unpaid_payments(),
+                                key=self._unpaid_payment_key))
+    
+    # Virtual schedules: open-ended rentals (no end_date) store no unpaid periods; their
+    # schedule is computed on demand up to a year from today (see _payment_schedule_rows)
+    # and only paid or annotated periods are written to the payments table
+    
+    def _schedule_rental(self, rental_id: int) -> Optional[Dict]:
+        """Fields of a rental that define its payment schedule"""
+        query = """SELECT id, billing_type, rental_price, start_date, end_date
+                   FROM rentals WHERE id = ?"""
+        row = self._read_cursor().execute(query, (rental_id,)).fetchone()
+        return dict(row) if row else None
+    
+    def _virtual_schedule_rows(self, rental: Dict, horizon: datetime = None,
+                               first_period: int = 0) -> Iterator[Tuple]:
+        """(rental_id, payment_date, amount, payment_month) rows of a virtual schedule.
+        
+        The schedule runs up to horizon, a year from today by default.
+        """
+        start = parse_date(rental['start_date'])
+        if not start:
+            return
+        for current in schedule_dates(start, horizon or self._effective_end_date(),
+                                      rental['billing_type'], first_period):
+            yield (rental['id'], f"{current.year:04d}-{current.month:02d}-{current.day:02d}",
+                   rental['rental_price'], f"{current.year:04d}-{current.month:02d}")
+    
+    def _freeze_schedule(self, cursor: sqlite3.Cursor, rental_id: int):
+        """End a virtual schedule today: set the rental's end date and store its unpaid periods.
+        
+        Does nothing for a rental that already has an end date.
+        """
+        cursor.execute("""SELECT billing_type, rental_price, start_date FROM rentals
+                          WHERE id = ? AND end_date IS NULL""", (rental_id,))
+        rental = cursor.fetchone()
+        if not rental:
+            return
+        end_date = max(datetime.now().strftime("%Y-%m-%d"), rental['start_date'])
+        cursor.execute("UPDATE rentals SET end_date = ? WHERE id = ?", (end_date, rental_id))
+        cursor.execute("SELECT payment_month FROM payments WHERE rental_id = ?", (rental_id,))
+        stored = {row[0] for row in cursor.fetchall()}
+        cursor.executemany(self.PAYMENT_INSERT_QUERY, [
+            period for period in self._payment_schedule_rows(rental_id, rental['billing_type'],
+                                                             rental['rental_price'],
+                                                             rental['start_date'], end_date)
+            if period[3] not in stored
+        ])
+    
+    @staticmethod
+    def _virtual_payment(period: Tuple) -> Dict:
+        """Payment row of an unstored period of a virtual schedule"""
+        rental_id, payment_date, amount, payment_month = period
+        return {'id': None, 'rental_id': rental_id, 'payment_date': payment_date,
+                'amount': amount, 'payment_month': payment_month, 'status': 'unpaid',
+                'notes': None, 'created_at': None}
+    
+    @staticmethod
+    def _unpaid_payment_key(payment: Dict) -> Tuple:
+        """Sort and pagination key of the unpaid payments listing"""
+        return payment['payment_month'], payment['rental_id']
+    
+    def _virtual_unpaid_payments(self, after: Tuple = None) -> Iterator[Dict]:
+        """Unstored periods of the virtual schedules of active rentals by (payment_month, rental_id)"""
+        cursor = self._read_cursor()
+        cursor.execute("""
+            SELECT r.id, r.billing_type, r.rental_price, r.start_date,
+                   p.name as product_name,
+                   rn.full_name as renter_name, rn.phone as renter_phone
+            FROM rentals r
+            JOIN products p ON r.product_id = p.id
+            JOIN renters rn ON r.renter_id = rn.id
+            WHERE r.end_date IS NULL AND r.status = 'active'
+        """)
+        rentals = cursor.fetchall()
+        # Only the stored periods from the first month listed on
+        cursor.execute("""
+            SELECT py.rental_id, py.payment_month
+            FROM rentals r
+            JOIN payments py ON py.rental_id = r.id
+            WHERE r.end_date IS NULL AND r.status = 'active' AND py.payment_month >= ?
+        """, (after[0] if after else "",))
+        stored = {tuple(row) for row in cursor.fetchall()}
+        horizon = self._effective_end_date()
+        horizon_key = (horizon.year * 12 + horizon.month - 1, horizon.day)
+        after_index = int(after[0][:4]) * 12 + int(after[0][5:7]) - 1 if after else None
+        
+        # One heap entry per rental: (payment_month, rental_id, month index of the period,
+        # rental, start day, step); schedule_dates arithmetic on month indexes
+        heap = []
+        for rental in rentals:
+            step = BILLING_STEPS.get(rental['billing_type'])
+            start_date = rental['start_date']
+            if step is None or not start_date:
+                continue
+            start_index = int(start_date[:4]) * 12 + int(start_date[5:7]) - 1
+            period = max(0, (after_index - start_index) // step) if after else 0
+            index = start_index + period * step
+            heap.append((f"{index // 12:04d}-{index % 12 + 1:02d}", rental['id'], index,
+                         rental, int(start_date[8:10]), step))
+        heapq.heapify(heap)
+        
+        while heap:
+            payment_month, rental_id, index, rental, start_day, step = heap[0]
+            year, month = index // 12, index % 12 + 1
+            day = start_day if start_day <= 28 else min(start_day, calendar.monthrange(year, month)[1])
+            if (index, day) > horizon_key:
+                heapq.heappop(heap)
+                continue
+            next_index = index + step
+            heapq.heapreplace(heap, (f"{next_index // 12:04d}-{next_index % 12 + 1:02d}", rental_id,
+                                     next_index, rental, start_day, step))
+            if (rental_id, payment_month) in stored or (after and (payment_month, rental_id) <= after):
+                continue
+            yield {'id': None, 'rental_id': rental_id, 'payment_month': payment_month,
+                   'amount': rental['rental_price'], 'payment_date': f"{payment_month}-{day:02d}",
+                   'product_name': rental['product_name'],
+                   'renter_name': rental['renter_name'], 'renter_phone': rental['renter_phone']}
+    
+    @staticmethod
+    def _horizon_parameters(horizon: datetime) -> Dict:
+        """Parameters of VIRTUAL_UNPAID_COUNT_SQL for a horizon date"""
+        return {'year': horizon.year, 'month': horizon.month, 'day': horizon.day,
+                'last_day': calendar.monthrange(horizon.year, horizon.month)[1],
+                'horizon_date': horizon.strftime("%Y-%m-%d")}
+    
+    def _refresh_virtual_schedule_state(self, cursor: sqlite3.Cursor, horizon: datetime) -> int:
+        """Recount the unpaid periods of the virtual schedules up to horizon and store the count"""
+        parameters = self._horizon_parameters(horizon)
+        cursor.execute(VIRTUAL_UNPAID_COUNT_SQL, parameters)
+        parameters['unpaid_count'] = cursor.fetchone()[0]
+        cursor.execute("""INSERT OR REPLACE INTO virtual_schedule_state
+                          (id, horizon_date, year, month, day, last_day, unpaid_count)
+                          VALUES (1, :horizon_date, :year, :month, :day, :last_day, :unpaid_count)""",
+                       parameters)
+        return parameters['unpaid_count']
+    
+    def _stale_virtual_horizon(self, cursor: sqlite3.Cursor) -> Optional[datetime]:
+        """Today's horizon when virtual_schedule_state was counted for another one, else None"""
+        if not self._virtual_state_ready:
+            return None
+        horizon = self._effective_end_date()
+        row = cursor.execute("SELECT horizon_date FROM virtual_schedule_state WHERE id = 1").fetchone()
+        if row and row['horizon_date'] == horizon.strftime("%Y-%m-%d"):
+            return None
+        return horizon
+    
+    def _virtual_unpaid_count(self, cursor: sqlite3.Cursor) -> int:
+        """Number of unstored periods in the virtual schedules of active rentals.
+        
+        Read from virtual_schedule_state. Until a write moves it to a new horizon (the
+        first one of the day), the count is recomputed without storing it: reads never
+        take the writer.
+        """
+        horizon = self._stale_virtual_horizon(cursor)
+        if horizon:
+            cursor.execute(VIRTUAL_UNPAID_COUNT_SQL, self._horizon_parameters(horizon))
+            return cursor.fetchone()[0]
+        cursor.execute("SELECT unpaid_count FROM virtual_schedule_state WHERE id = 1")
+        return cursor.fetchone()[0]
+    
+    def mark_period_paid(self, rental_id: int, payment_month: str, notes: str = "") -> int:
+        """Mark the period payment_month (YYYY-MM) of a rental as paid and return the payment ID.
+        
+        Works for stored and virtual schedules: the period of a virtual schedule is
+        stored when it gets paid.
+        """
+        with self._write() as cursor:
+            cursor.execute("""UPDATE payments SET status = 'paid', notes = ?
+                              WHERE rental_id = ? AND payment_month = ?""",
+                           (notes, rental_id, payment_month))
+            if cursor.rowcount:
+                cursor.execute("SELECT id FROM payments WHERE rental_id = ? AND payment_month = ?",
+                               (rental_id, payment_month))
+                return cursor.fetchone()[0]
+            rental = self._schedule_rental(rental_id)
+            if rental:
+                if rental['end_date']:
+                    periods = self._payment_schedule_rows(rental_id, rental['billing_type'],
+                                                          rental['rental_price'], rental['start_date'],
+                                                          rental['end_date'])
+                else:
+                    periods = self._virtual_schedule_rows(rental)
+                for period in periods:
+                    if period[3] == payment_month:
+                        cursor.execute("""INSERT INTO payments
+                                          (rental_id, payment_date, amount, payment_month, status, notes)
+                                          VALUES (?, ?, ?, ?, 'paid', ?)""", period + (notes,))
+                        return cursor.lastrowid
+            raise ValueError(f"Période introuvable dans l'échéancier: {payment_month}")
     
     def get_unpaid_rentals_with_totals(self) -> List[Dict]:
         """Get all unpaid rentals with monthly payment amounts"""
@@ -455,57 +2430,71 @@ class DatabaseHandler:
             r.id, r.rental_price, r.billing_type,
             p.name as product_name,
             rn.full_name as renter_name, rn.phone as renter_phone
-        FROM rentals r
+        FROM renters rn
+        JOIN rentals r ON r.renter_id = rn.id
         JOIN products p ON r.product_id = p.id
-        JOIN renters rn ON r.renter_id = rn.id
         WHERE r.payment_status = 'unpaid' AND r.status = 'active'
         ORDER BY rn.full_name
         """
-        self.cursor.execute(query)
-        return [dict(row) for row in self.cursor.fetchall()]
+        cursor = self._read_cursor()
+        cursor.execute(query)
+        return [dict(row) for row in cursor.fetchall()]
     
     def mark_payment_paid(self, payment_id: int, notes: str = ""):
         """Mark a payment as paid"""
         query = "UPDATE payments SET status = 'paid', notes = ? WHERE id = ?"
-        self.cursor.execute(query, (notes, payment_id))
-        self.connection.commit()
+        with self._write() as cursor:
+            cursor.execute(query, (notes, payment_id))
     
     def mark_payment_unpaid(self, payment_id: int):
         """Mark a payment as unpaid"""
         query = "UPDATE payments SET status = 'unpaid' WHERE id = ?"
-        self.cursor.execute(query, (payment_id,))
-        self.connection.commit()
+        with self._write() as cursor:
+            cursor.execute(query, (payment_id,))
+            # An unpaid period of a virtual schedule is only kept for its notes
+            cursor.execute("""DELETE FROM payments
+                              WHERE id = ? AND COALESCE(notes, '') = ''
+                              AND EXISTS (SELECT 1 FROM rentals r
+                                          WHERE r.id = payments.rental_id AND r.end_date IS NULL)""",
+                           (payment_id,))
     
     def update_tenant_payment_status(self, renter_id: int, payment_status: str):
         """Update payment status for all active rentals of a tenant."""
         query = """UPDATE rentals SET payment_status = ? 
                    WHERE renter_id = ? AND status = 'active'"""
-        self.cursor.execute(query, (payment_status, renter_id))
-        self.connection.commit()
+        with self._write() as cursor:
+            cursor.execute(query, (payment_status, renter_id))
     
     def _calculate_rental_amounts(self, rental: Dict) -> Dict:
-        """Calculate brut, net, acompte, reste, received and owed for a rental."""
+        """Calculate brut, net, acompte, reste, received and owed for a rental.
+        
+        A rental without a valid start date owes nothing; an invalid end date raises
+        ValueError (a missing one means the rental runs until today).
+        """
         start = parse_date(rental['start_date'])
         end_raw = rental.get('end_date')
         end = parse_date(end_raw) if end_raw else datetime.now().replace(
             hour=0, minute=0, second=0, microsecond=0
         )
+        if end is None:
+            raise ValueError(f"Date de fin invalide: {end_raw}")
         if not start:
             return {
-                'total_brut': 0.0, 'total_net': 0.0, 'acompte': 0.0,
-                'reste': 0.0, 'total_received': 0.0, 'still_owed': 0.0
+                'total_brut': Money(), 'total_net': Money(), 'acompte': Money(),
+                'escompte': Money(), 'reste': Money(), 'total_to_pay': Money(),
+                'total_received': Money(), 'still_owed': Money(), 'periods': 0
             }
         
         periods = count_billing_periods(start, end, rental['billing_type'])
-        total_brut = rental['rental_price'] * periods
-        acompte = float(rental.get('acompte') or 0)
-        escompte = float(rental.get('escompte') or 0)
-        total_net = max(0.0, total_brut - escompte)
-        reste = max(0.0, total_net - acompte)
+        total_brut = Money.from_tnd(rental['rental_price']) * periods
+        acompte = Money.from_tnd(rental.get('acompte') or 0)
+        escompte = Money.from_tnd(rental.get('escompte') or 0)
+        total_net = max(Money(), total_brut - escompte)
+        reste = max(Money(), total_net - acompte)
         
         if rental.get('payment_status') == 'paid':
             total_received = total_net
-            still_owed = 0.0
+            still_owed = Money()
         else:
             total_received = acompte
             still_owed = reste
@@ -522,86 +2511,59 @@ class DatabaseHandler:
             'periods': periods
         }
     
+    def _calculate_rental_amounts_many(self, rentals: List[Dict]) -> Dict[str, List]:
+        """Calculate _calculate_rental_amounts for many rentals, returned column by column.
+        
+        Uses the NumPy engine when available; results are identical to the scalar path.
+        """
+        if HAS_NUMPY and rentals:
+            columns = compute_rental_amounts_from_rows(rentals)
+            converted = {}  # total_to_pay is the total_net array: convert it once
+            for key, values in columns.items():
+                if id(values) not in converted:
+                    values = values.tolist()
+                    converted[id(columns[key])] = values if key == 'periods' else list(map(Money, values))
+            return {key: converted[id(values)] for key, values in columns.items()}
+        columns = {}
+        for rental in rentals:
+            for key, value in self._calculate_rental_amounts(rental).items():
+                columns.setdefault(key, []).append(value)
+        return columns
+    
     # ==================== STATISTICS & REPORTS ====================
     
-    def get_total_unpaid_amount(self) -> float:
+    @staticmethod
+    def _today_parameter() -> Dict:
+        """:today parameter of RENTAL_PERIODS_SQL"""
+        return {'today': datetime.now().strftime("%Y-%m-%d")}
+    
+    def get_total_unpaid_amount(self) -> Money:
         """Get total amount still owed across all unpaid active rentals."""
-        query = """
-        SELECT r.rental_price, r.billing_type, r.start_date, r.end_date,
-               r.payment_status, r.acompte, r.escompte
-        FROM rentals r
-        WHERE r.payment_status = 'unpaid' AND r.status = 'active'
+        query = f"""
+        SELECT COALESCE(SUM({RENTAL_OWED_SQL.format(rental="")}), 0) AS still_owed
+        FROM rentals
+        WHERE payment_status = 'unpaid' AND status = 'active'
         """
-        self.cursor.execute(query)
-        rentals = self.cursor.fetchall()
-        
-        return sum(
-            self._calculate_rental_amounts(dict(row))['still_owed']
-            for row in rentals
-        )
+        return self._read_cursor().execute(query, self._today_parameter()).fetchone()['still_owed']
     
     def get_tenant_totals(self) -> List[Dict]:
         """Get totals for each tenant showing amount received and amount still owed"""
-        query = """
-        SELECT 
-            rt.id as renter_id,
-            rt.full_name as renter_name,
-            rt.phone as renter_phone,
-            COUNT(r.id) as total_rentals,
-            SUM(CASE WHEN r.payment_status = 'paid' THEN 1 ELSE 0 END) as paid_rentals,
-            SUM(CASE WHEN r.payment_status = 'unpaid' THEN 1 ELSE 0 END) as unpaid_rentals
-        FROM renters rt
-        LEFT JOIN rentals r ON rt.id = r.renter_id AND r.status = 'active'
-        GROUP BY rt.id, rt.full_name, rt.phone
-        ORDER BY rt.full_name
-        """
-        self.cursor.execute(query)
-        tenants = self.cursor.fetchall()
-        
-        tenant_totals = []
-        
-        for tenant in tenants:
-            rentals_query = """
-            SELECT rental_price, billing_type, start_date, end_date,
-                   payment_status, acompte, escompte
-            FROM rentals
-            WHERE renter_id = ? AND status = 'active'
-            """
-            self.cursor.execute(rentals_query, (tenant['renter_id'],))
-            rentals = self.cursor.fetchall()
-            
-            total_received = 0.0
-            total_owed = 0.0
-            for rental in rentals:
-                amounts = self._calculate_rental_amounts(dict(rental))
-                total_received += amounts['total_received']
-                total_owed += amounts['still_owed']
-            
-            paid_count = tenant['paid_rentals'] or 0
-            unpaid_count = tenant['unpaid_rentals'] or 0
-            if paid_count > 0 and unpaid_count > 0:
-                payment_label = 'partiel'
-            elif unpaid_count > 0:
-                payment_label = 'impayé'
-            elif paid_count > 0:
-                payment_label = 'payé'
-            else:
-                payment_label = 'aucune location'
-            
-            tenant_totals.append({
-                'renter_id': tenant['renter_id'],
-                'renter_name': tenant['renter_name'],
-                'renter_phone': tenant['renter_phone'],
-                'total_rentals': tenant['total_rentals'] or 0,
-                'paid_rentals': paid_count,
-                'unpaid_rentals': unpaid_count,
-                'payment_status': payment_label,
-                'total_received': total_received,
-                'total_owed': total_owed,
-                'total_amount': total_received + total_owed
-            })
-        
-        return tenant_totals
+        return list(self.iter_tenant_totals())
+    
+    def iter_tenant_totals(self, batch_size: int = 500) -> Iterator[Dict]:
+        """Stream get_tenant_totals through one cursor (consume it on the thread that started it)"""
+        for batch in self._iter_batches(TENANT_TOTALS_SQL, self._today_parameter(), batch_size):
+            for tenant in batch:
+                if tenant['paid_rentals'] > 0 and tenant['unpaid_rentals'] > 0:
+                    tenant['payment_status'] = 'partiel'
+                elif tenant['unpaid_rentals'] > 0:
+                    tenant['payment_status'] = 'impayé'
+                elif tenant['paid_rentals'] > 0:
+                    tenant['payment_status'] = 'payé'
+                else:
+                    tenant['payment_status'] = 'aucune location'
+                tenant['total_amount'] = tenant['total_received'] + tenant['total_owed']
+                yield tenant
     
     def get_rental_financial_summary(self, rental_id: int) -> Dict:
         """Get financial summary for a specific rental"""
@@ -611,83 +2573,406 @@ class DatabaseHandler:
         FROM rentals
         WHERE id = ?
         """
-        self.cursor.execute(query, (rental_id,))
-        rental = self.cursor.fetchone()
+        rental = self._read_cursor().execute(query, (rental_id,)).fetchone()
         
         if not rental:
             return {
-                'total_brut': 0.0, 'total_net': 0.0, 'acompte': 0.0,
-                'escompte': 0.0, 'reste': 0.0,
-                'total_to_pay': 0.0, 'total_received': 0.0, 'still_owed': 0.0
+                'total_brut': Money(), 'total_net': Money(), 'acompte': Money(),
+                'escompte': Money(), 'reste': Money(),
+                'total_to_pay': Money(), 'total_received': Money(), 'still_owed': Money()
             }
         
         return self._calculate_rental_amounts(dict(rental))
     
-    def get_total_income(self) -> float:
-        """Calculate total income from paid payments"""
-        query = "SELECT SUM(amount) as total FROM payments WHERE status = 'paid'"
-        self.cursor.execute(query)
-        result = self.cursor.fetchone()
-        return result['total'] if result['total'] else 0.0
+    def get_total_income(self) -> Money:
+        """Calculate total income from paid payments, archived ones included"""
+        query = "SELECT COALESCE(SUM(amount), 0) as total_income FROM payments WHERE status = 'paid'"
+        cursor = self._read_cursor()
+        return cursor.execute(query).fetchone()['total_income'] + self._archived_income(cursor)
     
-    def get_income_by_rental(self, rental_id: int) -> Tuple[float, float]:
+    def get_income_by_rental(self, rental_id: int) -> Tuple[Money, Money]:
         """Get paid and expected income for a rental"""
-        query_paid = """SELECT SUM(amount) as total FROM payments 
+        query_paid = """SELECT COALESCE(SUM(amount), 0) as total_paid FROM payments 
                        WHERE rental_id = ? AND status = 'paid'"""
-        self.cursor.execute(query_paid, (rental_id,))
-        paid = self.cursor.fetchone()['total'] or 0.0
+        cursor = self._read_cursor()
+        cursor.execute(query_paid, (rental_id,))
+        paid = cursor.fetchone()['total_paid']
+        
+        rental = self._schedule_rental(rental_id)
+        if rental and not rental['end_date']:
+            return paid, sum((payment['amount'] for payment in self.get_payments_by_rental(rental_id)),
+                             Money())
         
-        query_expected = """SELECT SUM(amount) as total FROM payments 
+        query_expected = """SELECT COALESCE(SUM(amount), 0) as total_expected FROM payments 
                            WHERE rental_id = ?"""
-        self.cursor.execute(query_expected, (rental_id,))
-        expected = self.cursor.fetchone()['total'] or 0.0
+        cursor.execute(query_expected, (rental_id,))
+        expected = cursor.fetchone()['total_expected']
         
         return paid, expected
     
     def get_dashboard_stats(self) -> Dict:
-        """Get statistics for dashboard"""
-        stats = {}
-        
-        # Total products
-        self.cursor.execute("SELECT COUNT(*) as count FROM products")
-        stats['total_products'] = self.cursor.fetchone()['count']
-        
-        # Active rentals
-        self.cursor.execute("SELECT COUNT(*) as count FROM rentals WHERE status = 'active'")
-        stats['active_rentals'] = self.cursor.fetchone()['count']
+        """Get statistics for dashboard (read from the trigger-maintained counters).
         
-        # Total renters
-        self.cursor.execute("SELECT COUNT(*) as count FROM renters")
-        stats['total_renters'] = self.cursor.fetchone()['count']
-        
-        # Paid rentals
-        self.cursor.execute("SELECT COUNT(*) as count FROM rentals WHERE payment_status = 'paid' AND status = 'active'")
-        stats['paid_rentals'] = self.cursor.fetchone()['count']
+        unpaid_count also includes the unpaid periods of virtual schedules, and
+        total_income the archived payments.
+        """
+        cursor = self._read_cursor()
+        stats = self._stored_stats_counters(cursor)
+        stats['unpaid_count'] += self._virtual_unpaid_count(cursor)
+        stats['total_income'] += self._archived_income(cursor)
+        return stats
+    
+    @staticmethod
+    def _archived_income(cursor: sqlite3.Cursor) -> Money:
+        """Paid amounts of the payments moved to the archive"""
+        return Money(cursor.execute("SELECT archived_income FROM archive_state WHERE id = 1").fetchone()[0])
+    
+    def _stored_stats_counters(self, cursor: sqlite3.Cursor = None) -> Dict:
+        """The stats_counters row as stored"""
+        cursor = cursor or self._read_cursor()
+        stats = dict(cursor.execute("SELECT * FROM stats_counters WHERE id = 1").fetchone())
+        del stats['id']
+        return stats
+    
+    def _compute_stats_counters(self, cursor: sqlite3.Cursor = None) -> Dict:
+        """Recompute every dashboard counter from the base tables"""
+        cursor = cursor or self._read_cursor()
+        stats = {}
+        for name, query in STATS_COUNTER_QUERIES.items():
+            cursor.execute(query)
+            stats[name] = cursor.fetchone()[0]
+        return stats
+    
+    def rebuild_stats_counters(self) -> Dict:
+        """Recompute the dashboard counters from scratch and store them"""
+        with self._write() as cursor:
+            stats = self._compute_stats_counters(cursor)
+            columns = ", ".join(stats)
+            placeholders = ", ".join("?" for _ in stats)
+            cursor.execute(
+                f"INSERT OR REPLACE INTO stats_counters (id, {columns}) VALUES (1, {placeholders})",
+                tuple(stats.values())
+            )
+        return stats
+    
+    def verify_stats_counters(self, tolerance: float = 1e-6) -> Dict:
+        """Compare stored counters with recomputed values.
         
-        # Unpaid rentals
-        self.cursor.execute("SELECT COUNT(*) as count FROM rentals WHERE payment_status = 'unpaid' AND status = 'active'")
-        stats['unpaid_rentals'] = self.cursor.fetchone()['count']
+        Returns {name: (stored, actual)} for every counter that drifted.
+        """
+        cursor = self._read_cursor()
+        stored = self._stored_stats_counters(cursor)
+        actual = self._compute_stats_counters(cursor)
+        # The virtual schedule count is checked at the horizon it was stored for
+        state = cursor.execute("SELECT * FROM virtual_schedule_state WHERE id = 1").fetchone()
+        if state:
+            stored['virtual_unpaid_count'] = state['unpaid_count']
+            cursor.execute(VIRTUAL_UNPAID_COUNT_SQL, {name: state[name] for name in _HORIZON_PARAMETERS})
+            actual['virtual_unpaid_count'] = cursor.fetchone()[0]
+        return {
+            name: (stored[name], value)
+            for name, value in actual.items()
+            if abs(stored[name] - value) > tolerance
+        }
+    
+    # ==================== IMPORT ====================
+    
+    RENTER_FIELDS = ('full_name', 'phone', 'email', 'address', 'id_number')
+    
+    def _find_renter(self, cursor: sqlite3.Cursor, renter: Dict) -> Optional[sqlite3.Row]:
+        """Existing renter with the item's ID number, or else with its phone.
         
-        # Unpaid payments count (legacy support)
-        self.cursor.execute("SELECT COUNT(*) as count FROM payments WHERE status = 'unpaid'")
-        stats['unpaid_count'] = self.cursor.fetchone()['count']
+        Equal index keys are stored by rowid, so the first match is the oldest renter.
+        """
+        columns = ", ".join(('id',) + self.RENTER_FIELDS)
+        if renter.get('id_number'):
+            cursor.execute(f"""SELECT {columns} FROM renters WHERE id_number = ? AND id_number <> ''
+                               LIMIT 1""", (renter['id_number'],))
+            row = cursor.fetchone()
+            if row:
+                return row
+        if renter.get('phone') and phone_key(renter['phone']):
+            cursor.execute(f"""SELECT {columns} FROM renters WHERE {RENTER_PHONE_KEY_SQL} = ? AND phone <> ''
+                               LIMIT 1""", (phone_key(renter['phone']),))
+            return cursor.fetchone()
+        return None
+    
+    def import_renters(self, renters: List[Dict]) -> List[Tuple[int, str]]:
+        """Insert or update a batch of renters, matched by ID number, then by phone.
+    
+        Each item holds add_renter arguments as keys; a matched renter takes the item's
+        non-empty values. Returns (renter_id, 'created' | 'updated' | 'unchanged') per
+        item, a renter repeated in the batch being 'unchanged' after its first item.
+        New renters are inserted with one executemany.
+        """
+        with self._write() as cursor:
+            return self._import_renters(cursor, renters)
+    
+    def _import_renters(self, cursor: sqlite3.Cursor, renters: List[Dict]) -> List[Tuple[int, str]]:
+        results, seen, created, updates = [], {}, [], []
+        for renter in renters:
+            keys = [key for key in (('id_number', renter.get('id_number') or ""),
+                                    ('phone', phone_key(renter.get('phone') or ""))) if key[1]]
+            entry = next((seen[key] for key in keys if key in seen), None)
+            if entry is not None:
+                results.append((entry, False))
+                continue
+            existing = self._find_renter(cursor, renter)
+            values = tuple(renter.get(field) or (existing[field] if existing else "")
+                           for field in self.RENTER_FIELDS)
+            if existing is None:
+                entry = [None, 'created', values]
+                created.append(entry)
+            elif values != tuple(existing[field] for field in self.RENTER_FIELDS):
+                entry = [existing['id'], 'updated']
+                updates.append(values + (existing['id'],))
+            else:
+                entry = [existing['id'], 'unchanged']
+            results.append((entry, True))
+            for key in keys:
+                seen[key] = entry
+        cursor.executemany("""UPDATE renters SET full_name = ?, phone = ?, email = ?, address = ?,
+                              id_number = ? WHERE id = ?""", updates)
+        new_ids = self._insert_indexed(cursor, 'renter', """INSERT INTO renters (full_name, phone, email, address,
+                                           id_number) VALUES (?, ?, ?, ?, ?)""",
+                                       [entry[2] for entry in created])
+        for entry, renter_id in zip(created, new_ids):
+            entry[0] = renter_id
+        for entry, first in results:
+            if first and entry[1] != 'unchanged':
+                self._invalidate('renter', entry[0])
+        return [(entry[0], entry[1] if first else 'unchanged') for entry, first in results]
+    
+    def import_products(self, products: List[Dict]) -> List[Tuple[int, str]]:
+        """Insert or update a batch of products, matched by name.
+    
+        Each item has a name and optionally type and rental_price (required for a new
+        product); a matched product takes the ones given. Returns (product_id, status)
+        per item like import_renters.
+        """
+        with self._write() as cursor:
+            return self._import_products(cursor, products)
+    
+    def _import_products(self, cursor: sqlite3.Cursor, products: List[Dict]) -> List[Tuple[int, str]]:
+        results, seen, created, updates = [], {}, [], []
+        for product in products:
+            entry = seen.get(product['name'])
+            if entry is not None:
+                results.append((entry, False))
+                continue
+            cursor.execute("SELECT id, type, rental_price FROM products WHERE name = ? ORDER BY id LIMIT 1",
+                           (product['name'],))
+            existing = cursor.fetchone()
+            price = product.get('rental_price')
+            price = Money.from_tnd(price) if price not in (None, "") else None
+            if existing is None:
+                if not product.get('type') or price is None:
+                    raise ValueError(f"Type et prix requis pour le nouveau produit {product['name']}")
+                entry = [None, 'created', (product['name'], product['type'], price)]
+                created.append(entry)
+            else:
+                values = (product.get('type') or existing['type'],
+                          existing['rental_price'] if price is None else price)
+                if values != (existing['type'], existing['rental_price']):
+                    entry = [existing['id'], 'updated']
+                    updates.append(values + (existing['id'],))
+                else:
+                    entry = [existing['id'], 'unchanged']
+            results.append((entry, True))
+            seen[product['name']] = entry
+        cursor.executemany("UPDATE products SET type = ?, rental_price = ? WHERE id = ?", updates)
+        new_ids = self._insert_many(cursor, "INSERT INTO products (name, type, rental_price) VALUES (?, ?, ?)",
+                                    [entry[2] for entry in created])
+        for entry, product_id in zip(created, new_ids):
+            entry[0] = product_id
+        for entry, first in results:
+            if first and entry[1] != 'unchanged':
+                self._invalidate('product', entry[0])
+        return [(entry[0], entry[1] if first else 'unchanged') for entry, first in results]
+    
+    def import_rentals(self, rentals: List[Dict]) -> List[Tuple[int, str]]:
+        """Add a batch of rentals, skipping those already recorded.
+    
+        Items are add_rentals_bulk items; instead of renter_id and product_id an item
+        may hold a renter (an import_renters item) and a product (an import_products
+        item), imported in the same transaction. A rental of the same renter and product
+        starting on the same day is kept as is ('unchanged'), including one repeated in
+        the batch. Rentals moved to the archive are not looked up. Returns
+        (rental_id, status) per item.
+        """
+        with self._write() as cursor:
+            rentals = [dict(rental) for rental in rentals]
+            for kind, importer in (('renter', self._import_renters), ('product', self._import_products)):
+                items = [rental for rental in rentals if kind in rental]
+                for rental, (entity_id, _) in zip(items, importer(cursor, [rental.pop(kind) for rental in items])):
+                    rental[f'{kind}_id'] = entity_id
+    
+            results, seen, new_rentals, created = [], {}, [], []
+            for rental in rentals:
+                key = (rental['renter_id'], rental['product_id'], to_iso_date(rental['start_date']))
+                entry = seen.get(key)
+                if entry is not None:
+                    results.append((entry, False))
+                    continue
+                cursor.execute("""SELECT id FROM rentals WHERE renter_id = ? AND product_id = ? AND start_date = ?
+                                  ORDER BY id LIMIT 1""", key)
+                existing = cursor.fetchone()
+                if existing:
+                    entry = [existing['id'], 'unchanged']
+                else:
+                    entry = [None, 'created']
+                    new_rentals.append(rental)
+                    created.append(entry)
+                results.append((entry, True))
+                seen[key] = entry
+            for entry, rental_id in zip(created, self._insert_rentals(cursor, new_rentals) if new_rentals else []):
+                entry[0] = rental_id
+        return [(entry[0], entry[1] if first else 'unchanged') for entry, first in results]
+    
+    # ==================== ARCHIVE ====================
+    
+    def archive_closed_rentals(self, older_than_days: int = 365, batch_size: int = 500) -> Dict:
+        """Move the closed history to the archive database, batch_size rentals at a time.
         
-        # Total income
-        stats['total_income'] = self.get_total_income()
+        Returned rentals that ended more than older_than_days ago and have no unpaid
+        payment left are moved with their payments, so the main tables only hold the
+        rentals still in use. Each batch is copied into the archive in one transaction,
+        then deleted from the main tables in another: an interrupted run leaves rows in
+        both, never in neither, and the next run finishes moving them. Other threads
+        can write between batches. Returns the number of rentals and payments moved.
+        """
+        if not self.archive_path:
+            raise ValueError("Pas d'archive pour une base en mémoire")
+        if older_than_days < 0 or batch_size < 1:
+            raise ValueError("Paramètres d'archivage invalides")
+        cutoff = (datetime.now() - timedelta(days=older_than_days)).strftime("%Y-%m-%d")
+        moved = {'rentals': 0, 'payments': 0}
+        while True:
+            with self.pool.write_lock:
+                if self._write_depth or self.connection.in_transaction:
+                    raise RuntimeError("L'archivage ne peut pas s'exécuter dans une transaction")
+                self.connection.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+                try:
+                    batch = self._archive_batch(cutoff, batch_size)
+                finally:
+                    self.connection.execute("DETACH DATABASE archive")
+            if not batch['rentals']:
+                return moved
+            moved['rentals'] += batch['rentals']
+            moved['payments'] += batch['payments']
+    
+    def _archive_batch(self, cutoff: str, batch_size: int) -> Dict:
+        """Move one batch of closed rentals to the attached archive"""
+        journal_mode = STORAGE_PROFILES[self.profile]['journal_mode']
+        self.connection.execute(f"PRAGMA archive.journal_mode = {journal_mode}")
+        self.connection.executescript(ARCHIVE_SCHEMA_SQL)
+        with self._write() as cursor:
+            rental_ids = [row[0] for row in cursor.execute(ARCHIVE_CANDIDATES_SQL, (cutoff, batch_size))]
+            if not rental_ids:
+                return {'rentals': 0, 'payments': 0}
+            marks = ", ".join("?" for _ in rental_ids)
+            for table, key in (('rentals', 'id'), ('payments', 'rental_id')):
+                columns = ", ".join(ARCHIVE_COLUMNS[table])
+                cursor.execute(f"""INSERT OR REPLACE INTO archive.{table} ({columns})
+                                   SELECT {columns} FROM main.{table} WHERE {key} IN ({marks})""",
+                               rental_ids)
+        with self._write() as cursor:
+            income = cursor.execute(f"""SELECT COALESCE(SUM(amount), 0) FROM main.payments
+                                        WHERE rental_id IN ({marks}) AND status = 'paid'""",
+                                    rental_ids).fetchone()[0]
+            cursor.execute(f"DELETE FROM main.payments WHERE rental_id IN ({marks})", rental_ids)
+            payments = cursor.rowcount
+            cursor.execute(f"DELETE FROM main.rentals WHERE id IN ({marks})", rental_ids)
+            cursor.execute("""UPDATE archive_state SET
+                                  archived_rentals = archived_rentals + ?,
+                                  archived_payments = archived_payments + ?,
+                                  archived_income = archived_income + ?,
+                                  last_archived_at = CURRENT_TIMESTAMP
+                              WHERE id = 1""", (len(rental_ids), payments, income))
+        return {'rentals': len(rental_ids), 'payments': payments}
+    
+    def _history_cursor(self) -> Tuple[sqlite3.Cursor, bool]:
+        """Read cursor with the archive attached, and whether there is an archive to read"""
+        connection = self.pool.reader()
+        if not self.archive_path or not os.path.exists(self.archive_path):
+            return connection.cursor(), False
+        attached = {row[1] for row in connection.execute("PRAGMA database_list")}
+        if 'archive' not in attached:
+            connection.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+        return connection.cursor(), True
+    
+    @staticmethod
+    def _with_archive(query: str, archived: str, has_archive: bool) -> str:
+        """query, followed by UNION ALL archived when there is an archive"""
+        return f"{query} UNION ALL {archived}" if has_archive else query
+    
+    def get_rental_history(self, renter_id: int = None) -> List[Dict]:
+        """Every rental, archived ones included (archived = 1), newest first.
         
-        return stats
+        Archived rows still in the main tables (a batch interrupted between its two
+        transactions) are listed once, from the main tables.
+        """
+        cursor, has_archive = self._history_cursor()
+        columns = ", ".join(f"r.{column}" for column in ARCHIVE_COLUMNS['rentals'])
+        rentals = self._with_archive(
+            f"SELECT {columns}, 0 AS archived FROM main.rentals r WHERE :renter_id IS NULL OR r.renter_id = :renter_id",
+            f"""SELECT {columns}, 1 AS archived FROM archive.rentals r
+                WHERE (:renter_id IS NULL OR r.renter_id = :renter_id)
+                  AND NOT EXISTS (SELECT 1 FROM main.rentals WHERE id = r.id)""",
+            has_archive
+        )
+        query = f"""
+        SELECT h.*, p.name AS product_name, p.type AS product_type,
+               rn.full_name AS renter_name, rn.phone AS renter_phone
+        FROM ({rentals}) h
+        LEFT JOIN products p ON h.product_id = p.id
+        LEFT JOIN renters rn ON h.renter_id = rn.id
+        ORDER BY h.start_date DESC, h.id DESC
+        """
+        return [dict(row) for row in cursor.execute(query, {'renter_id': renter_id})]
     
-    def save_all(self, backup_dir: str = "backups") -> str:
-        """Flush pending changes and create a full database backup."""
-        if self.connection:
-            self.connection.commit()
-        os.makedirs(backup_dir, exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_path = os.path.join(backup_dir, f"rental_management_backup_{timestamp}.db")
-        shutil.copy2(self.db_name, backup_path)
-        return os.path.abspath(backup_path)
+    def get_income_history(self) -> List[Dict]:
+        """Paid income per month (payment_month, total_paid), archived payments included"""
+        cursor, has_archive = self._history_cursor()
+        payments = self._with_archive(
+            "SELECT payment_month, amount FROM main.payments WHERE status = 'paid'",
+            """SELECT payment_month, amount FROM archive.payments py
+               WHERE status = 'paid' AND NOT EXISTS (SELECT 1 FROM main.payments WHERE id = py.id)""",
+            has_archive
+        )
+        query = f"""SELECT payment_month, SUM(amount) AS total_paid FROM ({payments})
+                    GROUP BY payment_month ORDER BY payment_month"""
+        return [dict(row) for row in cursor.execute(query)]
+    
+    def save_all(self, backup_dir: str = "backups",
+                 progress: Optional[Callable[[int, int], None]] = None,
+                 incremental: bool = False) -> str:
+        """Flush pending changes and create a compressed online backup.
+        
+        The copy goes through the SQLite backup API, so it is consistent even while
+        the database is being written. Old snapshots are pruned by BackupManager.
+        With incremental=True only the chunks changed since earlier snapshots are
+        stored and the path of the snapshot manifest is returned. The archive database
+        is saved with it and restored together by BackupManager.
+        """
+        with self.pool.write_lock:
+            # Inside a transaction the backup holds its last committed state
+            if not self._write_depth:
+                self.connection.commit()
+        # Copy from this thread's read connection so writers are not held up, the
+        # archive (attached by _history_cursor) included
+        self._history_cursor()
+        source = self.pool.reader()
+        manager = BackupManager(self.db_name, backup_dir, archive_name=self.archive_path)
+        if incremental:
+            return manager.create_incremental_backup(source, progress)
+        return manager.create_backup(source, progress)
     
     def close(self):
-        """Close database connection"""
-        if self.connection:
-            self.connection.close()
+        """Close every database connection"""
+        self.disable_instrumentation()
+        if self.pool:
+            # Let SQLite re-analyze the tables this session's queries found with stale statistics
+            with self.pool.write_lock:
+                self.connection.execute("PRAGMA optimize")
+            self.pool.close()
@@ -1,5 +1,7 @@
 -- Rental Management System Database Schema
 -- SQLite Database Design
+-- Reference copy: the application builds its schema from SCHEMA_SQL and the
+-- migrations in database.py (DatabaseHandler.MIGRATIONS), not from this file
 
 -- Table: products
 -- Stores information about beds and equipment available for rent
@@ -7,7 +9,7 @@ CREATE TABLE IF NOT EXISTS products (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     name TEXT NOT NULL,
     type TEXT NOT NULL CHECK(type IN ('bed', 'equipment')),
-    rental_price REAL NOT NULL,
+    rental_price INTEGER NOT NULL CHECK(typeof(rental_price) = 'integer'), -- millimes
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -30,13 +32,13 @@ CREATE TABLE IF NOT EXISTS rentals (
     product_id INTEGER NOT NULL,
     renter_id INTEGER NOT NULL,
     billing_type TEXT NOT NULL CHECK(billing_type IN ('monthly', 'yearly')),
-    rental_price REAL NOT NULL,
+    rental_price INTEGER NOT NULL CHECK(typeof(rental_price) = 'integer'), -- millimes
     start_date DATE NOT NULL,
     end_date DATE,
     status TEXT NOT NULL DEFAULT 'active' CHECK(status IN ('active', 'returned')),
     payment_status TEXT NOT NULL DEFAULT 'unpaid' CHECK(payment_status IN ('paid', 'unpaid')),
-    acompte REAL NOT NULL DEFAULT 0,
-    escompte REAL NOT NULL DEFAULT 0,
+    acompte INTEGER NOT NULL DEFAULT 0 CHECK(typeof(acompte) = 'integer'),
+    escompte INTEGER NOT NULL DEFAULT 0 CHECK(typeof(escompte) = 'integer'),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE,
     FOREIGN KEY (renter_id) REFERENCES renters(id) ON DELETE CASCADE
@@ -48,7 +50,7 @@ CREATE TABLE IF NOT EXISTS payments (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     rental_id INTEGER NOT NULL,
     payment_date DATE NOT NULL,
-    amount REAL NOT NULL,
+    amount INTEGER NOT NULL CHECK(typeof(amount) = 'integer'), -- millimes
     payment_month TEXT NOT NULL, -- Format: YYYY-MM
     status TEXT NOT NULL DEFAULT 'unpaid' CHECK(status IN ('paid', 'unpaid')),
     notes TEXT,
@@ -62,6 +64,20 @@ CREATE INDEX IF NOT EXISTS idx_rentals_dates ON rentals(start_date, end_date);
 CREATE INDEX IF NOT EXISTS idx_payments_status ON payments(status);
 CREATE INDEX IF NOT EXISTS idx_payments_rental ON payments(rental_id);
 CREATE INDEX IF NOT EXISTS idx_payments_month ON payments(payment_month);
+CREATE INDEX IF NOT EXISTS idx_products_name ON products(name);
+CREATE INDEX IF NOT EXISTS idx_renters_name ON renters(full_name);
+CREATE INDEX IF NOT EXISTS idx_rentals_renter ON rentals(renter_id);
+CREATE INDEX IF NOT EXISTS idx_rentals_product ON rentals(product_id);
+CREATE INDEX IF NOT EXISTS idx_rentals_payment_status ON rentals(payment_status, status);
+CREATE INDEX IF NOT EXISTS idx_rentals_created ON rentals(created_at);
+CREATE INDEX IF NOT EXISTS idx_rentals_active_start ON rentals(start_date) WHERE status = 'active';
+CREATE INDEX IF NOT EXISTS idx_rentals_unpaid_active ON rentals(renter_id)
+    WHERE payment_status = 'unpaid' AND status = 'active';
+CREATE INDEX IF NOT EXISTS idx_payments_rental_month ON payments(rental_id, payment_month);
+CREATE INDEX IF NOT EXISTS idx_payments_unpaid_month_rental ON payments(payment_month, rental_id)
+    WHERE status = 'unpaid';
+CREATE INDEX IF NOT EXISTS idx_rentals_open_ended ON rentals(start_date)
+    WHERE end_date IS NULL AND status = 'active';
 
 -- Views for reporting
 CREATE VIEW IF NOT EXISTS active_rentals AS
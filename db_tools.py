@@ -0,0 +1,148 @@
+"""
+Database Maintenance Tools for Rental Management System
+Command line entry point for maintenance tasks on rental_management.db
+"""
+
+import argparse
+import sys
+
+from csv_import import DEFAULT_CHUNK_SIZE, IMPORT_KINDS, import_csv
+from data_export import EXPORT_KINDS, export_data
+from database import DatabaseHandler
+
+
+def verify_stats(db: DatabaseHandler, args=None) -> int:
+    """Report drift between stored dashboard counters and the base tables"""
+    drift = db.verify_stats_counters()
+    if not drift:
+        print("✓ Dashboard counters are consistent")
+        return 0
+    for name, (stored, actual) in drift.items():
+        print(f"✗ {name}: stored={stored} actual={actual}")
+    return 1
+
+
+def rebuild_stats(db: DatabaseHandler, args=None) -> int:
+    """Recompute dashboard counters from scratch, reporting what drifted"""
+    verify_stats(db)
+    stats = db.rebuild_stats_counters()
+    print("✓ Dashboard counters rebuilt:")
+    for name, value in stats.items():
+        print(f"  - {name}: {value}")
+    return 0
+
+
+def rebuild_search(db: DatabaseHandler, args=None) -> int:
+    """Rebuild the full-text search index from the base tables"""
+    if not db.has_search_index:
+        print("✗ SQLite was built without FTS5: no search index to rebuild")
+        return 1
+    db.rebuild_search_index()
+    print("✓ Search index rebuilt")
+    return 0
+
+
+def analyze(db: DatabaseHandler, args=None) -> int:
+    """Refresh the query planner statistics"""
+    db.analyze()
+    print("✓ Query planner statistics refreshed")
+    return 0
+
+
+def archive(db: DatabaseHandler, args=None) -> int:
+    """Move returned, fully paid rentals older than --older-than days to the archive database"""
+    older_than = args.older_than if args is not None else 365
+    moved = db.archive_closed_rentals(older_than_days=older_than)
+    print(f"✓ Archived {moved['rentals']} rental(s) and {moved['payments']} payment(s) "
+          f"to {db.archive_path}")
+    return 0
+
+
+def audit_queries(db: DatabaseHandler, args=None) -> int:
+    """Flag full scans and temp B-trees in the plans of every DatabaseHandler query.
+
+    The plans follow the measured statistics: on a database of a few rows the planner
+    scans, so --seed-renters checks them on a generated database of realistic size.
+    """
+    from query_audit import audit_database, format_report
+    if args is not None and args.seed_renters:
+        report = audit_database(renters=args.seed_renters)
+    else:
+        report = audit_database(db.db_name)
+    print(format_report(report, verbose=args is not None and args.verbose))
+    return 1 if any(entry['issues'] for entry in report) else 0
+
+
+def import_file(db: DatabaseHandler, args=None) -> int:
+    """Import products, renters or rentals from --csv, writing rejected rows to an error report"""
+    if args is None or not args.csv:
+        print("✗ import needs --csv FILE")
+        return 1
+    if args.kind not in IMPORT_KINDS:
+        print(f"✗ import --kind must be one of {', '.join(IMPORT_KINDS)}")
+        return 1
+    summary = import_csv(db, args.csv, args.kind, chunk_size=args.chunk_size)
+    print(f"✓ Imported {summary['rows']} {summary['kind']} row(s): {summary['created']} created, "
+          f"{summary['updated']} updated, {summary['unchanged']} unchanged")
+    if summary['errors']:
+        print(f"✗ {summary['errors']} row(s) rejected, see {summary['error_report']}")
+        return 1
+    return 0
+
+
+def export_file(db: DatabaseHandler, args=None) -> int:
+    """Export rentals, tenant totals or payment schedules to --output (.csv or .xlsx)"""
+    if args is None or not args.output:
+        print("✗ export needs --output FILE")
+        return 1
+    if args.kind not in EXPORT_KINDS:
+        print(f"✗ export --kind must be one of {', '.join(EXPORT_KINDS)}")
+        return 1
+    try:
+        summary = export_data(db, args.output, args.kind)
+    except RuntimeError as e:
+        print(f"✗ {e}")
+        return 1
+    print(f"✓ Exported {summary['rows']} {summary['kind']} row(s) to {summary['path']}")
+    return 0
+
+
+COMMANDS = {
+    'verify-stats': verify_stats,
+    'rebuild-stats': rebuild_stats,
+    'rebuild-search': rebuild_search,
+    'analyze': analyze,
+    'archive': archive,
+    'audit-queries': audit_queries,
+    'import': import_file,
+    'export': export_file,
+}
+
+
+def main(argv=None) -> int:
+    """Parse arguments and run the requested command"""
+    parser = argparse.ArgumentParser(description="Rental Management System maintenance tools")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("--db", default="rental_management.db", help="database file")
+    parser.add_argument("--seed-renters", type=int, default=0,
+                        help="audit-queries: audit a generated database of this many renters instead of --db")
+    parser.add_argument("--verbose", action="store_true", help="audit-queries: show every plan")
+    parser.add_argument("--older-than", type=int, default=365,
+                        help="archive: archive rentals returned more than this many days ago")
+    parser.add_argument("--csv", help="import: CSV file to import")
+    parser.add_argument("--output", help="export: file to write, XLSX if it ends in .xlsx, CSV otherwise")
+    parser.add_argument("--kind", choices=sorted(set(IMPORT_KINDS) | set(EXPORT_KINDS)), default="rentals",
+                        help="import/export: what the file holds")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="import: rows written per transaction")
+    args = parser.parse_args(argv)
+
+    db = DatabaseHandler(args.db)
+    try:
+        return COMMANDS[args.command](db, args)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""
+Database Diagnostics Window
+"""
+
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
+                             QMessageBox, QTableWidget, QTableWidgetItem, QFileDialog,
+                             QDoubleSpinBox, QHeaderView)
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QFont
+from instrumentation import DEFAULT_SLOW_QUERY_MS, LATENCY_BUCKETS_MS
+
+
+class DiagnosticsWindow(QDialog):
+    """Per-method call counts, rows and latencies of the database handler"""
+
+    COLUMNS = ["Méthode", "Appels", "Erreurs", "Lignes", "Requêtes", "Lentes",
+               "Total (ms)", "Moyenne (ms)", "p50 (ms)", "p95 (ms)", "Max (ms)"]
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.init_ui()
+        self.refresh()
+
+    def init_ui(self):
+        """Initialize the user interface"""
+        self.setWindowTitle("Diagnostics Base de Données")
+        self.setGeometry(150, 150, 1000, 600)
+
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+
+        title_label = QLabel("Diagnostics Base de Données")
+        title_label.setFont(QFont("Arial", 18, QFont.Bold))
+        title_label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(title_label)
+
+        # Instrumentation switch and slow query threshold
+        settings_layout = QHBoxLayout()
+        settings_layout.addWidget(QLabel("Seuil requêtes lentes:"))
+        self.threshold_input = QDoubleSpinBox()
+        self.threshold_input.setRange(0, 60000)
+        self.threshold_input.setDecimals(0)
+        self.threshold_input.setSuffix(" ms")
+        self.threshold_input.setValue(DEFAULT_SLOW_QUERY_MS)
+        settings_layout.addWidget(self.threshold_input)
+        self.btn_toggle = QPushButton()
+        self.btn_toggle.clicked.connect(self.toggle_instrumentation)
+        settings_layout.addWidget(self.btn_toggle)
+        settings_layout.addStretch()
+        layout.addLayout(settings_layout)
+
+        self.summary_label = QLabel()
+        self.summary_label.setStyleSheet("padding: 10px; background-color: white; border-radius: 5px;")
+        layout.addWidget(self.summary_label)
+
+        self.methods_table = QTableWidget()
+        self.methods_table.setColumnCount(len(self.COLUMNS))
+        self.methods_table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.methods_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.methods_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.methods_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.methods_table.currentCellChanged.connect(self.show_histogram)
+        layout.addWidget(self.methods_table)
+
+        self.histogram_label = QLabel()
+        self.histogram_label.setFont(QFont("Courier New", 10))
+        layout.addWidget(self.histogram_label)
+
+        # Buttons
+        btn_layout = QHBoxLayout()
+
+        btn_refresh = QPushButton("🔄 Actualiser")
+        btn_refresh.clicked.connect(self.refresh)
+
+        self.btn_reset = QPushButton("♻️ Réinitialiser")
+        self.btn_reset.clicked.connect(self.reset_counters)
+
+        self.btn_export = QPushButton("📤 Exporter JSON")
+        self.btn_export.clicked.connect(self.export_json)
+
+        btn_close = QPushButton("❌ Fermer")
+        btn_close.clicked.connect(self.close)
+
+        btn_layout.addWidget(btn_refresh)
+        btn_layout.addWidget(self.btn_reset)
+        btn_layout.addWidget(self.btn_export)
+        btn_layout.addWidget(btn_close)
+        layout.addLayout(btn_layout)
+
+        self.apply_styles()
+
+    def refresh(self):
+        """Reload the counters from the handler"""
+        diagnostics = self.db.get_diagnostics()
+        enabled = diagnostics is not None
+        self.btn_toggle.setText("⏹ Désactiver" if enabled else "▶ Activer")
+        self.threshold_input.setEnabled(not enabled)
+        self.btn_reset.setEnabled(enabled)
+        self.btn_export.setEnabled(enabled)
+        self.methods = []
+        if not enabled:
+            self.summary_label.setText("Instrumentation désactivée: activez-la pour mesurer les appels.")
+            self.methods_table.setRowCount(0)
+            self.histogram_label.clear()
+            return
+
+        self.threshold_input.setValue(diagnostics['slow_query_ms'])
+        log_path = diagnostics['slow_log_path'] or "aucun"
+        self.summary_label.setText(
+            f"Depuis {diagnostics['started_at'].replace('T', ' ')} — "
+            f"{diagnostics['statements']} requêtes, {diagnostics['slow_statements']} lentes "
+            f"(≥ {diagnostics['slow_query_ms']:g} ms)\nJournal des requêtes lentes: {log_path}"
+        )
+        self.methods = list(diagnostics['methods'].items())
+        self.methods_table.setRowCount(len(self.methods))
+        for row, (name, stats) in enumerate(self.methods):
+            values = [name, stats['calls'], stats['errors'], stats['rows'], stats['statements'],
+                      stats['slow_statements'], f"{stats['total_ms']:.1f}", f"{stats['mean_ms']:.2f}",
+                      f"{stats['p50_ms']:.2f}", f"{stats['p95_ms']:.2f}", f"{stats['max_ms']:.2f}"]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(str(value))
+                if column:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.methods_table.setItem(row, column, item)
+        self.histogram_label.clear()
+
+    def show_histogram(self, row, column=0, previous_row=-1, previous_column=-1):
+        """Latency histogram of the selected method, one text bar per bucket"""
+        if not 0 <= row < len(self.methods):
+            self.histogram_label.clear()
+            return
+        name, stats = self.methods[row]
+        largest = max(count for _, count in stats['buckets']) or 1
+        lines = [name]
+        for bound, count in stats['buckets']:
+            label = f"≤ {bound} ms" if bound is not None else f"> {LATENCY_BUCKETS_MS[-1]} ms"
+            lines.append(f"{label:>11} {'█' * round(count * 40 / largest):<40} {count}")
+        self.histogram_label.setText("\n".join(lines))
+
+    def toggle_instrumentation(self):
+        """Turn instrumentation on with the chosen threshold, or off"""
+        try:
+            if self.db.get_diagnostics() is None:
+                self.db.enable_instrumentation(self.threshold_input.value())
+            else:
+                self.db.disable_instrumentation()
+        except Exception as e:
+            QMessageBox.critical(self, "Erreur", f"Échec de l'instrumentation: {str(e)}")
+        self.refresh()
+
+    def reset_counters(self):
+        """Zero the counters"""
+        if self.db.instrumentation:
+            self.db.instrumentation.reset()
+        self.refresh()
+
+    def export_json(self):
+        """Save the counters to a JSON file"""
+        path, _ = QFileDialog.getSaveFileName(self, "Exporter les diagnostics",
+                                              "diagnostics.json", "JSON (*.json)")
+        if not path:
+            return
+        try:
+            self.db.dump_diagnostics(path)
+            QMessageBox.information(self, "Succès", f"Diagnostics exportés:\n{path}")
+        except Exception as e:
+            QMessageBox.critical(self, "Erreur", f"Échec de l'export: {str(e)}")
+
+    def apply_styles(self):
+        """Apply custom styles"""
+        self.setStyleSheet("""
+            QDialog {
+                background-color: #ecf0f1;
+            }
+            QLabel {
+                font-size: 14px;
+            }
+            QDoubleSpinBox {
+                padding: 6px;
+                border: 2px solid #bdc3c7;
+                border-radius: 5px;
+                background-color: white;
+            }
+            QTableWidget {
+                background-color: white;
+                border: 1px solid #bdc3c7;
+                border-radius: 5px;
+            }
+            QHeaderView::section {
+                background-color: #34495e;
+                color: white;
+                padding: 8px;
+                font-weight: bold;
+                border: none;
+            }
+            QPushButton {
+                background-color: #3498db;
+                color: white;
+                border: none;
+                padding: 10px 20px;
+                border-radius: 5px;
+                font-size: 14px;
+                font-weight: bold;
+            }
+            QPushButton:hover {
+                background-color: #2980b9;
+            }
+            QPushButton:disabled {
+                background-color: #95a5a6;
+            }
+        """)
@@ -0,0 +1,129 @@
+"""
+Columnar Financial Engine for Rental Management System
+Computes rental amounts for many rentals at once with NumPy, in integer millimes
+"""
+
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:  # NumPy is optional, DatabaseHandler falls back to the scalar path
+    np = None
+    HAS_NUMPY = False
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def _to_ordinals(values: Sequence, invalid: Optional[str] = None) -> "np.ndarray":
+    """Convert date strings from the DB into day ordinals (0 when missing).
+
+    An invalid date is 0 as well, unless invalid is given: then it raises
+    ValueError(f"{invalid}: {value}") like the scalar path does for end dates.
+    """
+    try:
+        parsed = np.array([value if value else 'NaT' for value in values], dtype='datetime64[D]')
+        ordinals = parsed.astype('int64') + EPOCH_ORDINAL
+        return np.where(np.isnat(parsed), 0, ordinals)
+    except ValueError:
+        # Mixed, French formatted or invalid dates: parse row by row
+        from database import parse_date
+        ordinals = []
+        for value in values:
+            parsed = parse_date(value)
+            if parsed is None and value and invalid:
+                raise ValueError(f"{invalid}: {value}")
+            ordinals.append(parsed.toordinal() if parsed else 0)
+        return np.array(ordinals, dtype='int64')
+
+
+def _split_ordinals(ordinals: "np.ndarray"):
+    """Split day ordinals into year, month and day arrays."""
+    days = (ordinals - EPOCH_ORDINAL).astype('datetime64[D]')
+    years = days.astype('datetime64[Y]')
+    months = days.astype('datetime64[M]')
+    year = years.astype('int64') + 1970
+    month = (months - years.astype('datetime64[M]')).astype('int64') + 1
+    day = (days - months.astype('datetime64[D]')).astype('int64') + 1
+    return year, month, day
+
+
+def count_billing_periods_array(start_ordinals, end_ordinals, is_monthly) -> "np.ndarray":
+    """Vectorised count_billing_periods over arrays of day ordinals."""
+    start_ordinals = np.asarray(start_ordinals, dtype='int64')
+    end_ordinals = np.asarray(end_ordinals, dtype='int64')
+    is_monthly = np.asarray(is_monthly, dtype=bool)
+    sy, sm, sd = _split_ordinals(start_ordinals)
+    ey, em, ed = _split_ordinals(end_ordinals)
+
+    months = (ey - sy) * 12 + (em - sm) + (ed >= sd)
+    years = (ey - sy) + ((em > sm) | ((em == sm) & (ed >= sd)))
+    periods = np.maximum(1, np.where(is_monthly, months, years))
+    return np.where(end_ordinals < start_ordinals, 0, periods)
+
+
+def compute_rental_amounts(start_ordinals, end_ordinals, billing_types, prices,
+                           acomptes, escomptes, payment_statuses,
+                           today: Optional[int] = None) -> Dict[str, "np.ndarray"]:
+    """Calculate brut, net, reste, received and owed for arrays of rentals.
+
+    Dates are day ordinals; 0 marks a missing date. A missing end date means
+    the rental is still running and is billed up to today, like the scalar path.
+    Amounts are integer millimes (int64), so the results are exact.
+    """
+    if today is None:
+        today = datetime.now().toordinal()
+    start_ordinals = np.asarray(start_ordinals, dtype='int64')
+    end_ordinals = np.asarray(end_ordinals, dtype='int64')
+    end_ordinals = np.where(end_ordinals > 0, end_ordinals, today)
+    valid = start_ordinals > 0
+    safe_start = np.where(valid, start_ordinals, end_ordinals)
+
+    is_monthly = np.asarray(billing_types) == 'monthly'
+    is_paid = np.asarray(payment_statuses) == 'paid'
+    prices = np.asarray(prices, dtype='int64')
+    acomptes = np.asarray(acomptes, dtype='int64')
+    escomptes = np.asarray(escomptes, dtype='int64')
+
+    periods = np.where(valid, count_billing_periods_array(safe_start, end_ordinals, is_monthly), 0)
+    total_brut = np.where(valid, prices * periods, 0)
+    acomptes = np.where(valid, acomptes, 0)
+    escomptes = np.where(valid, escomptes, 0)
+    total_net = np.maximum(0, total_brut - escomptes)
+    reste = np.maximum(0, total_net - acomptes)
+    total_received = np.where(is_paid & valid, total_net, acomptes)
+    still_owed = np.where(is_paid, 0, reste)
+
+    return {
+        'total_brut': total_brut,
+        'total_net': total_net,
+        'acompte': acomptes,
+        'escompte': escomptes,
+        'reste': reste,
+        'total_to_pay': total_net,
+        'total_received': total_received,
+        'still_owed': still_owed,
+        'periods': periods
+    }
+
+
+def _to_millimes(values: Sequence) -> List[int]:
+    """Millimes of amounts given as Money or as numbers of TND (0 when missing)."""
+    from database import Money
+    return [value.millimes if type(value) is Money else Money.from_tnd(value or 0).millimes
+            for value in values]
+
+
+def compute_rental_amounts_from_rows(rentals: List[Dict], today: Optional[int] = None) -> Dict[str, "np.ndarray"]:
+    """Build the input columns from rental rows and run compute_rental_amounts."""
+    return compute_rental_amounts(
+        _to_ordinals([rental['start_date'] for rental in rentals]),
+        _to_ordinals([rental.get('end_date') for rental in rentals], invalid="Date de fin invalide"),
+        [rental['billing_type'] for rental in rentals],
+        _to_millimes([rental['rental_price'] for rental in rentals]),
+        _to_millimes([rental.get('acompte') for rental in rentals]),
+        _to_millimes([rental.get('escompte') for rental in rentals]),
+        [rental.get('payment_status') for rental in rentals],
+        today=today
+    )
@@ -0,0 +1,256 @@
+"""
+Query Instrumentation for Rental Management System
+Per-method call counts, rows and latency histograms, SQL tracing and a rotating slow-query log
+"""
+
+import functools
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from typing import Callable, Dict, Iterable, List, Optional
+
+# Upper bounds (milliseconds) of the latency histogram buckets; the last bucket is open
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+DEFAULT_SLOW_QUERY_MS = 100.0
+SLOW_QUERY_LOG_NAME = "slow_queries.log"
+SLOW_QUERY_LOG_MAX_BYTES = 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 3
+
+# Public methods that are not timed: connection lifecycle, context managers, lazy
+# iterators (their work happens after they return) and the instrumentation itself
+SKIPPED_METHODS = frozenset({
+    'connect', 'close', 'create_tables', 'transaction', 'set_trace_callback',
+    'enable_instrumentation', 'disable_instrumentation', 'get_diagnostics', 'dump_diagnostics',
+})
+
+
+def instrumented_methods(cls: type) -> List[str]:
+    """Names of the public methods of cls that are wrapped when instrumentation is on"""
+    return sorted(name for name, member in vars(cls).items()
+                  if callable(member) and not name.startswith('_')
+                  and not name.startswith('iter_') and name not in SKIPPED_METHODS)
+
+
+def count_rows(result) -> int:
+    """Rows returned by a handler method: list length, first item of a page, 1 for a record"""
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        result = result[0]
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict):
+        return 1
+    return 0
+
+
+def _is_nested(statement: str) -> bool:
+    """Statements SQLite runs on behalf of another one: trigger bodies, FTS5 shadow tables, pragmas"""
+    return statement.startswith("--") or "'main'." in statement
+
+
+class LatencyHistogram:
+    """Latency distribution in fixed millisecond buckets (LATENCY_BUCKETS_MS)"""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, elapsed_ms: float):
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given fraction of the calls (max for the last)"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= rank:
+                return round(min(bound, self.max_ms), 3)
+        return round(self.max_ms, 3)
+
+    def to_dict(self) -> Dict:
+        """Summary and buckets as [upper bound in ms (None for the last), count]"""
+        return {
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': self.percentile(0.50),
+            'p95_ms': self.percentile(0.95),
+            'buckets': [[bound, count] for bound, count
+                        in zip(list(LATENCY_BUCKETS_MS) + [None], self.counts)],
+        }
+
+
+class MethodStats:
+    """Counters of one handler method"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.statements = 0
+        self.slow_statements = 0
+        self.latency = LatencyHistogram()
+
+    def to_dict(self) -> Dict:
+        return {'calls': self.calls, 'errors': self.errors, 'rows': self.rows,
+                'statements': self.statements, 'slow_statements': self.slow_statements,
+                **self.latency.to_dict()}
+
+
+class Instrumentation:
+    """Opt-in timing of a DatabaseHandler.
+
+    install() replaces the public methods of the handler instance by wrappers counting
+    calls, errors, rows returned and latency, and trace() (the SQLite trace callback)
+    attributes every statement to the method running it on the same thread. A
+    statement lasts until the next statement of that thread or the end of the method,
+    so its time includes fetching its rows; statements taking at least slow_query_ms
+    are written to a rotating log. Statements run outside a timed method are counted
+    but not timed, and trigger statements are not counted separately.
+    """
+
+    def __init__(self, slow_query_ms: float = DEFAULT_SLOW_QUERY_MS, slow_log_path: Optional[str] = None,
+                 max_bytes: int = SLOW_QUERY_LOG_MAX_BYTES, backup_count: int = SLOW_QUERY_LOG_BACKUPS):
+        """slow_log_path None keeps slow statements in the counters only"""
+        if slow_query_ms < 0:
+            raise ValueError("Le seuil des requêtes lentes doit être positif")
+        self.slow_query_ms = slow_query_ms
+        self.slow_log_path = slow_log_path
+        self.started_at = datetime.now()
+        self.methods: Dict[str, MethodStats] = {}
+        self.statements = 0
+        self.untimed_statements = 0
+        self.slow_statements = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._target = None
+        self._wrapped: List[str] = []
+        self.slow_log = None
+        if slow_log_path:
+            self.slow_log = logging.Logger("rental_db.slow_queries")
+            handler = RotatingFileHandler(slow_log_path, maxBytes=max_bytes,
+                                          backupCount=backup_count, encoding="utf-8", delay=True)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.slow_log.addHandler(handler)
+
+    def install(self, target, methods: Iterable[str]):
+        """Wrap the given methods of the target instance"""
+        self._target = target
+        for name in methods:
+            setattr(target, name, self._wrap(name, getattr(target, name)))
+            self._wrapped.append(name)
+
+    def uninstall(self):
+        """Restore the original methods and close the slow-query log"""
+        for name in self._wrapped:
+            self._target.__dict__.pop(name, None)
+        self._wrapped = []
+        if self.slow_log:
+            for handler in list(self.slow_log.handlers):
+                self.slow_log.removeHandler(handler)
+                handler.close()
+
+    def _wrap(self, name: str, method: Callable) -> Callable:
+        self.methods.setdefault(name, MethodStats())
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            local = self._local
+            stack = getattr(local, 'stack', None)
+            if stack is None:
+                stack = local.stack = []
+                local.statement = None
+            self._end_statement()
+            stack.append(name)
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = method(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                self._end_statement()
+                stack.pop()
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                with self._lock:
+                    stats = self.methods[name]
+                    stats.calls += 1
+                    stats.latency.add(elapsed_ms)
+                    if failed:
+                        stats.errors += 1
+                    else:
+                        stats.rows += count_rows(result)
+        return timed
+
+    def trace(self, statement: str):
+        """SQLite trace callback: close the previous statement of this thread, start this one"""
+        if _is_nested(statement):
+            return
+        current = getattr(self._local, 'statement', None)
+        if current is not None and current[1] == statement:
+            # Each trigger program of a statement reports the statement again
+            return
+        self._end_statement()
+        stack = getattr(self._local, 'stack', None)
+        with self._lock:
+            self.statements += 1
+            if not stack:
+                self.untimed_statements += 1
+                return
+            self.methods[stack[-1]].statements += 1
+        self._local.statement = (stack[-1], statement, time.perf_counter())
+
+    def _end_statement(self):
+        """Time the running statement of this thread and log it if it was slow"""
+        current = getattr(self._local, 'statement', None)
+        if current is None:
+            return
+        self._local.statement = None
+        method, statement, start = current
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms < self.slow_query_ms:
+            return
+        with self._lock:
+            self.slow_statements += 1
+            self.methods[method].slow_statements += 1
+        if self.slow_log:
+            self.slow_log.warning("%.1f ms %s: %s", elapsed_ms, method, " ".join(statement.split()))
+
+    def reset(self):
+        """Zero every counter"""
+        with self._lock:
+            for name in self.methods:
+                self.methods[name] = MethodStats()
+            self.statements = self.untimed_statements = self.slow_statements = 0
+            self.started_at = datetime.now()
+
+    def snapshot(self) -> Dict:
+        """Every counter as JSON-serialisable data, methods by total time"""
+        with self._lock:
+            methods = {name: stats.to_dict() for name, stats in self.methods.items() if stats.calls}
+            return {
+                'started_at': self.started_at.isoformat(timespec='seconds'),
+                'slow_query_ms': self.slow_query_ms,
+                'slow_log_path': self.slow_log_path,
+                'statements': self.statements,
+                'untimed_statements': self.untimed_statements,
+                'slow_statements': self.slow_statements,
+                'methods': dict(sorted(methods.items(), key=lambda item: -item[1]['total_ms'])),
+            }
+
+    def dump_json(self, path: str):
+        """Write snapshot() to a JSON file"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2, ensure_ascii=False)
@@ -6,13 +6,38 @@ import sys
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QPushButton, QLabel, QTableWidget, 
                              QTableWidgetItem, QMessageBox, QTabWidget, QFrame,
-                             QHeaderView, QGroupBox, QGridLayout, QLineEdit)
-from PyQt5.QtCore import Qt, QTimer
+                             QHeaderView, QGroupBox, QGridLayout, QLineEdit,
+                             QProgressDialog, QFileDialog, QInputDialog)
+from PyQt5.QtCore import Qt, QTimer, QThread, pyqtSignal
 from PyQt5.QtGui import QFont, QIcon, QColor
-from database import DatabaseHandler, format_date_display, format_datetime_display
+from database import DatabaseHandler, Money, format_date_display, format_datetime_display
 from product_window import ProductWindow
 from rental_window import RentalWindow
 from login_window import LoginWindow
+from diagnostics_window import DiagnosticsWindow
+from csv_import import import_csv
+from data_export import HAS_OPENPYXL, export_data
+
+
+class BackupWorker(QThread):
+    """Runs DatabaseHandler.save_all away from the GUI thread and reports through signals"""
+    
+    progress = pyqtSignal(int, int)
+    succeeded = pyqtSignal(str)
+    failed = pyqtSignal(str)
+    
+    def __init__(self, db: DatabaseHandler, parent=None):
+        super().__init__(parent)
+        self.db = db
+    
+    def run(self):
+        try:
+            # The copy reads through this thread's own pooled connection
+            backup_path = self.db.save_all(progress=self.progress.emit, incremental=True)
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.succeeded.emit(backup_path)
 
 
 class MainWindow(QMainWindow):
@@ -21,6 +46,7 @@ class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.db = DatabaseHandler()
+        self.backup_worker = None
         self.init_ui()
         self.load_dashboard_data()
         
@@ -87,6 +113,7 @@ class MainWindow(QMainWindow):
         self.create_products_tab()
         self.create_rentals_tab()
         self.create_tenants_tab()
+        self.create_search_tab()
         
         # Style
         self.apply_styles()
@@ -144,9 +171,24 @@ class MainWindow(QMainWindow):
             }
         """)
         
+        btn_import = QPushButton("📥 Importer CSV")
+        btn_import.clicked.connect(self.import_csv_file)
+        btn_import.setMinimumHeight(50)
+        
+        btn_export = QPushButton("📤 Exporter")
+        btn_export.clicked.connect(self.export_data_file)
+        btn_export.setMinimumHeight(50)
+        
+        btn_diagnostics = QPushButton("🩺 Diagnostics")
+        btn_diagnostics.clicked.connect(self.open_diagnostics_window)
+        btn_diagnostics.setMinimumHeight(50)
+        
         quick_layout.addWidget(btn_new_product)
         quick_layout.addWidget(btn_new_rental)
         quick_layout.addWidget(btn_save_all)
+        quick_layout.addWidget(btn_import)
+        quick_layout.addWidget(btn_export)
+        quick_layout.addWidget(btn_diagnostics)
         
         quick_actions.setLayout(quick_layout)
         layout.addWidget(quick_actions)
@@ -423,6 +465,54 @@ class MainWindow(QMainWindow):
         
         self.tabs.addTab(tenants_widget, "👥 Locataires")
     
+    def create_search_tab(self):
+        """Create global search tab (renters, products, rentals, payment notes)"""
+        search_widget = QWidget()
+        layout = QVBoxLayout()
+        search_widget.setLayout(layout)
+        
+        self.global_search = QLineEdit()
+        self.global_search.setPlaceholderText("🔍 Rechercher nom, téléphone, CIN, email, produit, notes...")
+        layout.addWidget(self.global_search)
+        
+        # Run the search once typing pauses
+        self.search_timer = QTimer()
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(200)
+        self.search_timer.timeout.connect(self.run_global_search)
+        self.global_search.textChanged.connect(self.search_timer.start)
+        
+        self.search_table = QTableWidget()
+        self.search_table.setColumnCount(3)
+        self.search_table.setHorizontalHeaderLabels(["Type", "Nom", "Détails"])
+        self.search_table.horizontalHeader().setStretchLastSection(True)
+        self.search_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.search_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.search_table.cellDoubleClicked.connect(self.open_search_result)
+        layout.addWidget(self.search_table)
+        
+        self.tabs.addTab(search_widget, "🔍 Recherche")
+    
+    def run_global_search(self):
+        """Show ranked search hits for the search box text"""
+        hits = self.db.search(self.global_search.text(), limit=100)
+        type_labels = {'renter': 'Locataire', 'product': 'Produit',
+                       'rental': 'Location', 'payment': 'Paiement'}
+        self.search_table.setRowCount(len(hits))
+        for row, hit in enumerate(hits):
+            type_item = QTableWidgetItem(type_labels.get(hit['entity_type'], hit['entity_type']))
+            type_item.setData(Qt.UserRole, hit['entity_type'])
+            self.search_table.setItem(row, 0, type_item)
+            self.search_table.setItem(row, 1, QTableWidgetItem(hit['title']))
+            self.search_table.setItem(row, 2, QTableWidgetItem(hit['body']))
+    
+    def open_search_result(self, row, column):
+        """Switch to the tab listing the selected search hit"""
+        entity_type = self.search_table.item(row, 0).data(Qt.UserRole)
+        tab_index = {'product': 1, 'rental': 2, 'payment': 2, 'renter': 3}.get(entity_type)
+        if tab_index is not None:
+            self.tabs.setCurrentIndex(tab_index)
+    
     def load_dashboard_data(self):
         """Load dashboard statistics and tables"""
         stats = self.db.get_dashboard_stats()
@@ -466,8 +556,7 @@ class MainWindow(QMainWindow):
         unpaid_rentals = self.db.get_unpaid_rentals_with_totals()
         self.reminders_table.setRowCount(len(unpaid_rentals))
         
-        total_monthly = 0.0
-        total_all_periods = 0.0
+        total_monthly = Money()
         
         for row, rental in enumerate(unpaid_rentals):
             self.reminders_table.setItem(row, 0, QTableWidgetItem(rental['renter_name']))
@@ -492,7 +581,8 @@ class MainWindow(QMainWindow):
     
     def load_rentals(self):
         """Load rentals into table"""
-        rentals = self.db.get_all_rentals()
+        rentals = self.db.get_rentals_with_financials()
+        self.rentals_table.setUpdatesEnabled(False)
         self.rentals_table.setRowCount(len(rentals))
         
         for row, rental in enumerate(rentals):
@@ -516,12 +606,12 @@ class MainWindow(QMainWindow):
                 paid_item.setForeground(QColor('#e74c3c'))
             self.rentals_table.setItem(row, 9, paid_item)
             
-            financial = self.db.get_rental_financial_summary(rental['id'])
-            self.rentals_table.setItem(row, 10, QTableWidgetItem(f"{financial['acompte']:.3f} TND"))
-            self.rentals_table.setItem(row, 11, QTableWidgetItem(f"{financial['escompte']:.3f} TND"))
-            self.rentals_table.setItem(row, 12, QTableWidgetItem(f"{financial['reste']:.3f} TND"))
-            self.rentals_table.setItem(row, 13, QTableWidgetItem(f"{financial['total_to_pay']:.3f} TND"))
-            self.rentals_table.setItem(row, 14, QTableWidgetItem(f"{financial['total_received']:.3f} TND"))
+            self.rentals_table.setItem(row, 10, QTableWidgetItem(f"{rental['acompte']:.3f} TND"))
+            self.rentals_table.setItem(row, 11, QTableWidgetItem(f"{rental['escompte']:.3f} TND"))
+            self.rentals_table.setItem(row, 12, QTableWidgetItem(f"{rental['reste']:.3f} TND"))
+            self.rentals_table.setItem(row, 13, QTableWidgetItem(f"{rental['total_to_pay']:.3f} TND"))
+            self.rentals_table.setItem(row, 14, QTableWidgetItem(f"{rental['total_received']:.3f} TND"))
+        self.rentals_table.setUpdatesEnabled(True)
     
     def load_tenants_totals(self):
         """Load tenant totals into table"""
@@ -533,8 +623,8 @@ class MainWindow(QMainWindow):
         
         self.tenants_table.setRowCount(len(tenants))
         
-        total_received = 0.0
-        total_owed = 0.0
+        total_received = Money()
+        total_owed = Money()
         
         for row, tenant in enumerate(tenants):
             self.tenants_table.setItem(row, 0, QTableWidgetItem(tenant['renter_name']))
@@ -604,10 +694,106 @@ class MainWindow(QMainWindow):
         self.rental_window = RentalWindow(self.db, self)
         self.rental_window.show()
     
-    def save_all_data(self):
-        """Save all data: commit database and create backup copy."""
+    def open_diagnostics_window(self):
+        """Open the database diagnostics window"""
+        self.diagnostics_window = DiagnosticsWindow(self.db, self)
+        self.diagnostics_window.show()
+    
+    def import_csv_file(self):
+        """Import products, renters or rentals from a CSV file"""
+        path, _ = QFileDialog.getOpenFileName(self, "Importer un fichier CSV", "", "CSV (*.csv)")
+        if not path:
+            return
+        kinds = {"Locations": 'rentals', "Locataires": 'renters', "Produits": 'products'}
+        label, ok = QInputDialog.getItem(self, "Importer CSV", "Contenu du fichier:", list(kinds), 0, False)
+        if not ok:
+            return
+        
+        progress_dialog = QProgressDialog("Import en cours...", "Annuler", 0, 100, self)
+        progress_dialog.setWindowTitle("Import CSV")
+        progress_dialog.setWindowModality(Qt.WindowModal)
+        progress_dialog.setMinimumDuration(300)
+        
+        def update_progress(done, total):
+            progress_dialog.setValue(int(done * 100 / total) if total else 100)
+            QApplication.processEvents()
+            return not progress_dialog.wasCanceled()
+        
+        try:
+            summary = import_csv(self.db, path, kinds[label], progress=update_progress)
+            progress_dialog.setValue(100)
+        except Exception as e:
+            progress_dialog.cancel()
+            QMessageBox.critical(self, "Erreur", f"Échec de l'import: {str(e)}")
+            return
+        self.load_dashboard_data()
+        self.load_products()
+        self.load_rentals()
+        self.load_tenants_totals()
+        message = (f"{summary['rows']} lignes lues: {summary['created']} ajoutées, "
+                   f"{summary['updated']} mises à jour, {summary['unchanged']} inchangées.")
+        if summary['cancelled']:
+            message += "\n\nImport annulé: les lignes déjà importées sont conservées."
+        if summary['errors']:
+            message += (f"\n\n{summary['errors']} lignes rejetées, voir le rapport:\n"
+                        f"{summary['error_report']}")
+            QMessageBox.warning(self, "Import terminé avec erreurs", message)
+        else:
+            QMessageBox.information(self, "Import terminé", message)
+    
+    def export_data_file(self):
+        """Export rentals, tenant totals or payment schedules to a CSV or Excel file"""
+        kinds = {"Locations": 'rentals', "Locataires": 'tenants', "Échéancier des paiements": 'payments'}
+        label, ok = QInputDialog.getItem(self, "Exporter", "Données à exporter:", list(kinds), 0, False)
+        if not ok:
+            return
+        filters = "CSV (*.csv);;Excel (*.xlsx)" if HAS_OPENPYXL else "CSV (*.csv)"
+        path, selected = QFileDialog.getSaveFileName(self, "Exporter vers un fichier", f"{label}.csv", filters)
+        if not path:
+            return
+        if selected.startswith("Excel") and not path.lower().endswith(".xlsx"):
+            path += ".xlsx"
+        
+        progress_dialog = QProgressDialog("Export en cours...", "Annuler", 0, 100, self)
+        progress_dialog.setWindowTitle("Exporter")
+        progress_dialog.setWindowModality(Qt.WindowModal)
+        progress_dialog.setMinimumDuration(300)
+        
+        def update_progress(done, total):
+            progress_dialog.setValue(int(done * 100 / total) if total else 100)
+            QApplication.processEvents()
+            return not progress_dialog.wasCanceled()
+        
         try:
-            backup_path = self.db.save_all()
+            summary = export_data(self.db, path, kinds[label], progress=update_progress)
+            progress_dialog.setValue(100)
+        except Exception as e:
+            progress_dialog.cancel()
+            QMessageBox.critical(self, "Erreur", f"Échec de l'export: {str(e)}")
+            return
+        if summary['cancelled']:
+            QMessageBox.information(self, "Export annulé", "Export annulé: aucun fichier n'a été écrit.")
+        else:
+            QMessageBox.information(self, "Export terminé",
+                                    f"{summary['rows']} lignes exportées vers:\n{summary['path']}")
+    
+    def save_all_data(self):
+        """Save all data: commit database and create an incremental backup snapshot.
+        
+        The backup runs in a BackupWorker thread, so the window stays responsive.
+        """
+        if self.backup_worker is not None and self.backup_worker.isRunning():
+            return
+        progress_dialog = QProgressDialog("Sauvegarde en cours...", None, 0, 100, self)
+        progress_dialog.setWindowTitle("Sauvegarde")
+        progress_dialog.setWindowModality(Qt.WindowModal)
+        progress_dialog.setMinimumDuration(300)
+        
+        def update_progress(copied, total):
+            progress_dialog.setValue(int(copied * 100 / total) if total else 100)
+        
+        def backup_succeeded(backup_path):
+            progress_dialog.setValue(100)
             self.load_dashboard_data()
             self.load_products()
             self.load_rentals()
@@ -617,8 +803,16 @@ class MainWindow(QMainWindow):
                 f"Toutes les données ont été sauvegardées.\n\n"
                 f"Copie de sécurité:\n{backup_path}"
             )
-        except Exception as e:
-            QMessageBox.critical(self, "Erreur", f"Échec de la sauvegarde: {str(e)}")
+        
+        def backup_failed(error):
+            progress_dialog.cancel()
+            QMessageBox.critical(self, "Erreur", f"Échec de la sauvegarde: {error}")
+        
+        self.backup_worker = BackupWorker(self.db, self)
+        self.backup_worker.progress.connect(update_progress)
+        self.backup_worker.succeeded.connect(backup_succeeded)
+        self.backup_worker.failed.connect(backup_failed)
+        self.backup_worker.start()
     
     def mark_rental_returned(self):
         """Mark selected rental as returned"""
@@ -834,6 +1028,9 @@ class MainWindow(QMainWindow):
     
     def closeEvent(self, event):
         """Handle window close event"""
+        if self.backup_worker is not None:
+            # Let a running backup finish before the connections close
+            self.backup_worker.wait()
         self.db.close()
         event.accept()
 
@@ -0,0 +1,128 @@
+"""
+Picker Index for Rental Management System
+In-memory, accent and case insensitive word-prefix index behind the renter and product pickers
+"""
+
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Sequence
+
+
+def normalize_text(text) -> str:
+    """Lower-case text and strip accents ("Élodie" -> "elodie")"""
+    text = str(text or "")
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize('NFKD', text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def _tokens(text: str) -> List[str]:
+    """Split normalized text into words"""
+    return re.findall(r"\w+", normalize_text(text))
+
+
+class PickerIndex:
+    """Sorted word list mapping every word prefix to the rows containing it.
+
+    Each row is indexed by the words of name_field and of the search_fields; phone-like
+    fields are also indexed digits-only and by their last 8 digits, so "98123456"
+    finds "+216 98 123 456". Rows are kept in display order (normalized name, id).
+    """
+
+    def __init__(self, name_field: str, search_fields: Sequence[str] = (),
+                 phone_fields: Sequence[str] = ()):
+        self.name_field = name_field
+        self.search_fields = tuple(search_fields)
+        self.phone_fields = tuple(phone_fields)
+        self.rows: Dict[int, Dict] = {}
+        self._words = []       # sorted (word, id) pairs
+        self._order = []       # sorted (sort key, id) pairs
+        self._row_words: Dict[int, List[str]] = {}
+        self._sort_keys: Dict[int, tuple] = {}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def build(self, rows: Iterable[Dict]):
+        """Index every row at once (sorting once is much faster than inserting one by one)"""
+        self.rows.clear()
+        self._row_words.clear()
+        self._sort_keys.clear()
+        words, order = [], []
+        for row in rows:
+            entity_id = row['id']
+            self.rows[entity_id] = row
+            row_words = self._row_words[entity_id] = self._words_of(row)
+            words.extend((word, entity_id) for word in row_words)
+            sort_key = self._sort_keys[entity_id] = (normalize_text(row[self.name_field]), entity_id)
+            order.append(sort_key)
+        words.sort()
+        order.sort()
+        self._words = words
+        self._order = order
+
+    def _words_of(self, row: Dict) -> List[str]:
+        """Distinct indexed words of a row"""
+        words = set(_tokens(row.get(self.name_field)))
+        for field in self.search_fields:
+            words.update(_tokens(row.get(field)))
+        for field in self.phone_fields:
+            words.update(_tokens(row.get(field)))
+            digits = re.sub(r"\D", "", str(row.get(field) or ""))
+            if digits:
+                words.update((digits, digits[-8:]))
+        return sorted(words)
+
+    def upsert(self, row: Dict):
+        """Add a new row or re-index a changed one"""
+        entity_id = row['id']
+        self.remove(entity_id)
+        self.rows[entity_id] = row
+        row_words = self._row_words[entity_id] = self._words_of(row)
+        for word in row_words:
+            insort(self._words, (word, entity_id))
+        sort_key = self._sort_keys[entity_id] = (normalize_text(row[self.name_field]), entity_id)
+        insort(self._order, sort_key)
+
+    def remove(self, entity_id: int):
+        """Drop a row from the index (no-op when it is not indexed)"""
+        if entity_id not in self.rows:
+            return
+        del self.rows[entity_id]
+        for word in self._row_words.pop(entity_id):
+            self._delete(self._words, (word, entity_id))
+        self._delete(self._order, self._sort_keys.pop(entity_id))
+
+    @staticmethod
+    def _delete(items: list, item):
+        """Remove item from a sorted list"""
+        position = bisect_left(items, item)
+        if position < len(items) and items[position] == item:
+            del items[position]
+
+    def _prefix_ids(self, prefix: str) -> set:
+        """Ids of the rows having a word starting with prefix"""
+        start = bisect_left(self._words, (prefix,))
+        end = bisect_left(self._words, (prefix + "\U0010ffff",))
+        return {entity_id for _, entity_id in self._words[start:end]}
+
+    def search(self, text: str, limit: Optional[int] = None) -> List[int]:
+        """Ids of the rows matching every word of text as a prefix, in display order.
+
+        Empty text returns every row.
+        """
+        prefixes = _tokens(text)
+        if not prefixes:
+            ids = [entity_id for _, entity_id in self._order]
+            return ids[:limit] if limit is not None else ids
+
+        matches = None
+        for prefix in sorted(set(prefixes), key=len, reverse=True):
+            found = self._prefix_ids(prefix)
+            matches = found if matches is None else matches & found
+            if not matches:
+                return []
+        ids = sorted(matches, key=self._sort_keys.__getitem__)
+        return ids[:limit] if limit is not None else ids
@@ -7,6 +7,7 @@ from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel,
                              QFormLayout, QDoubleSpinBox)
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QFont
+from database import Money
 
 
 class ProductWindow(QDialog):
@@ -84,7 +85,7 @@ class ProductWindow(QDialog):
         # Convert English type to French
         type_fr = 'lit' if self.product['type'] == 'bed' else 'équipement'
         self.type_combo.setCurrentText(type_fr)
-        self.price_input.setValue(self.product['rental_price'])
+        self.price_input.setValue(float(self.product['rental_price']))
     
     def save_product(self):
         """Save product to database"""
@@ -92,7 +93,7 @@ class ProductWindow(QDialog):
         product_type_fr = self.type_combo.currentText()
         # Convert French type to English for database
         product_type = 'bed' if product_type_fr == 'lit' else 'equipment'
-        price = self.price_input.value()
+        price = Money.from_tnd(self.price_input.value())
         
         # Validation
         if not name:
@@ -0,0 +1,208 @@
+"""
+Query Plan Audit for Rental Management System
+Runs every DatabaseHandler operation on a throwaway database, records the SQL it issues
+and flags statements whose EXPLAIN QUERY PLAN contains full scans or temporary B-trees
+"""
+
+import os
+import re
+import sqlite3
+import tempfile
+from typing import Callable, Dict, List, Optional
+
+from database import DatabaseHandler
+
+# Plan details worth a look: reading a whole table or sorting into a temporary B-tree
+FULL_SCAN = re.compile(r"^SCAN (\S+)$")
+TEMP_BTREE = re.compile(r"USE TEMP B-TREE")
+
+# Full scans that are the point of the statement (whole-table maintenance, checks and
+# schema catalog lookups)
+EXPECTED_SCANS = (
+    re.compile(r"^SELECT 1 FROM sqlite_master\b"),
+    re.compile(r"^DELETE FROM search_index$"),
+    re.compile(r"^INSERT INTO search_index", re.S),
+)
+
+# Sorting full-text matches is bounded by the number of matches, not by the table size
+EXPECTED_SORTS = (
+    re.compile(r"search_index MATCH"),
+    # While few rentals are active and unpaid, the measured statistics make sorting them
+    # cheaper than walking idx_payments_unpaid_month_rental or idx_renters_name; from
+    # about 100,000 rentals the planner walks those indexes instead
+    re.compile(r"WHERE py\.status = 'unpaid' AND r\.status = 'active'.*ORDER BY py\.payment_month, py\.rental_id", re.S),
+    re.compile(r"WHERE r\.payment_status = 'unpaid' AND r\.status = 'active'\s+ORDER BY rn\.full_name"),
+)
+
+
+def run_workload(db: DatabaseHandler):
+    """Call every public DatabaseHandler operation once on rows it creates and removes"""
+    product_id = db.add_product("Produit Audit", "bed", 100.000)
+    renter_id = db.add_renter("Locataire Audit", "+216 20 000 000")
+    rental_id = db.add_rental(product_id, renter_id, "monthly", 100.000, "2026-01-01", "2026-12-31")
+    payment_id = db.get_payments_by_rental(rental_id)[0]['id']
+    open_rental_id = db.add_rental(product_id, renter_id, "monthly", 100.000, "2026-01-01")
+
+    db.get_all_products()
+    db.get_product_by_id(product_id)
+    db.get_all_renters()
+    db.get_renter_by_id(renter_id)
+    db.search_renters("audit")
+    db.search("locataire audit")
+    db.get_all_rentals()
+    db.get_rentals_with_financials()
+    db.count_rentals()
+    list(db.iter_rentals_with_financials())
+    list(db.iter_tenant_totals())
+    list(db.iter_payment_schedules())
+    db.get_active_rentals()
+    db.get_rental_by_id(rental_id)
+    db.get_unpaid_payments()
+    db.get_unpaid_rentals_with_totals()
+    db.get_total_unpaid_amount()
+    db.get_tenant_totals()
+    db.get_rental_financial_summary(rental_id)
+    db.get_total_income()
+    db.get_income_by_rental(rental_id)
+    db.get_dashboard_stats()
+    db.verify_stats_counters()
+    for get_page in (db.get_rentals_page, db.get_renters_page, db.get_unpaid_payments_page):
+        _, token = get_page(limit=1)
+        get_page(after=token, limit=1)
+    _, token = db.get_payments_by_rental_page(rental_id, limit=2)
+    db.get_payments_by_rental_page(rental_id, after=token, limit=2)
+    db.get_payments_by_rental(open_rental_id)
+    db.get_income_by_rental(open_rental_id)
+
+    db.update_product(product_id, "Produit Audit", "equipment", 120.000)
+    db.update_renter(renter_id, "Locataire Audit", "+216 20 000 001")
+    db.add_rentals_bulk([{'product_id': product_id, 'renter_id': renter_id, 'billing_type': 'yearly',
+                          'rental_price': 900.000, 'start_date': "2026-01-01"}])
+    db.import_renters([{'full_name': "Locataire Audit", 'phone': "+216 20-000-001", 'id_number': "AUDIT"},
+                       {'full_name': "Locataire Import", 'phone': "20 000 002"}])
+    db.import_products([{'name': "Produit Audit", 'type': 'bed', 'rental_price': 130.000}])
+    db.import_rentals([{'product_id': product_id, 'renter_id': renter_id, 'billing_type': 'monthly',
+                        'rental_price': 100.000, 'start_date': "2026-01-01", 'end_date': "2026-12-31"},
+                       {'product_id': product_id, 'renter_id': renter_id, 'billing_type': 'monthly',
+                        'rental_price': 100.000, 'start_date': "2026-02-01", 'status': 'returned',
+                        'end_date': "2026-03-31"}])
+    db.mark_payment_paid(payment_id, "Audit")
+    db.mark_payment_unpaid(payment_id)
+    db.mark_period_paid(rental_id, "2026-02")
+    open_payment_id = db.mark_period_paid(open_rental_id, "2026-01", "Audit")
+    db.mark_payment_unpaid(open_payment_id)
+    db.update_rental_status(rental_id, 'returned')
+    db.update_rental_payment_status(rental_id, 'paid')
+    db.update_tenant_payment_status(renter_id, 'unpaid')
+    db.rebuild_stats_counters()
+    db.rebuild_search_index()
+    db.delete_rental(open_rental_id)
+    db.delete_rental(rental_id)
+    db.delete_renter(renter_id)
+    db.delete_product(product_id)
+
+
+def capture_statements(db: DatabaseHandler, workload: Callable[[DatabaseHandler], None] = run_workload) -> List[str]:
+    """Distinct SQL statements (with bound values) issued while running workload, in order"""
+    statements = []
+    db.set_trace_callback(statements.append)
+    try:
+        workload(db)
+    finally:
+        db.set_trace_callback(None)
+    seen = set()
+    unique = []
+    for statement in statements:
+        text = statement.strip()
+        # Statements run inside triggers are reported as "-- TRIGGER ..." comments and
+        # FTS5 bookkeeping on its shadow tables as statements on 'main'.'search_index_*'
+        if not re.match(r"(SELECT|INSERT|UPDATE|DELETE|WITH)\b", text, re.I) or text in seen:
+            continue
+        if "'main'.'search_index_" in text:
+            continue
+        seen.add(text)
+        unique.append(text)
+    return unique
+
+
+def trigger_statements(connection: sqlite3.Connection) -> List[str]:
+    """Statements run by the database triggers, with NEW/OLD columns bound to a literal.
+
+    Trigger bodies do not show up in the plans of the statements firing them, so
+    they are audited on their own.
+    """
+    statements = []
+    for name, sql in connection.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' ORDER BY name"):
+        body = sql[sql.upper().index("BEGIN") + len("BEGIN"):sql.upper().rindex("END")]
+        for statement in body.split(";"):
+            statement = re.sub(r"\b(NEW|OLD)\.\w+", "1", statement.strip())
+            if re.match(r"(INSERT|UPDATE|DELETE|WITH)\b", statement, re.I):
+                statements.append(f"-- {name}\n{statement}")
+    return statements
+
+
+def explain(connection: sqlite3.Connection, statement: str) -> List[str]:
+    """EXPLAIN QUERY PLAN detail lines of a statement"""
+    return [row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {statement}")]
+
+
+def audit_statements(connection: sqlite3.Connection, statements: List[str]) -> List[Dict]:
+    """Plan of every statement with the full scans and temp B-trees it uses.
+
+    Each entry has statement, plan (detail lines) and issues (flagged lines).
+    """
+    report = []
+    for statement in statements:
+        plan = explain(connection, statement)
+        sql = re.sub(r"^-- .*\n", "", statement)
+        expected_scan = any(pattern.match(sql) for pattern in EXPECTED_SCANS)
+        expected_sort = any(pattern.search(sql) for pattern in EXPECTED_SORTS)
+        issues = [detail for detail in plan
+                  if (TEMP_BTREE.search(detail) and not expected_sort)
+                  or (FULL_SCAN.match(detail) and not expected_scan)]
+        report.append({'statement': statement, 'plan': plan, 'issues': issues})
+    return report
+
+
+def audit_database(db_path: Optional[str] = None, renters: int = 5000) -> List[Dict]:
+    """Audit every DatabaseHandler query on a copy of db_path, or on a seeded database.
+
+    The workload writes, so it never runs on db_path itself.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        audit_path = os.path.join(tmp, "audit.db")
+        if db_path:
+            source = sqlite3.connect(db_path)
+            target = sqlite3.connect(audit_path)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            db = DatabaseHandler(audit_path)
+        else:
+            from benchmark_database import generate_database
+            db = generate_database(audit_path, renters=renters, payments=True)
+            db.analyze()
+        try:
+            statements = capture_statements(db) + trigger_statements(db.connection)
+            return audit_statements(db.connection, statements)
+        finally:
+            db.close()
+
+
+def format_report(report: List[Dict], verbose: bool = False) -> str:
+    """Human readable audit report (flagged statements only unless verbose)"""
+    lines = []
+    for entry in report:
+        if not entry['issues'] and not verbose:
+            continue
+        mark = "✗" if entry['issues'] else "✓"
+        lines.append(f"{mark} {' '.join(entry['statement'].split())[:160]}")
+        for detail in entry['plan']:
+            flag = "  <--" if detail in entry['issues'] else ""
+            lines.append(f"    {detail}{flag}")
+    flagged = sum(1 for entry in report if entry['issues'])
+    lines.append(f"{len(report)} statements audited, {flagged} flagged")
+    return "\n".join(lines)
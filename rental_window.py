@@ -6,9 +6,73 @@ from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel,
                              QLineEdit, QComboBox, QPushButton, QMessageBox,
                              QFormLayout, QDoubleSpinBox, QDateEdit, QTextEdit,
                              QGroupBox, QCheckBox)
-from PyQt5.QtCore import Qt, QDate, QLocale
+from PyQt5.QtCore import Qt, QDate, QLocale, QAbstractListModel, QModelIndex
 from PyQt5.QtGui import QFont
 from datetime import datetime
+from database import Money
+
+
+class PickerModel(QAbstractListModel):
+    """Combo box model over ids from a PickerIndex.
+    
+    Rows are materialised in batches as the list is scrolled (canFetchMore/fetchMore),
+    so showing 50k renters only builds the labels actually displayed.
+    """
+    
+    BATCH_SIZE = 200
+    
+    def __init__(self, index, placeholder, label, value=None, parent=None):
+        super().__init__(parent)
+        self.index = index
+        self.placeholder = placeholder
+        self.label = label
+        self.value = value or (lambda row: row['id'])
+        self.ids = []
+        self.loaded = 0
+    
+    def set_ids(self, ids):
+        """Show the given ids (already in display order)"""
+        self.beginResetModel()
+        self.ids = ids
+        self.loaded = min(len(ids), self.BATCH_SIZE)
+        self.endResetModel()
+    
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.loaded + 1
+    
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.loaded < len(self.ids)
+    
+    def fetchMore(self, parent=QModelIndex()):
+        count = min(self.BATCH_SIZE, len(self.ids) - self.loaded)
+        self.beginInsertRows(QModelIndex(), self.loaded + 1, self.loaded + count)
+        self.loaded += count
+        self.endInsertRows()
+    
+    def data(self, model_index, role=Qt.DisplayRole):
+        row = model_index.row()
+        if row == 0:
+            return self.placeholder if role == Qt.DisplayRole else None
+        entity = self.index.rows.get(self.ids[row - 1])
+        if entity is None:
+            return None
+        if role == Qt.DisplayRole:
+            return self.label(entity)
+        if role == Qt.UserRole:
+            return self.value(entity)
+        return None
+    
+    def row_of(self, entity_id):
+        """Combo row of an id, fetching batches until it is loaded (-1 if not shown)"""
+        try:
+            position = self.ids.index(entity_id)
+        except ValueError:
+            return -1
+        while self.loaded <= position:
+            self.fetchMore()
+        return position + 1
 
 
 class RentalWindow(QDialog):
@@ -41,7 +105,13 @@ class RentalWindow(QDialog):
         product_group = QGroupBox("Sélectionner Produit")
         product_layout = QFormLayout()
         
+        self.product_search = QLineEdit()
+        self.product_search.setPlaceholderText("🔍 Rechercher produit par nom ou type...")
+        self.product_search.textChanged.connect(self.filter_products)
+        product_layout.addRow("Recherche:", self.product_search)
+        
         self.product_combo = QComboBox()
+        self.product_combo.setSizeAdjustPolicy(QComboBox.AdjustToMinimumContentsLength)
         self.product_combo.currentIndexChanged.connect(self.product_selected)
         product_layout.addRow("Produit:", self.product_combo)
         
@@ -68,13 +138,13 @@ class RentalWindow(QDialog):
         
         # Search renter by name
         self.renter_search = QLineEdit()
-        self.renter_search.setPlaceholderText("🔍 Rechercher locataire par nom...")
+        self.renter_search.setPlaceholderText("🔍 Rechercher locataire par nom ou téléphone...")
         self.renter_search.textChanged.connect(self.filter_renters)
         renter_layout.addWidget(self.renter_search)
         
         # Existing renter dropdown
         self.renter_combo = QComboBox()
-        self.all_renters = []
+        self.renter_combo.setSizeAdjustPolicy(QComboBox.AdjustToMinimumContentsLength)
         renter_layout.addWidget(self.renter_combo)
         
         # New renter form
@@ -212,51 +282,50 @@ class RentalWindow(QDialog):
     def load_data(self):
         """Load products and renters"""
         # Load products
-        products = self.db.get_all_products()
-        self.product_combo.clear()
-        self.product_combo.addItem("-- Sélectionner Produit --", None)
-        for product in products:
-            self.product_combo.addItem(
-                f"{product['name']} ({product['type']}) - {product['rental_price']:.3f} TND",
-                product
-            )
+        self.product_model = PickerModel(
+            self.db.get_product_index(), "-- Sélectionner Produit --",
+            lambda product: f"{product['name']} ({product['type']}) - {product['rental_price']:.3f} TND",
+            value=dict, parent=self
+        )
+        self.product_combo.setModel(self.product_model)
+        self.filter_products(self.product_search.text())
         
         # Load renters
-        self.all_renters = self.db.get_all_renters()
-        self.populate_renter_combo(self.all_renters)
+        self.renter_model = PickerModel(
+            self.db.get_renter_index(), "-- Sélectionner Locataire --",
+            lambda renter: f"{renter['full_name']} - {renter['phone'] or 'Pas de téléphone'}",
+            parent=self
+        )
+        self.renter_combo.setModel(self.renter_model)
+        self.filter_renters(self.renter_search.text())
         self.calculate_cost()
     
-    def populate_renter_combo(self, renters):
-        """Fill renter combo with given list"""
-        current_id = self.renter_combo.currentData()
-        self.renter_combo.clear()
-        self.renter_combo.addItem("-- Sélectionner Locataire --", None)
-        for renter in renters:
-            self.renter_combo.addItem(
-                f"{renter['full_name']} - {renter['phone'] or 'Pas de téléphone'}",
-                renter['id']
-            )
-        if current_id:
-            index = self.renter_combo.findData(current_id)
-            if index >= 0:
-                self.renter_combo.setCurrentIndex(index)
+    def show_matches(self, combo, model, index, text):
+        """Show the rows of index matching text, keeping the current selection when it still matches"""
+        current = combo.currentData()
+        current_id = current['id'] if isinstance(current, dict) else current
+        model.index = index
+        model.set_ids(index.search(text))
+        combo.setCurrentIndex(max(0, model.row_of(current_id)) if current_id else 0)
+    
+    def filter_products(self, text):
+        """Filter products by name or type"""
+        self.show_matches(self.product_combo, self.product_model,
+                          self.db.get_product_index(), text)
     
     def filter_renters(self, text):
-        """Filter renters by name search"""
+        """Filter renters by name or phone"""
         if not self.existing_renter_radio.isChecked():
             return
-        if not text.strip():
-            self.populate_renter_combo(self.all_renters)
-        else:
-            filtered = self.db.search_renters(text)
-            self.populate_renter_combo(filtered)
+        self.show_matches(self.renter_combo, self.renter_model,
+                          self.db.get_renter_index(), text)
     
     def product_selected(self):
         """Handle product selection"""
         product = self.product_combo.currentData()
         if product:
             self.product_price_label.setText(f"{product['rental_price']:.3f} TND")
-            self.custom_price.setValue(product['rental_price'])
+            self.custom_price.setValue(float(product['rental_price']))
             self.calculate_cost()
         else:
             self.product_price_label.setText("0.000 TND")
@@ -292,7 +361,7 @@ class RentalWindow(QDialog):
     
     def calculate_cost(self):
         """Calculate and display costs"""
-        price = self.custom_price.value()
+        price = Money.from_tnd(self.custom_price.value())
         billing_type = self.billing_combo.currentText()
         periods = self._count_periods()
         
@@ -305,16 +374,16 @@ class RentalWindow(QDialog):
             yearly = price
             total_brut = price * periods
         
-        acompte = self.acompte.value()
-        escompte = self.escompte.value()
-        total_net = max(0.0, total_brut - escompte)
-        reste = max(0.0, total_net - acompte)
+        acompte = Money.from_tnd(self.acompte.value())
+        escompte = Money.from_tnd(self.escompte.value())
+        total_net = max(Money(), total_brut - escompte)
+        reste = max(Money(), total_net - acompte)
         
         if escompte > total_brut:
-            self.escompte.setValue(total_brut)
+            self.escompte.setValue(float(total_brut))
             return
         if acompte > total_net:
-            self.acompte.setValue(total_net)
+            self.acompte.setValue(float(total_net))
             return
         
         self.total_brut_label.setText(f"{total_brut:.3f} TND")
@@ -330,41 +399,38 @@ class RentalWindow(QDialog):
             QMessageBox.warning(self, "Attention", "Veuillez sélectionner un produit")
             return
         
-        # Get or create renter
+        # Get renter (a new renter is created with the rental, see below)
+        new_renter = None
         if self.existing_renter_radio.isChecked():
             renter_id = self.renter_combo.currentData()
             if not renter_id:
                 QMessageBox.warning(self, "Attention", "Veuillez sélectionner un locataire")
                 return
         else:
-            # Create new renter
             name = self.renter_name.text().strip()
             if not name:
                 QMessageBox.warning(self, "Attention", "Veuillez entrer le nom du locataire")
                 return
             
-            phone = self.renter_phone.text().strip()
-            email = self.renter_email.text().strip()
-            address = self.renter_address.toPlainText().strip()
-            id_number = self.renter_id_number.text().strip()
-            
-            try:
-                renter_id = self.db.add_renter(name, phone, email, address, id_number)
-            except Exception as e:
-                QMessageBox.critical(self, "Erreur", f"Échec de création du locataire: {str(e)}")
-                return
+            new_renter = (
+                name,
+                self.renter_phone.text().strip(),
+                self.renter_email.text().strip(),
+                self.renter_address.toPlainText().strip(),
+                self.renter_id_number.text().strip()
+            )
         
         # Get rental details
         billing_type_fr = self.billing_combo.currentText()
         # Convert French to English for database
         billing_type = 'monthly' if billing_type_fr == 'mensuel' else 'yearly'
-        rental_price = self.custom_price.value()
+        rental_price = Money.from_tnd(self.custom_price.value())
         start_date = self.start_date.date().toString("yyyy-MM-dd")
         end_date = self.end_date.date().toString("yyyy-MM-dd")
         payment_status_fr = self.payment_status_combo.currentText()
         payment_status = 'paid' if payment_status_fr == 'payé' else 'unpaid'
-        acompte = self.acompte.value()
-        escompte = self.escompte.value()
+        acompte = Money.from_tnd(self.acompte.value())
+        escompte = Money.from_tnd(self.escompte.value())
         
         if self.end_date.date() < self.start_date.date():
             QMessageBox.warning(self, "Attention", "La date de fin doit être après la date de début")
@@ -385,19 +451,24 @@ class RentalWindow(QDialog):
             return
         
         try:
-            rental_id = self.db.add_rental(
-                product['id'], 
-                renter_id, 
-                billing_type, 
-                rental_price, 
-                start_date, 
-                end_date,
-                acompte,
-                escompte
-            )
-            
-            # Set payment status
-            self.db.update_rental_payment_status(rental_id, payment_status)
+            # One unit of work: renter, rental, schedule and status are saved together
+            with self.db.transaction():
+                if new_renter:
+                    renter_id = self.db.add_renter(*new_renter)
+                
+                rental_id = self.db.add_rental(
+                    product['id'], 
+                    renter_id, 
+                    billing_type, 
+                    rental_price, 
+                    start_date, 
+                    end_date,
+                    acompte,
+                    escompte
+                )
+                
+                # Set payment status
+                self.db.update_rental_payment_status(rental_id, payment_status)
             
             QMessageBox.information(self, "Succès", 
                                    f"Location créée avec succès!\nID Location: {rental_id}")
@@ -3,8 +3,13 @@ Database Test Script
 Tests all database operations to ensure everything works correctly
 """
 
-from database import DatabaseHandler
+from database import DatabaseHandler, Money, parse_date, to_iso_date
 from datetime import datetime
+import calendar
+import json
+import sqlite3
+import os
+import tempfile
 
 def test_database():
     """Test all database operations"""
@@ -141,9 +146,1150 @@ def test_database():
     print("  Password: admin123")
     print("=" * 60)
 
+def test_tenant_totals():
+    """Test per-tenant received/owed totals and payment labels"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseHandler(os.path.join(tmp, "tenants.db"))
+        product_id = db.add_product("Standard Bed", "bed", 100.000)
+        paid_renter = db.add_renter("Ahmed Ben Ali")
+        mixed_renter = db.add_renter("Fatima Trabelsi")
+        idle_renter = db.add_renter("Sami Gharbi")
+        
+        paid_rental = db.add_rental(product_id, paid_renter, "monthly", 100.000,
+                                    "2026-01-01", "2026-12-31", acompte=50.000, escompte=100.000)
+        db.update_rental_payment_status(paid_rental, 'paid')
+        db.add_rental(product_id, mixed_renter, "monthly", 100.000,
+                      "2026-01-01", "2026-06-30", acompte=200.000)
+        mixed_paid = db.add_rental(product_id, mixed_renter, "yearly", 1000.000,
+                                   "2026-01-01", "2027-12-31")
+        db.update_rental_payment_status(mixed_paid, 'paid')
+        returned = db.add_rental(product_id, idle_renter, "monthly", 100.000,
+                                 "2026-01-01", "2026-03-31")
+        db.update_rental_status(returned, 'returned')
+        
+        totals = {t['renter_id']: t for t in db.get_tenant_totals()}
+        db.close()
+    
+    assert totals[paid_renter]['payment_status'] == 'payé'
+    assert totals[paid_renter]['total_received'] == 1100.000
+    assert totals[paid_renter]['total_owed'] == 0.0
+    assert totals[mixed_renter]['payment_status'] == 'partiel'
+    assert totals[mixed_renter]['total_rentals'] == 2
+    assert totals[mixed_renter]['total_received'] == 2200.000
+    assert totals[mixed_renter]['total_owed'] == 400.000
+    assert totals[idle_renter]['payment_status'] == 'aucune location'
+    assert totals[idle_renter]['total_amount'] == 0.0
+    print("✓ Tenant totals computed correctly")
+
+def test_money_amounts():
+    """Test exact millime amounts and the SQL-side report sums"""
+    assert Money.from_tnd("12,5") == Money(12500) == 12.5
+    assert sum([Money.from_tnd(0.1)] * 3) == 0.3 and 0.1 + 0.1 + 0.1 != 0.3
+    assert f"{Money(1234567):.3f} TND" == "1234.567 TND" and Money(1000) / 3 == Money(333)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseHandler(os.path.join(tmp, "money.db"))
+        product_id = db.add_product("Lit", "bed", 0.1)
+        renter_id = db.add_renter("Ahmed Ben Ali")
+        rental_id = db.add_rental(product_id, renter_id, "monthly", 0.1, "2026-01-01", "2026-03-31")
+        for payment in db.get_payments_by_rental(rental_id):
+            db.mark_payment_paid(payment['id'])
+        assert db.get_total_income() == Money(300)
+        assert db.get_dashboard_stats()['total_income'] == Money(300)
+        try:
+            db.connection.execute("UPDATE payments SET amount = 1.5")
+            assert False, "REAL amount accepted"
+        except sqlite3.IntegrityError:
+            db.connection.rollback()
+        
+        # SQL sums count the periods like count_billing_periods (month ends, leap days)
+        for billing_type, start, end, status in [
+            ("monthly", "2024-01-31", "2024-02-29", 'unpaid'), ("yearly", "2024-02-29", "2025-02-28", 'paid'),
+            ("monthly", "2025-06-15", None, 'unpaid'), ("yearly", "2023-12-31", None, 'unpaid'),
+            ("monthly", "2025-01-10", "2025-01-10", 'paid'), ("monthly", "2099-01-01", None, 'unpaid'),
+        ]:
+            rental_id = db.add_rental(product_id, renter_id, billing_type, 123.456, start, end,
+                                      acompte=50.5, escompte=10.125)
+            db.update_rental_payment_status(rental_id, status)
+        rentals = db.get_active_rentals()
+        amounts = [db.get_rental_financial_summary(rental['id']) for rental in rentals]
+        totals = db.get_tenant_totals()[0]
+        assert totals['total_received'] == sum(a['total_received'] for a in amounts)
+        assert totals['total_owed'] == sum(a['still_owed'] for a in amounts) == db.get_total_unpaid_amount()
+        db.close()
+    print("✓ Amounts are exact millimes")
+
+def test_financial_engine_matches_scalar():
+    """Test that the NumPy financial engine matches _calculate_rental_amounts"""
+    from financial_engine import HAS_NUMPY, compute_rental_amounts_from_rows
+    if not HAS_NUMPY:
+        print("NumPy not installed: financial engine test skipped")
+        return
+    rentals = [
+        {'start_date': '2024-02-29', 'end_date': '2025-02-28', 'billing_type': 'yearly'},
+        {'start_date': '2024-01-31', 'end_date': '2024-02-29', 'billing_type': 'monthly'},
+        {'start_date': '15/03/2026', 'end_date': '14/03/2027', 'billing_type': 'monthly'},
+        {'start_date': '2026-05-10', 'end_date': '2026-05-01', 'billing_type': 'monthly'},
+        {'start_date': '2025-06-15', 'end_date': None, 'billing_type': 'monthly'},
+        {'start_date': '2025-06-15 10:30:00', 'end_date': '', 'billing_type': 'yearly'},
+        {'start_date': '', 'end_date': '2026-01-01', 'billing_type': 'monthly'},
+        {'start_date': 'inconnue', 'end_date': '2026-01-01', 'billing_type': 'yearly'},
+    ]
+    for index, rental in enumerate(rentals):
+        rental.update({
+            'rental_price': 123.456 * (index + 1),
+            'acompte': None if index == 0 else 50.5 * index,
+            'escompte': 10.125 * index,
+            'payment_status': 'paid' if index % 2 else 'unpaid'
+        })
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseHandler(os.path.join(tmp, "engine.db"))
+        scalar = [db._calculate_rental_amounts(rental) for rental in rentals]
+        
+        # A malformed end date is rejected by both paths rather than billed up to today
+        malformed = dict(rentals[0], end_date='31/02/2025')
+        errors = []
+        for calculate in (db._calculate_rental_amounts, lambda rental: compute_rental_amounts_from_rows([rentals[1], rental])):
+            try:
+                calculate(malformed)
+            except ValueError as e:
+                errors.append(str(e))
+        assert errors == ["Date de fin invalide: 31/02/2025"] * 2, errors
+        db.close()
+    vector = compute_rental_amounts_from_rows(rentals)
+    
+    for key, values in vector.items():
+        if key != 'periods':
+            values = [Money(value) for value in values.tolist()]
+        assert list(values) == [amounts[key] for amounts in scalar], key
+    print("✓ Financial engine matches the scalar path")
+
+def test_add_rentals_bulk():
+    """Test bulk rental creation and its all-or-nothing behaviour"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseHandler(os.path.join(tmp, "bulk.db"))
+        product_id = db.add_product("Standard Bed", "bed", 150.000)
+        renter_id = db.add_renter("Ahmed Ben Ali")
+        single_id = db.add_rental(product_id, renter_id, "monthly", 150.000,
+                                  "2024-01-31", "2024-12-31")
+        
+        bulk_ids = db.add_rentals_bulk([
+            {'product_id': product_id, 'renter_id': renter_id, 'billing_type': 'monthly',
+             'rental_price': 150.000, 'start_date': '2024-01-31', 'end_date': '2024-12-31'},
+            {'product_id': product_id, 'renter_id': renter_id, 'billing_type': 'yearly',
+             'rental_price': 2000.000, 'start_date': '2024-02-29', 'end_date': '2027-03-01',
+             'payment_status': 'paid'},
+        ])
+        assert len(bulk_ids) == 2
+        
+        def schedule(rental_id):
+            return [(p['payment_date'], p['amount'], p['payment_month'])
+                    for p in db.get_payments_by_rental(rental_id)]
+        
+        assert schedule(bulk_ids[0]) == schedule(single_id)
+        assert len(schedule(single_id)) == 12
+        assert [p[0] for p in schedule(bulk_ids[1])] == [
+            '2024-02-29', '2025-02-28', '2026-02-28', '2027-02-28'
+        ]
+        assert db.get_rental_by_id(bulk_ids[1])['payment_status'] == 'paid'
+        
+        try:
+            db.add_rentals_bulk([
+                {'product_id': product_id, 'renter_id': renter_id, 'billing_type': 'monthly',
+                 'rental_price': 100.000, 'start_date': '2025-01-01'},
+                {'product_id': product_id, 'renter_id': renter_id, 'billing_type': 'monthly',
+                 'rental_price': 100.000, 'start_date': '2025-06-01', 'end_date': '2025-01-01'},
+            ])
+            assert False, "invalid rental should abort the bulk insert"
+        except ValueError:
+            pass
+        assert len(db.get_all_rentals()) == 3
+        db.close()
+    print("✓ Bulk rental creation works")
+
+def test_storage_profiles():
+    """Test storage profile selection by argument and environment variable"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseHandler(os.path.join(tmp, "safe.db"), profile="safe")
+        db.cursor.execute("PRAGMA journal_mode")
+        assert db.cursor.fetchone()[0] == 'delete'
+        db.close()
+        
+        # Without a choice, commits are durable: rollback journal and synchronous=FULL
+        db = DatabaseHandler(os.path.join(tmp, "default.db"))
+        assert db.profile == 'safe'
+        db.cursor.execute("PRAGMA synchronous")
+        assert db.cursor.fetchone()[0] == 2
+        db.close()
+        
+        os.environ['RENTAL_DB_PROFILE'] = 'fast-bulk'
+        try:
+            db = DatabaseHandler(os.path.join(tmp, "fast.db"))
+        finally:
+            del os.environ['RENTAL_DB_PROFILE']
+        assert db.profile == 'fast-bulk'
+        db.cursor.execute("PRAGMA journal_mode")
+        assert db.cursor.fetchone()[0] == 'wal'
+        db.cursor.execute("PRAGMA synchronous")
+        assert db.cursor.fetchone()[0] == 0
+        db.close()
+        
+        try:
+            DatabaseHandler(os.path.join(tmp, "bad.db"), profile="turbo")
+            assert False, "unknown profile should be rejected"
+        except ValueError:
+            pass
+    print("✓ Storage profiles applied")
+
+def test_backups():
+    """Test online compressed backups, restore and retention"""
+    from backup_manager import BackupManager
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "live.db")
+        backup_dir = os.path.join(tmp, "backups")
+        db = DatabaseHandler(db_path)
+        db.add_product("Standard Bed", "bed", 150.000)
+        
+        steps = []
+        backup_path = db.save_all(backup_dir, progress=lambda copied, total: steps.append((copied, total)))
+        db.close()
+        assert backup_path.endswith(".db.gz")
+        assert steps and steps[-1][0] == steps[-1][1]
+        
+        manager = BackupManager(db_path, backup_dir)
+        restored = DatabaseHandler(manager.restore_backup(backup_path, os.path.join(tmp, "restored.db")))
+        assert [p['name'] for p in restored.get_all_products()] == ["Standard Bed"]
+        restored.close()
+
+        # A truncated backup fails without touching the current database
+        broken_path = os.path.join(tmp, "broken.db.gz")
+        with open(backup_path, 'rb') as src, open(broken_path, 'wb') as dst:
+            dst.write(src.read()[:100])
+        before = open(db_path, 'rb').read()
+        try:
+            manager.restore_backup(broken_path)
+            assert False, "truncated backup restored"
+        except (EOFError, OSError):
+            pass
+        assert open(db_path, 'rb').read() == before
+        assert not os.path.exists(db_path + ".restore")
+
+        # Two snapshots a day over three weeks: keep 3 daily + 2 weekly
+        os.remove(backup_path)
+        for day in range(1, 22):
+            for hour in (9, 18):
+                name = f"rental_management_backup_202603{day:02d}_{hour:02d}0000.db.gz"
+                open(os.path.join(backup_dir, name), 'wb').close()
+        # An uncompressed copy made by an earlier version is never pruned
+        open(os.path.join(backup_dir, "rental_management_backup_20260301_090000.db"), 'wb').close()
+        manager = BackupManager(db_path, backup_dir, keep_daily=3, keep_weekly=2, keep_last=1)
+        manager.apply_retention()
+        kept = sorted(os.listdir(backup_dir))
+    assert kept == [
+        "rental_management_backup_20260301_090000.db",
+        "rental_management_backup_20260315_180000.db.gz",
+        "rental_management_backup_20260319_180000.db.gz",
+        "rental_management_backup_20260320_180000.db.gz",
+        "rental_management_backup_20260321_180000.db.gz",
+    ]
+    print("✓ Backups created, restored and pruned")
+
+def test_incremental_backups():
+    """Test incremental snapshots only store changed chunks and restore exactly"""
+    from backup_manager import BackupManager
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "live.db")
+        backup_dir = os.path.join(tmp, "backups")
+        db = DatabaseHandler(db_path)
+        product_id = db.add_product("Standard Bed", "bed", 150.000)
+        renter_id = db.add_renter("Ahmed Ben Ali")
+        db.add_rentals_bulk([{'product_id': product_id, 'renter_id': renter_id,
+                              'billing_type': 'monthly', 'rental_price': 150.000,
+                              'start_date': '2020-01-01', 'end_date': '2026-12-31'}] * 200)
+        
+        manager = BackupManager(db_path, backup_dir, chunk_size=16 * 1024)
+        first = manager.create_incremental_backup(db.connection)
+        db.mark_payment_paid(1, "Paid by cash")
+        second = manager.create_incremental_backup(db.connection)
+        db.close()
+        
+        with open(first) as f:
+            first_manifest = json.load(f)
+        with open(second) as f:
+            second_manifest = json.load(f)
+        assert first_manifest['new_chunks'] == len(set(first_manifest['chunks']))
+        assert 0 < second_manifest['new_chunks'] < len(second_manifest['chunks']) // 4
+        
+        restored_path = manager.restore_incremental_backup(first, os.path.join(tmp, "first.db"))
+        restored = DatabaseHandler(restored_path)
+        assert restored.get_payments_by_rental(1)[0]['status'] == 'unpaid'
+        restored.close()
+        restored = DatabaseHandler(manager.restore_incremental_backup(second, os.path.join(tmp, "second.db")))
+        assert restored.get_payments_by_rental(1)[0]['status'] == 'paid'
+        restored.close()
+    print("✓ Incremental backups store deltas and restore")
+
+def test_entity_cache():
+    """Test product/renter caching, write invalidation and outside writers"""
+    import sqlite3
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "cache.db")
+        db = DatabaseHandler(db_path)
+        product_id = db.add_product("Standard Bed", "bed", 150.000)
+        renter_id = db.add_renter("Ahmed Ben Ali")
+        
+        db.get_all_products()
+        db.get_all_products()[0]['name'] = "Modified by caller"
+        assert db.get_all_products()[0]['name'] == "Standard Bed"
+        db.get_renter_by_id(renter_id)
+        db.get_renter_by_id(renter_id)
+        stats = db.get_cache_stats()
+        assert stats['misses'] == 2 and stats['hits'] == 3
+        
+        db.update_product(product_id, "Hospital Bed", "bed", 180.000)
+        assert db.get_product_by_id(product_id)['name'] == "Hospital Bed"
+        assert db.get_all_products()[0]['rental_price'] == 180.000
+        
+        outside = sqlite3.connect(db_path)
+        outside.execute("UPDATE renters SET full_name = 'Fatima Trabelsi' WHERE id = ?", (renter_id,))
+        outside.commit()
+        outside.close()
+        assert db.get_renter_by_id(renter_id)['full_name'] == "Fatima Trabelsi"
+        db.close()
+    print("✓ Entity cache invalidated on writes")
+
+def test_stats_counters():
+    """Test trigger-maintained dashboard counters against recomputed values"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseHandler(os.path.join(tmp, "stats.db"))
+        product_id = db.add_product("Standard Bed", "bed", 150.000)
+        db.add_product("Wheelchair", "equipment", 80.000)
+        renter_id = db.add_renter("Ahmed Ben Ali")
+        first = db.add_rental(product_id, renter_id, "monthly", 150.000, "2026-01-01", "2026-06-30")
+        second = db.add_rental(product_id, renter_id, "yearly", 1000.000, "2026-01-01", "2027-12-31")
+        db.update_rental_payment_status(second, 'paid')
+        payments = db.get_payments_by_rental(first)
+        db.mark_payment_paid(payments[0]['id'])
+        db.mark_payment_paid(payments[1]['id'])
+        db.mark_payment_unpaid(payments[1]['id'])
+        db.update_rental_status(first, 'returned')
+        db.delete_rental(second)
+        
+        stats = db.get_dashboard_stats()
+        assert stats['total_products'] == 2
+        assert stats['active_rentals'] == 0
+        assert stats['unpaid_count'] == 7  # payments of the deleted rental are kept
+        assert stats['total_income'] == 150.000
+        assert db.verify_stats_counters() == {}
+        
+        db.cursor.execute("UPDATE stats_counters SET total_products = 99 WHERE id = 1")
+        db.connection.commit()
+        assert db.verify_stats_counters() == {'total_products': (99, 2)}
+        db.rebuild_stats_counters()
+        assert db.verify_stats_counters() == {}
+        db.close()
+    print("✓ Dashboard counters maintained by triggers")
+
+def test_global_search():
+    """Test ranked full-text search across renters, products, rentals and notes"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseHandler(os.path.join(tmp, "search.db"))
+        bed = db.add_product("Lit Médicalisé", "bed", 150.000)
+        hélène = db.add_renter("Hélène Ben Ali", "+216 98 123 456", "helene@email.tn", "", "12345678")
+        db.add_renter("Fatima Trabelsi", "+216 22 987 654")
+        for i in range(20):
+            db.add_renter(f"Locataire {i}", f"+216 50 000 {i:03d}")
+        rental_id = db.add_rental(bed, hélène, "monthly", 150.000, "2026-01-01", "2026-03-31")
+        payment_id = db.get_payments_by_rental(rental_id)[0]['id']
+        db.mark_payment_paid(payment_id, "Virement bancaire reçu")
+        
+        hits = db.search("helene")
+        assert (hits[0]['entity_type'], hits[0]['entity_id']) == ('renter', hélène)
+        assert ('rental', rental_id) in [(h['entity_type'], h['entity_id']) for h in hits]
+        assert [h['entity_id'] for h in db.search("98123456")] == [hélène]
+        assert [h['entity_id'] for h in db.search("12345678")] == [hélène]
+        assert db.search("medicalise")[0]['entity_type'] == 'product'
+        assert [(h['entity_type'], h['entity_id']) for h in db.search("virement recu")] == [('payment', payment_id)]
+        assert [r['full_name'] for r in db.search_renters("trab")] == ["Fatima Trabelsi"]
+        
+        db.update_renter(hélène, "Hélène Gharbi", "+216 98 123 456")
+        assert db.search("ben ali") == []
+        assert {h['entity_type'] for h in db.search("gharbi")} == {'renter', 'rental', 'payment'}
+        db.delete_renter(hélène)
+        assert 'renter' not in {h['entity_type'] for h in db.search("gharbi")}
+        db.close()
+    print("✓ Global search finds ranked hits")
+
+def test_picker_index():
+    """Test the in-memory renter/product picker indexes and their incremental refresh"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "picker.db")
+        db = DatabaseHandler(path)
+        db.add_product("Fauteuil Roulant", "equipment", 80.000)
+        zoé = db.add_renter("Zoé Mansour", "+216 98 123 456")
+        ali = db.add_renter("Ali Ben Salah", "+216 22 987 654")
+        émile = db.add_renter("Émile Ben Amor", "")
+        
+        index = db.get_renter_index()
+        assert index.search("") == [ali, émile, zoé]
+        assert index.search("ben") == [ali, émile]
+        assert index.search("EMI") == [émile]
+        assert index.search("ben sal") == [ali]
+        assert index.search("98123456") == [zoé]
+        assert index.search("22 98") == [ali]
+        assert index.search("xyz") == []
+        assert len(db.get_product_index().search("fauteuil")) == 1
+        
+        # Writes through the handler update the built index in place
+        karim = db.add_renter("Karim Ben Youssef", "55 111 222")
+        db.update_renter(zoé, "Zoé Ben Mansour", "+216 98 123 456")
+        db.delete_renter(ali)
+        assert db.get_renter_index() is index
+        assert index.search("ben") == [émile, karim, zoé]
+        assert index.search("salah") == []
+        
+        # Writes from another connection make the next call rebuild it
+        other = DatabaseHandler(path)
+        other.add_renter("Benoît Dridi", "")
+        other.close()
+        assert len(db.get_renter_index().search("ben")) == 4
+        db.close()
+    print("✓ Picker indexes match prefixes and follow writes")
+
+def test_keyset_pagination():
+    """Test keyset pages, continuation tokens and streaming iterators"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseHandler(os.path.join(tmp, "pages.db"))
+        bed = db.add_product("Lit", "bed", 100.000)
+        renter_ids = [db.add_renter(f"Locataire {i:02d}") for i in range(25)]
+        rental_ids = [db.add_rental(bed, renter_id, "monthly", 100.000, "2026-01-01", "2026-06-30")
+                      for renter_id in renter_ids[:12]]
+        
+        pages, token = [], None
+        while True:
+            page, token = db.get_renters_page(after=token, limit=10)
+            pages.append(page)
+            if token is None:
+                break
+        assert [len(page) for page in pages] == [10, 10, 5]
+        assert [r['id'] for page in pages for r in page] == [r['id'] for r in db.get_all_renters()]
+        
+        assert [r['id'] for r in db.iter_rentals(batch_size=5)] == sorted(rental_ids, reverse=True)
+        first, token = db.get_rentals_page(limit=12)
+        assert len(first) == 12 and token is None
+        
+        payments = list(db.iter_payments_by_rental(rental_ids[0], batch_size=4))
+        assert [p['id'] for p in payments] == [p['id'] for p in db.get_payments_by_rental(rental_ids[0])]
+        assert len(list(db.iter_unpaid_payments(batch_size=7))) == len(db.get_unpaid_payments()) == 72
+        
+        # A page boundary survives writes made between two pages
+        page, token = db.get_renters_page(limit=5)
+        db.delete_renter(page[-1]['id'])
+        db.add_renter("Locataire 00 bis")
+        page, token = db.get_renters_page(after=token, limit=5)
+        assert page[0]['full_name'] == "Locataire 05"
+        
+        try:
+            db.get_renters_page(after="pas-un-jeton")
+            assert False, "invalid token accepted"
+        except ValueError:
+            pass
+        db.close()
+    print("✓ Keyset pagination and streaming iterators")
+
+def test_iso_dates():
+    """Test ISO date storage, the migration of older rows and the fast parser"""
+    assert parse_date("2026-01-15") == parse_date("15/01/2026") == datetime(2026, 1, 15)
+    assert parse_date("2026-01-15 10:30:00") == datetime(2026, 1, 15)
+    assert parse_date("2026-1-5") == datetime(2026, 1, 5)
+    assert parse_date("pas une date") is None
+    assert to_iso_date("05-02-2026") == "2026-02-05"
+    assert to_iso_date("") is None
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "dates.db")
+        db = DatabaseHandler(path)
+        bed = db.add_product("Lit", "bed", 100.000)
+        renter = db.add_renter("Sami Jaziri")
+        rental_id = db.add_rental(bed, renter, "monthly", 100.000, "15/01/2026", "14/03/2026")
+        rental = db.get_rental_by_id(rental_id)
+        assert (rental['start_date'], rental['end_date']) == ("2026-01-15", "2026-03-14")
+        try:
+            db.add_rental(bed, renter, "monthly", 100.000, "31/02/2026")
+            assert False, "invalid date accepted"
+        except ValueError:
+            pass
+        try:
+            db.cursor.execute("UPDATE rentals SET end_date = '01/06/2026' WHERE id = ?", (rental_id,))
+            assert False, "non ISO date written"
+        except sqlite3.IntegrityError:
+            pass
+        
+        # Simulate a database written before the migration existed
+        db.cursor.executescript("""
+            DROP TRIGGER trg_rentals_iso_dates_insert;
+            DROP TRIGGER trg_rentals_iso_dates_update;
+            DROP TRIGGER trg_payments_iso_date_insert;
+            DROP TRIGGER trg_payments_iso_date_update;
+            PRAGMA user_version = 3;
+        """)
+        db.cursor.execute("UPDATE rentals SET start_date = '15/01/2026', end_date = '' WHERE id = ?",
+                          (rental_id,))
+        db.cursor.execute("UPDATE payments SET payment_date = '15-02-2026', notes = 'Ancien' WHERE rental_id = ?",
+                          (rental_id,))
+        db.connection.commit()
+        db.close()
+        
+        db = DatabaseHandler(path)
+        rental = db.get_rental_by_id(rental_id)
+        assert (rental['start_date'], rental['end_date']) == ("2026-01-15", None)
+        # Annotated payments are kept when the rental becomes open-ended (virtual schedule)
+        stored = db.connection.execute("SELECT payment_date FROM payments WHERE rental_id = ?",
+                                       (rental_id,)).fetchall()
+        assert {row[0] for row in stored} == {"2026-02-15"}
+        db.close()
+    print("✓ Dates are stored as ISO and parsed through the fast path")
+
+def test_query_plans():
+    """Test that no DatabaseHandler query needs a full scan or a temp B-tree"""
+    from query_audit import audit_database
+    report = audit_database(renters=200)
+    assert len(report) > 50
+    flagged = [(entry['statement'], entry['issues']) for entry in report if entry['issues']]
+    assert flagged == [], flagged
+    
+    # Plans come from measured statistics, not INDEXED BY: a missing index only costs speed
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseHandler(os.path.join(tmp, "plans.db"))
+        assert db.connection.execute("""SELECT COUNT(*) FROM sqlite_stat1
+                                        WHERE tbl IN ('rentals', 'payments')""").fetchone()[0] == 0
+        bed = db.add_product("Lit", "bed", 100.000)
+        renter = db.add_renter("Locataire")
+        db.add_rental(bed, renter, "monthly", 100.000, "2026-01-01", "2026-03-31")
+        db.add_rental(bed, renter, "monthly", 100.000, "2026-01-01")
+        for index in ("idx_payments_unpaid_month_rental", "idx_rentals_active_start",
+                      "idx_rentals_unpaid_active", "idx_rentals_open_ended"):
+            db.connection.execute(f"DROP INDEX {index}")
+        db.connection.commit()
+        assert len(db.get_unpaid_payments()) == len(list(db.iter_unpaid_payments(batch_size=2)))
+        assert len(db.get_active_rentals()) == 2
+        assert len(db.get_unpaid_rentals_with_totals()) == 2
+        
+        # Statistics written by earlier versions instead of measured ones are measured again
+        db.connection.execute("INSERT INTO sqlite_stat1 VALUES ('payments', 'idx_payments_rental', '45381 14')")
+        db.connection.execute("PRAGMA user_version = 14")
+        db.connection.commit()
+        db.close()
+        db = DatabaseHandler(os.path.join(tmp, "plans.db"))
+        assert db.connection.execute("SELECT stat FROM sqlite_stat1 WHERE idx = 'idx_payments_rental'").fetchone()[0] == "3 3"
+        db.close()
+    print("✓ Query plans use indexes")
+
+def test_schema_migrations():
+    """Test PRAGMA user_version migrations on new, current and unversioned databases"""
+    latest = DatabaseHandler.MIGRATIONS[-1][0]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "versions.db")
+        db = DatabaseHandler(path)
+        assert db.schema_version == latest
+        db.close()
+        
+        # A current database only reads PRAGMA user_version at startup
+        db = DatabaseHandler(path)
+        statements = []
+        db.connection.set_trace_callback(statements.append)
+        db.create_tables()
+        assert statements == ["PRAGMA user_version"]
+        db.close()
+        
+        # A database from before versioning: old rentals table, user_version 0
+        old_path = os.path.join(tmp, "old.db")
+        connection = sqlite3.connect(old_path)
+        connection.executescript("""
+            CREATE TABLE products (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL,
+                type TEXT NOT NULL, rental_price REAL NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+            CREATE TABLE rentals (id INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER NOT NULL,
+                renter_id INTEGER NOT NULL, billing_type TEXT NOT NULL, rental_price REAL NOT NULL,
+                start_date DATE NOT NULL, end_date DATE, status TEXT NOT NULL DEFAULT 'active',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+            INSERT INTO products (name, type, rental_price) VALUES ('Lit', 'bed', 100);
+            INSERT INTO rentals (product_id, renter_id, billing_type, rental_price, start_date)
+                VALUES (1, 1, 'monthly', 100, '01/02/2026');
+            INSERT INTO rentals (product_id, renter_id, billing_type, rental_price, start_date, status)
+                VALUES (1, 1, 'monthly', 99.999, '2026-01-15', 'returned');
+        """)
+        connection.close()
+        db = DatabaseHandler(old_path)
+        assert db.schema_version == latest
+        # The schedule stored by step 9 is converted to millimes with the rest by step 12
+        assert all(p['id'] and p['amount'] == Money(99999) for p in db.get_payments_by_rental(2))
+        db.cursor.execute("SELECT start_date, payment_status, acompte, rental_price FROM rentals WHERE id = 1")
+        assert tuple(db.cursor.fetchone()) == ("2026-02-01", "unpaid", Money(0), Money(100000))
+        assert db.get_dashboard_stats()['total_products'] == 1
+        # Step 8 replaces the unpaid-month index created by step 5
+        db.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_payments_unpaid%'")
+        assert [row[0] for row in db.cursor.fetchall()] == ["idx_payments_unpaid_month_rental"]
+        
+        # Step 9 ends the schedule of open-ended rentals returned before it
+        db.cursor.execute("UPDATE rentals SET status = 'returned' WHERE id = 1")
+        db.cursor.execute("PRAGMA user_version = 8")
+        db.connection.commit()
+        db.close()
+        db = DatabaseHandler(old_path)
+        db.cursor.execute("SELECT end_date FROM rentals WHERE id = 1")
+        assert db.cursor.fetchone()[0] == datetime.now().strftime("%Y-%m-%d")
+        assert all(p['id'] and p['amount'] == 100.000 for p in db.get_payments_by_rental(1))
+        db.close()
+    print("✓ Schema migrations run once per version")
+
+def test_concurrent_access():
+    """Test reads from worker threads while another thread writes"""
+    import threading
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseHandler(os.path.join(tmp, "threads.db"), profile='balanced')
+        product_id = db.add_product("Lit", "bed", 100.000)
+        renter_ids = [db.add_renter(f"Locataire {i}", f"+216 20 000 {i:03d}") for i in range(20)]
+        errors = []
+        done = threading.Event()
+        
+        def writer():
+            try:
+                for renter_id in renter_ids:
+                    db.add_rental(product_id, renter_id, "monthly", 100.000, "2026-01-01", "2026-06-30")
+            except Exception as e:
+                errors.append(e)
+            finally:
+                done.set()
+        
+        def reader():
+            try:
+                while not done.is_set():
+                    rentals = db.get_all_rentals()
+                    # A rental and its schedule are committed together
+                    for rental in rentals[:3]:
+                        assert len(db.get_payments_by_rental(rental['id'])) == 6
+                    stats = db.get_dashboard_stats()
+                    assert stats['unpaid_count'] == 6 * stats['active_rentals']
+                    db.get_renters_page(limit=5)
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=reader) for _ in range(4)]
+        threads.append(threading.Thread(target=writer))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert errors == [], errors
+        assert len(db.get_all_rentals()) == 20
+        assert len(db.pool.connections()) >= 5
+        assert db.verify_stats_counters() == {}
+        
+        # A row read before a concurrent update is returned but never cached
+        def load_then_update():
+            row = dict(db._read_cursor().execute("SELECT * FROM products WHERE id = ?",
+                                                 (product_id,)).fetchone())
+            db.update_product(product_id, "Lit double", "bed", 120.000)
+            return row
+        assert db._cached(('product', product_id), load_then_update)['name'] == "Lit"
+        assert db.get_product_by_id(product_id)['name'] == "Lit double"
+        
+        # Cached reads do not wait for the writer
+        results = []
+        with db.pool.write_lock:
+            reader_thread = threading.Thread(target=lambda: results.append(db.get_product_by_id(product_id)))
+            reader_thread.start()
+            reader_thread.join(timeout=5)
+        assert results and results[0]['name'] == "Lit double"
+        db.close()
+    print("✓ Worker threads read while another thread writes")
+
+def test_async_handler():
+    """Test the asyncio facade: awaitable methods, gather and bounded concurrency"""
+    import asyncio
+    from async_database import AsyncDatabaseHandler
+    
+    async def scenario(path):
+        async with AsyncDatabaseHandler(path, profile='balanced', max_workers=2, max_pending=3) as db:
+            product_id = await db.add_product("Lit", "bed", 100.000)
+            renter_ids = await asyncio.gather(*(db.add_renter(f"Locataire {i}", f"2000{i:04d}")
+                                                for i in range(30)))
+            assert len(set(renter_ids)) == 30
+            await asyncio.gather(*(db.add_rental(product_id, renter_id, "monthly", 100.000,
+                                                 "2026-01-01", "2026-03-31")
+                                   for renter_id in renter_ids))
+            
+            # Slow calls queue in the event loop, never more than max_pending at a time
+            busiest = 0
+            
+            def slow_stats():
+                nonlocal busiest
+                busiest = max(busiest, db.pending)
+                return db.db.get_dashboard_stats()
+            
+            results = await asyncio.gather(*(db.run(slow_stats) for _ in range(20)))
+            assert busiest <= 3
+            assert all(stats['active_rentals'] == 30 for stats in results)
+            
+            reports = await db.get_reports()
+            assert reports['stats'] == db.db.get_dashboard_stats()
+            assert reports['tenant_totals'] == db.db.get_tenant_totals()
+            assert reports['total_unpaid'] == db.db.get_total_unpaid_amount()
+            renters = [renter async for renter in db.iter_renters(batch_size=7)]
+            assert [renter['id'] for renter in renters] == [renter['id'] for renter in db.db.get_all_renters()]
+            assert len(await db.get_unpaid_payments()) == 90
+            unpaid = [payment async for payment in db.iter_unpaid_payments(batch_size=8)]
+            assert unpaid == db.db.get_unpaid_payments()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(scenario(os.path.join(tmp, "async.db")))
+    print("✓ Async handler runs calls concurrently with backpressure")
+
+def test_virtual_schedules():
+    """Test that open-ended rentals compute their schedule on demand and store only paid periods"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseHandler(os.path.join(tmp, "virtual.db"))
+        bed = db.add_product("Lit", "bed", 100.000)
+        renter = db.add_renter("Locataire", "20000000")
+        bounded = db.add_rental(bed, renter, "monthly", 100.000, "2026-01-15", "2026-06-14")
+        open_ids = [db.add_rental(bed, renter, billing_type, 80.000, start)
+                    for billing_type, start in (("monthly", "2025-01-31"), ("monthly", "2025-03-29"),
+                                                ("yearly", "2024-02-29"), ("yearly", "2025-12-31"))]
+        stored = db.connection.execute("SELECT rental_id, COUNT(*) FROM payments GROUP BY rental_id").fetchall()
+        assert [tuple(row) for row in stored] == [(bounded, 5)]
+        
+        open_id = open_ids[0]
+        payments = db.get_payments_by_rental(open_id)
+        horizon = db._effective_end_date()
+        assert payments[0]['payment_date'] == "2025-01-31"
+        assert payments[1]['payment_date'] == "2025-02-28"
+        assert payments[2]['payment_date'] == "2025-03-31"
+        assert payments[-1]['payment_month'] <= horizon.strftime("%Y-%m")
+        assert all(p['id'] is None and p['status'] == 'unpaid' for p in payments)
+        
+        paid_id = db.mark_period_paid(open_id, "2025-03", "Espèces")
+        noted_id = db.mark_period_paid(open_id, "2025-04")
+        payments = db.get_payments_by_rental(open_id)
+        assert [p['id'] for p in payments if p['id']] == [paid_id, noted_id]
+        assert payments[2]['status'] == 'paid' and payments[2]['notes'] == "Espèces"
+        paid, expected = db.get_income_by_rental(open_id)
+        assert (paid, expected) == (160.000, 80.000 * len(payments))
+        try:
+            db.mark_period_paid(open_id, "2024-12")
+            assert False, "period outside the schedule accepted"
+        except ValueError:
+            pass
+        
+        # Unpaid again: the period without notes goes back to the virtual schedule
+        db.mark_payment_unpaid(noted_id)
+        db.mark_payment_unpaid(paid_id)
+        rows = db.connection.execute("SELECT id, status FROM payments WHERE rental_id = ?", (open_id,)).fetchall()
+        assert [tuple(row) for row in rows] == [(paid_id, 'unpaid')]
+        
+        # Listing, pages and dashboard count agree with the schedules
+        unpaid = db.get_unpaid_payments()
+        expected_unpaid = sum(1 for rental_id in [bounded] + open_ids
+                              for p in db.get_payments_by_rental(rental_id) if p['status'] == 'unpaid')
+        assert len(unpaid) == expected_unpaid
+        scheduled = sorted((p['payment_month'], p['rental_id'], p['payment_date']) for rental_id in open_ids
+                           for p in db.get_payments_by_rental(rental_id) if p['status'] == 'unpaid')
+        assert [(p['payment_month'], p['rental_id'], p['payment_date'])
+                for p in unpaid if p['rental_id'] != bounded] == scheduled
+        assert db.get_dashboard_stats()['unpaid_count'] == expected_unpaid
+        keys = [(p['payment_month'], p['rental_id']) for p in unpaid]
+        assert keys == sorted(keys)
+        assert list(db.iter_unpaid_payments(batch_size=4)) == unpaid
+        assert list(db.iter_payments_by_rental(open_id, batch_size=5)) == db.get_payments_by_rental(open_id)
+        assert db.verify_stats_counters() == {}
+        
+        # Stored rows outside the generated periods are still listed
+        db.connection.execute("""INSERT INTO payments (rental_id, payment_date, amount, payment_month, status)
+                                 VALUES (?, '2099-01-31', ?, '2099-01', 'paid')""",
+                              (open_id, Money.from_tnd(80)))
+        db.connection.commit()
+        payments = db.get_payments_by_rental(open_id)
+        assert payments[-1]['payment_month'] == "2099-01"
+        assert db.get_income_by_rental(open_id) == (80.000, 80.000 * len(payments))
+        
+        # Returning an open-ended rental freezes its schedule at the return date
+        returned_id = open_ids[1]
+        db.update_rental_status(returned_id, 'returned')
+        today = datetime.now().strftime("%Y-%m-%d")
+        assert db.get_rental_by_id(returned_id)['end_date'] == today
+        payments = db.get_payments_by_rental(returned_id)
+        assert payments and all(p['id'] for p in payments)
+        assert payments[-1]['payment_date'] <= today
+        assert db.get_payments_by_rental(returned_id) == payments
+        assert db.verify_stats_counters() == {}
+        
+        # The SQL period count matches the generated schedules for any start day
+        for day in range(1, 32, 3):
+            for month in (1, 2, 3, horizon.month):
+                for billing_type in ('monthly', 'yearly'):
+                    last_day = calendar.monthrange(2024, month)[1]
+                    db.add_rental(bed, renter, billing_type, 10.000, f"2024-{month:02d}-{min(day, last_day):02d}")
+        unpaid = db.get_unpaid_payments()
+        # The dashboard also counts the unpaid rows of returned rentals
+        returned_unpaid = sum(1 for p in db.get_payments_by_rental(returned_id) if p['status'] == 'unpaid')
+        assert db.get_dashboard_stats()['unpaid_count'] == len(unpaid) + returned_unpaid
+        
+        # The stored count follows deletes; once the horizon moves the dashboard counts
+        # without writing (even while another thread holds the writer) until the next write
+        import threading
+        db.delete_rental(open_ids[2])
+        assert db.verify_stats_counters() == {}
+        db.connection.execute("UPDATE virtual_schedule_state SET horizon_date = '2000-01-01', unpaid_count = 0")
+        db.connection.commit()
+        unpaid = db.get_unpaid_payments()
+        counts = []
+        with db.pool.write_lock:
+            reader = threading.Thread(target=lambda: counts.append(db.get_dashboard_stats()['unpaid_count']))
+            reader.start()
+            reader.join(timeout=10)
+        assert counts == [len(unpaid) + returned_unpaid]
+        state = "SELECT horizon_date FROM virtual_schedule_state"
+        assert db.connection.execute(state).fetchone()[0] == '2000-01-01'
+        db.add_renter("Locataire du jour")
+        assert db.connection.execute(state).fetchone()[0] == horizon.strftime("%Y-%m-%d")
+        assert db.get_dashboard_stats()['unpaid_count'] == len(unpaid) + returned_unpaid
+        assert list(db.iter_unpaid_payments(batch_size=7)) == unpaid
+        assert sorted((p['rental_id'], p['payment_date']) for p in unpaid) == sorted(
+            (p['rental_id'], p['payment_date']) for rental in db.get_active_rentals()
+            for p in db.get_payments_by_rental(rental['id']) if p['status'] == 'unpaid')
+        db.close()
+    print("✓ Open-ended rentals use virtual payment schedules")
+
+def test_transactions():
+    """Test units of work: one commit, atomic rollback and nested savepoints"""
+    import threading
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseHandler(os.path.join(tmp, "transactions.db"), profile='balanced')
+        bed = db.add_product("Lit", "bed", 100.000)
+        db.get_renter_index()
+        statements = []
+        db.set_trace_callback(statements.append)
+        
+        # The three writes of the rental dialog commit once
+        with db.transaction():
+            renter_id = db.add_renter("Nouveau Locataire", "20111222")
+            assert db.get_renter_by_id(renter_id)['full_name'] == "Nouveau Locataire"
+            seen = []
+            reader = threading.Thread(target=lambda: seen.append(db.get_renter_by_id(renter_id)))
+            reader.start()
+            reader.join()
+            assert seen == [None]  # other threads only see committed data
+            rental_id = db.add_rental(bed, renter_id, "monthly", 100.000, "2026-01-01", "2026-03-31")
+            db.update_rental_payment_status(rental_id, 'paid')
+        db.set_trace_callback(None)
+        assert statements.count("COMMIT") == 1
+        assert db.get_renter_index().search("nouveau") == [renter_id]
+        assert db.get_rental_by_id(rental_id)['payment_status'] == 'paid'
+        
+        # Nothing is kept when the unit of work fails
+        try:
+            with db.transaction():
+                failed_renter = db.add_renter("Locataire Annulé", "20333444")
+                db.add_rental(bed, failed_renter, "monthly", 100.000, "2026-01-01", "2026-03-31")
+                raise RuntimeError("annulation")
+        except RuntimeError:
+            pass
+        assert db.get_renter_by_id(failed_renter) is None
+        assert db.get_renter_index().search("annule") == []
+        assert len(db.get_all_rentals()) == 1
+        
+        # A failing write or inner block is undone alone
+        with db.transaction():
+            try:
+                db.add_rental(bed, renter_id, "monthly", 100.000, "2026-05-01", "2026-01-01")
+                assert False, "end date before start date accepted"
+            except ValueError:
+                pass
+            try:
+                with db.transaction():
+                    db.add_product("Lit annulé", "bed", 10.000)
+                    raise RuntimeError("annulation")
+            except RuntimeError:
+                pass
+            db.add_product("Matelas", "equipment", 20.000)
+        assert len(db.get_all_rentals()) == 1
+        assert [p['name'] for p in db.get_all_products()] == ["Lit", "Matelas"]
+        assert db.verify_stats_counters() == {}
+        db.close()
+    print("✓ Transactions commit once and roll back atomically")
+
+def test_archive():
+    """Test moving closed history to the archive database"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseHandler(os.path.join(tmp, "hot.db"))
+        assert db.archive_path == os.path.join(tmp, "rental_archive.db")
+        product_id = db.add_product("Lit", "bed", 100.000)
+        renter_id = db.add_renter("Ahmed Ben Ali")
+        rentals = {}
+        for name, start, end, returned, paid in [
+            ('closed', "2020-01-01", "2020-12-31", True, True),
+            ('recent', "2026-01-01", datetime.now().strftime("%Y-%m-%d"), True, True),
+            ('owing', "2020-01-01", "2020-06-30", True, False),
+            ('active', "2020-01-01", "2030-12-31", False, False),
+        ]:
+            rental_id = rentals[name] = db.add_rental(product_id, renter_id, "monthly", 100.000, start, end)
+            if paid:
+                for payment in db.get_payments_by_rental(rental_id):
+                    db.mark_payment_paid(payment['id'])
+            if returned:
+                db.update_rental_status(rental_id, 'returned')
+        income, history = db.get_total_income(), db.get_income_history()
+        stats = db.get_dashboard_stats()
+        
+        assert db.archive_closed_rentals(older_than_days=365, batch_size=1) == {'rentals': 1, 'payments': 12}
+        assert db.archive_closed_rentals() == {'rentals': 0, 'payments': 0}
+        assert db.get_rental_by_id(rentals['closed']) is None
+        assert {r['id'] for r in db.get_all_rentals()} == {rentals['recent'], rentals['owing'], rentals['active']}
+        assert db.get_total_income() == income and db.get_income_history() == history
+        assert db.get_dashboard_stats() == stats
+        assert db.verify_stats_counters() == {}
+        
+        # Rows copied to the archive but not yet deleted are listed once
+        db.connection.execute("ATTACH DATABASE ? AS archive", (db.archive_path,))
+        db.connection.execute("""INSERT INTO archive.rentals (id, product_id, renter_id, billing_type, rental_price,
+                                     start_date, end_date, status, payment_status, acompte, escompte)
+                                 SELECT id, product_id, renter_id, billing_type, rental_price, start_date,
+                                        end_date, status, payment_status, acompte, escompte
+                                 FROM rentals WHERE id = ?""", (rentals['owing'],))
+        db.connection.commit()
+        db.connection.execute("DETACH DATABASE archive")
+        history = db.get_rental_history(renter_id)
+        assert sorted((r['id'], r['archived']) for r in history) == [
+            (rentals['closed'], 1), (rentals['recent'], 0), (rentals['owing'], 0), (rentals['active'], 0)]
+        assert history[-1]['renter_name'] == "Ahmed Ben Ali"
+
+        # Backups carry the archive and restore it next to the database
+        from backup_manager import BackupManager, archive_backup_path
+        backup_dir = os.path.join(tmp, "backups")
+        backup_path = db.save_all(backup_dir)
+        manifest_path = db.save_all(backup_dir, incremental=True)
+        income_history = db.get_income_history()
+        db.close()
+        assert os.path.exists(archive_backup_path(backup_path))
+        manager = BackupManager(os.path.join(tmp, "hot.db"), backup_dir, archive_name=os.path.join(tmp, "rental_archive.db"))
+        for restore, path in ((manager.restore_backup, backup_path), (manager.restore_incremental_backup, manifest_path)):
+            restored_dir = os.path.join(tmp, restore.__name__)
+            os.mkdir(restored_dir)
+            restored = DatabaseHandler(restore(path, os.path.join(restored_dir, "hot.db")))
+            assert os.path.exists(os.path.join(restored_dir, "rental_archive.db"))
+            assert restored.get_rental_history(renter_id) == history
+            assert restored.get_income_history() == income_history
+            restored.close()
+
+        # Restoring a snapshot taken before any archiving removes the newer archive
+        os.remove(archive_backup_path(backup_path))
+        manager.restore_backup(backup_path)
+        assert not os.path.exists(manager.archive_name)
+    print("✓ Closed history archived")
+
+def test_instrumentation():
+    """Test per-method counters, latency histograms and the slow-query log"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseHandler(os.path.join(tmp, "instrumented.db"))
+        assert db.get_diagnostics() is None
+        log_path = os.path.join(tmp, "slow.log")
+        db.enable_instrumentation(slow_query_ms=0, slow_log_path=log_path)
+        statements = []
+        db.set_trace_callback(statements.append)
+        
+        bed = db.add_product("Lit", "bed", 100.000)
+        renter_id = db.add_renter("Ahmed Ben Ali", "20111222")
+        db.add_rental(bed, renter_id, "monthly", 100.000, "2026-01-01", "2026-03-31")
+        db.add_rental(bed, renter_id, "monthly", 100.000, "2026-01-01", "2026-06-30")
+        try:
+            db.add_rental(bed, renter_id, "monthly", 100.000, "2026-05-01", "2026-01-01")
+        except ValueError:
+            pass
+        for _ in range(3):
+            db.get_all_rentals()
+        db.get_rentals_page(limit=1)
+        db.set_trace_callback(None)
+        
+        diagnostics = db.get_diagnostics()
+        methods = diagnostics['methods']
+        assert methods['add_rental']['calls'] == 3 and methods['add_rental']['errors'] == 1
+        assert methods['get_all_rentals']['calls'] == 3 and methods['get_all_rentals']['rows'] == 6
+        assert methods['get_rentals_page']['rows'] == 1
+        assert sum(count for _, count in methods['get_all_rentals']['buckets']) == 3
+        assert methods['get_all_rentals']['statements'] == 3
+        assert 'get_dashboard_stats' not in methods
+        assert diagnostics['slow_statements'] == diagnostics['statements'] > 0
+        assert any("FROM rentals r" in s for s in statements)  # both callbacks traced
+        with open(log_path, encoding="utf-8") as f:
+            assert "get_all_rentals: SELECT r.id" in f.read()
+        
+        json_path = os.path.join(tmp, "diagnostics.json")
+        db.dump_diagnostics(json_path)
+        with open(json_path, encoding="utf-8") as f:
+            assert json.load(f)['methods']['add_product']['calls'] == 1
+        db.instrumentation.reset()
+        assert db.get_diagnostics()['methods'] == {}
+        db.disable_instrumentation()
+        assert 'get_all_rentals' not in vars(db) and db.get_diagnostics() is None
+        db.close()
+    print("✓ Instrumentation counts calls and logs slow statements")
+
+def test_benchmark_suite():
+    """Test that the benchmark suite times every public method and flags regressions"""
+    import copy
+    from benchmark_suite import run_suite, compare_results, uncovered_methods
+    assert uncovered_methods() == []
+    results = run_suite(scale="50", repeat=1)
+    assert results['counts']['renters'] == 50 and results['counts']['payments'] > 0
+    assert results['results']['get_all_rentals']['rows'] == 100
+    assert results['results']['archive_closed_rentals']['runs'] == 1
+    json.dumps(results)
+    assert all(entry['status'] == 'ok' for entry in compare_results(results, results))
+    
+    slower = copy.deepcopy(results)
+    slower['results']['get_tenant_totals']['median_ms'] += 50
+    results['results']['get_dashboard_stats']['median_ms'] = 0.2
+    slower['results']['get_dashboard_stats']['median_ms'] = 0.6  # under the noise floor
+    flagged = [entry['method'] for entry in compare_results(results, slower) if entry['status'] == 'regression']
+    assert flagged == ['get_tenant_totals']
+    print("✓ Benchmark suite covers every public method")
+
+def test_csv_import():
+    """Test the streaming CSV import: renter dedup, idempotent re-import and the error report"""
+    from csv_import import import_csv
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseHandler(os.path.join(tmp, "import.db"))
+        db.add_product("Lit Médical", "bed", 150.000)
+        existing_id = db.add_renter("Ahmed Ben Ali", "+216 22 333 444")
+        path = os.path.join(tmp, "locations.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("full_name;phone;id_number;product_name;billing_type;rental_price;start_date;end_date;status\n"
+                    "Ahmed B.;22-333-444;;Lit Médical;mensuel;150,000;01/01/2024;31/12/2024;retourné\n"
+                    "Sami Trabelsi;;07001234;Fauteuil;annuel;300;2024-03-01;;\n"
+                    "Sami T.;98 765 432;07001234;Lit Médical;monthly;150;2024-03-01;;\n"
+                    ";;;Lit Médical;mensuel;150;01/01/2024;;\n"
+                    "Mounir;;;Lit Médical;weekly;150;01/01/2024;;\n"
+                    "Mounir;;;Lit Médical;mensuel;150;31/12/2024;01/01/2024;\n")
+        progress = []
+        summary = import_csv(db, path, 'rentals', chunk_size=2, progress=lambda done, total: progress.append(done))
+        assert (summary['rows'], summary['created'], summary['errors']) == (6, 3, 3)
+        assert progress[-1] == os.path.getsize(path)
+        with open(summary['error_report'], encoding="utf-8-sig") as f:
+            report = f.read().splitlines()
+        assert report[0].startswith("line,error,full_name") and [line.split(",")[0] for line in report[1:]] == ['5', '6', '7']
+        
+        # Matched by phone and by ID number, the later values winning
+        renters = {r['full_name']: r for r in db.get_all_renters()}
+        assert set(renters) == {"Ahmed B.", "Sami T."} and renters["Ahmed B."]['id'] == existing_id
+        assert renters["Sami T."]['phone'] == "98 765 432"
+        fauteuil = next(p for p in db.get_all_products() if p['name'] == "Fauteuil")
+        assert fauteuil['type'] == 'bed' and fauteuil['rental_price'] == Money.from_tnd(300)
+        returned = next(r for r in db.get_all_rentals() if r['renter_id'] == existing_id)
+        assert returned['status'] == 'returned' and len(db.get_payments_by_rental(returned['id'])) == 12
+        assert db.search("Fauteuil")
+        
+        again = import_csv(db, path, 'rentals')
+        assert (again['created'], again['updated'], again['unchanged'], again['errors']) == (0, 0, 3, 3)
+        assert len(db.get_all_rentals()) == 3
+        assert db.verify_stats_counters() == {}
+        db.close()
+    print("✓ CSV import deduplicates renters and reports rejected rows")
+
+def test_data_export():
+    """Test the streaming export: amounts match the screen, virtual periods included, cancel removes the file"""
+    import csv
+    from data_export import HAS_OPENPYXL, export_data
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseHandler(os.path.join(tmp, "export.db"))
+        product_id = db.add_product("Lit Médical", "bed", 150.000)
+        renters = [db.add_renter(f"Locataire {i}", f"2000000{i}") for i in range(5)]
+        for i, renter_id in enumerate(renters):
+            rental_id = db.add_rental(product_id, renter_id, "monthly", 100.500 + i, "2024-01-01",
+                                      "2024-06-30" if i % 2 else None, acompte=10)
+            if i % 2:
+                db.mark_payment_paid(db.get_payments_by_rental(rental_id)[0]['id'])
+        
+        def read(path):
+            with open(path, encoding="utf-8-sig", newline="") as f:
+                return list(csv.reader(f, delimiter=';'))
+        
+        path = os.path.join(tmp, "locations.csv")
+        progress = []
+        summary = export_data(db, path, 'rentals', batch_size=2,
+                              progress=lambda done, total: progress.append((done, total)))
+        assert summary['rows'] == 5 and progress[-1] == (5, 5) and len(progress) == 3
+        rows = read(path)
+        header = rows[0]
+        assert header[:3] == ["ID", "Produit", "Locataire"] and rows[1][6] == "01/01/2024"
+        expected = {str(r['id']): r for r in db.get_rentals_with_financials()}
+        for row in rows[1:]:
+            rental = expected[row[0]]
+            for column, key in (("Reste", 'reste'), ("Montant Reçu", 'total_received'), ("Montant Dû", 'still_owed')):
+                assert row[header.index(column)] == f"{rental[key]:.3f}".replace(".", ",")
+        
+        path = os.path.join(tmp, "locataires.csv")
+        export_data(db, path, 'tenants')
+        totals = {t['renter_name']: t for t in db.get_tenant_totals()}
+        rows = read(path)
+        assert len(rows) == 6
+        for row in rows[1:]:
+            assert row[-2] == f"{totals[row[0]]['total_owed']:.3f}".replace(".", ",")
+        
+        # Open-ended rentals run to the current month, their periods are not stored yet
+        path = os.path.join(tmp, "echeancier.csv")
+        export_data(db, path, 'payments')
+        schedules = list(db.iter_payment_schedules())
+        assert any(p['id'] is None for p in schedules)
+        assert len(read(path)) == len(schedules) + 1
+        assert [p['rental_id'] for p in schedules] == sorted(p['rental_id'] for p in schedules)
+        
+        cancelled = export_data(db, path, 'payments', batch_size=2, progress=lambda done, total: False)
+        assert cancelled['cancelled'] and not os.path.exists(path)
+        
+        path = os.path.join(tmp, "locations.xlsx")
+        if HAS_OPENPYXL:
+            from openpyxl import load_workbook
+            export_data(db, path, 'rentals')
+            assert load_workbook(path).active.max_row == 6
+        else:
+            try:
+                export_data(db, path, 'rentals')
+                assert False, "XLSX export without openpyxl"
+            except RuntimeError:
+                pass
+            assert not os.path.exists(path)
+        db.close()
+    print("✓ Export streams rentals, tenant totals and schedules with the on-screen amounts")
+
 if __name__ == "__main__":
     try:
         test_database()
+        test_tenant_totals()
+        test_money_amounts()
+        test_financial_engine_matches_scalar()
+        test_add_rentals_bulk()
+        test_storage_profiles()
+        test_backups()
+        test_incremental_backups()
+        test_entity_cache()
+        test_stats_counters()
+        test_global_search()
+        test_picker_index()
+        test_keyset_pagination()
+        test_iso_dates()
+        test_query_plans()
+        test_schema_migrations()
+        test_concurrent_access()
+        test_async_handler()
+        test_virtual_schedules()
+        test_transactions()
+        test_archive()
+        test_instrumentation()
+        test_benchmark_suite()
+        test_csv_import()
+        test_data_export()
     except Exception as e:
         print(f"\n❌ ERROR: {e}")
         import traceback